@@ -0,0 +1,114 @@
+"""Lookup benchmark for the question bank at hundreds of thousands of documents.
+
+Fills a bank in a temp directory with ``--documents`` stored documents
+(random fingerprints and paragraph hashes, written straight to SQLite so
+filling is quick) plus ``--real`` synthetic lecture documents, then
+measures:
+- opening the bank (loading the saved index, indexing the newest rows)
+- fingerprinting a document
+- index lookups for edited copies of the real documents and for new
+  documents, with how many of the edited copies were found
+
+Usage: python bench_bank.py [--documents 300000] [--real 200] [--queries 2000] [--seed 1]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+
+from bench_fallback import synthetic_document
+from bench_generation import percentile
+from question_bank import QuestionBank, _to_signed, paragraph_hashes, simhash
+
+
+def fill(path, documents, rng):
+    """Write ``documents`` rows of random fingerprints and paragraph hashes."""
+    bank = QuestionBank(path)
+    rows = ((_to_signed(rng.getrandbits(64)),
+             array('I', sorted(rng.getrandbits(32) for _ in range(rng.randint(4, 16)))).tobytes(), 0.0)
+            for _ in range(documents))
+    bank._conn.execute("BEGIN")
+    bank._conn.executemany("INSERT INTO bank_documents (fingerprint, paragraphs, created_at) VALUES (?, ?, ?)", rows)
+    bank._conn.execute("COMMIT")
+    bank.close()
+
+
+def edited(document, rng):
+    """A lightly edited copy: one changed word and, half the time, an added paragraph."""
+    words = document.split(' ')
+    words[rng.randrange(len(words))] = "revised"
+    copy = ' '.join(words)
+    if rng.random() < 0.5:
+        copy += "\n\n" + synthetic_document(400, seed=rng.randrange(1 << 30))
+    return copy
+
+
+def summary_us(samples):
+    samples = sorted(samples)
+    return {"p50": round(percentile(samples, 50) * 1e6, 1), "p99": round(percentile(samples, 99) * 1e6, 1),
+            "max": round(samples[-1] * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=300000)
+    parser.add_argument('--real', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'question_bank.sqlite3')
+        start = time.perf_counter()
+        fill(path, args.documents, rng)
+        # The first open indexes every row and saves the sorted tables
+        QuestionBank(path).close()
+        build_seconds = time.perf_counter() - start
+
+        real = [synthetic_document(3500, seed=args.seed + i) for i in range(args.real)]
+        bank = QuestionBank(path)
+        for document in real:
+            bank.add(document, [{"question": "Placeholder?", "options": ["a", "b", "c", "d"], "answer": "A"}])
+        bank.close()
+
+        start = time.perf_counter()
+        bank = QuestionBank(path)
+        open_seconds = time.perf_counter() - start
+
+        copies = [edited(rng.choice(real), rng) for _ in range(args.queries // 2)]
+        novel = [synthetic_document(3500, seed=rng.randrange(1 << 30)) for _ in range(args.queries // 2)]
+        fingerprint_times, lookup_times = [], []
+        found = 0
+        for i, document in enumerate(copies + novel):
+            start = time.perf_counter()
+            fingerprint = simhash(document)
+            hashes = paragraph_hashes(document)
+            fingerprint_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            matches = bank.index.find(fingerprint, hashes, bank.max_distance)
+            lookup_times.append(time.perf_counter() - start)
+            if i < len(copies) and matches:
+                found += 1
+        false_matches = sum(1 for document in novel[:100] if bank.find(document) is not None)
+
+        report = {
+            "documents": args.documents + args.real,
+            "index_bytes": os.path.getsize(bank.index_path),
+            "build_seconds": round(build_seconds, 2),
+            "open_ms": round(open_seconds * 1000, 1),
+            "fingerprint_us": summary_us(fingerprint_times),
+            "lookup_us": summary_us(lookup_times),
+            "edited_copies_found": round(found / len(copies), 4),
+            "novel_documents_matched": false_matches,
+        }
+        bank.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
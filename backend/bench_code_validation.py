@@ -0,0 +1,130 @@
+"""Benchmark for checking code questions' test cases in the sandbox.
+
+Validates copies of a quiz whose code questions (python and c, plus java
+when a JDK is installed) have reference solutions and test cases with
+known problems: wrong expected outputs (repaired), inputs the solution
+rejects (dropped), a solution that answers a different problem (question
+dropped) and one that does not compile (left unchecked). Reports the wall
+time per quiz with the default pool and with a single worker, and checks
+every verdict.
+
+Usage: python bench_code_validation.py [--quizzes 10] [--workers 0] [--runaway]
+
+``--runaway`` adds a case the solution loops forever on, which costs the
+CPU limit (``QUIZ_SANDBOX_CPU_SECONDS``) before it is dropped.
+"""
+import argparse
+import contextlib
+import copy
+import json
+import os
+import sys
+import time
+
+from bench_generation import percentile
+from code_sandbox import Sandbox, SandboxLimits
+from code_validation import validate_code_questions
+
+PY_SUM = "n = int(input())\nprint(sum(int(x) for x in input().split()[:n]))\n"
+PY_FACTORIAL = "import math\nn = int(input())\nif n < 0:\n    raise ValueError(n)\nprint(math.factorial(n))\n"
+PY_REVERSE = "print(input()[::-1])\n"
+C_SQUARE = '#include <stdio.h>\nint main(void) {\n    long n;\n    if (scanf("%ld", &n) != 1) return 1;\n' \
+           '    printf("%ld\\n", n * n);\n    return 0;\n}\n'
+C_FIB = '#include <stdio.h>\nint main(void) {\n    int n; long a = 0, b = 1;\n    scanf("%d", &n);\n' \
+        '    for (int i = 0; i < n; i++) { long t = a + b; a = b; b = t; }\n    printf("%ld\\n", a);\n' \
+        '    return 0;\n}\n'
+C_BROKEN = '#include <stdio.h>\nint main(void) {\n    printf("%d\\n", 1)\n}\n'
+JAVA_MAX = ('import java.util.*;\npublic class Main {\n    public static void main(String[] args) {\n'
+            '        Scanner sc = new Scanner(System.in);\n        int n = sc.nextInt(), best = Integer.MIN_VALUE;\n'
+            '        for (int i = 0; i < n; i++) best = Math.max(best, sc.nextInt());\n'
+            '        System.out.println(best);\n    }\n}\n')
+PY_LOOP = "n = int(input())\nwhile n:\n    pass\nprint(0)\n"
+
+
+def code_question(language, solution, cases):
+    return {"question": f"Write a {language} program for the task described.", "type": "code",
+            "language": language, "starterCode": "", "solution": solution,
+            "testCases": [{"stdin": stdin, "stdout": stdout} for stdin, stdout in cases]}
+
+
+def quiz(java, runaway):
+    """``(questions, expected)``: a quiz and, per question, the test case
+    outputs that should survive (None: question dropped, 'unchecked')."""
+    items = [
+        (code_question('python', PY_SUM, [("3\n1 2 3\n", "6\n"), ("2\n5 5\n", "10\n"), ("1\n7\n", "7\n")]),
+         ["6", "10", "7"]),
+        (code_question('python', PY_FACTORIAL, [("5\n", "120\n"), ("6\n", "700\n"), ("-1\n", "0\n")]),
+         ["120", "720"]),
+        (code_question('python', PY_REVERSE, [("abc\n", "abc\n"), ("hello\n", "hello\n")]), None),
+        (code_question('c', C_SQUARE, [("4\n", "16\n"), ("12\n", "144\n"), ("x\n", "0\n")]), ["16", "144"]),
+        (code_question('c', C_FIB, [("10\n", "55\n"), ("20\n", "6764\n"), ("1\n", "1\n")]), ["55", "6765", "1"]),
+        (code_question('c', C_BROKEN, [("\n", "1\n")]), 'unchecked'),
+    ]
+    if java:
+        items.append((code_question('java', JAVA_MAX, [("3\n1 9 4\n", "9\n"), ("2\n-3 -8\n", "-8\n")]),
+                      ["9", "-3"]))
+    if runaway:
+        items.append((code_question('python', PY_LOOP, [("0\n", "0\n"), ("1\n", "0\n")]), ["0"]))
+    items.append(({"question": "Which statement about stacks is correct?", "type": "mcq",
+                   "options": ["LIFO", "FIFO", "Random", "Sorted"], "answer": "A"}, 'mcq'))
+    return [question for question, _ in items], [expected for _, expected in items]
+
+
+def check(questions, originals, expected):
+    """Number of questions whose verdict differs from ``expected``."""
+    survivors = {id(question) for question in questions}
+    errors = 0
+    for original, want in zip(originals, expected):
+        if 'solution' in original:
+            errors += 1
+        if want is None:
+            errors += id(original) in survivors
+        elif want not in ('unchecked', 'mcq'):
+            outputs = [case['stdout'].strip() for case in original['testCases']]
+            errors += id(original) not in survivors or outputs != want
+    return errors
+
+
+def run(sandbox, args, java):
+    times = []
+    errors = 0
+    for _ in range(args.quizzes):
+        questions, expected = quiz(java, args.runaway)
+        originals = list(questions)
+        start = time.perf_counter()
+        kept = validate_code_questions(copy.copy(questions), sandbox=sandbox)
+        times.append(time.perf_counter() - start)
+        errors += check(kept, originals, expected)
+    times.sort()
+    return {"workers": sandbox.workers,
+            "quiz_ms": {"p50": round(percentile(times, 50) * 1000, 1),
+                        "max": round(times[-1] * 1000, 1)},
+            "wrong_verdicts": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quizzes', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=0, help="Pool size (default: CPU count, at least 2)")
+    parser.add_argument('--runaway', action='store_true')
+    args = parser.parse_args()
+
+    limits = SandboxLimits.from_env()
+    pooled = Sandbox(limits, workers=args.workers or None)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        java = pooled.available('java')
+        questions, _ = quiz(java, args.runaway)
+        report = {
+            "code_questions": sum(1 for q in questions if q['type'] == 'code'),
+            "test_cases": sum(len(q.get('testCases', ())) for q in questions),
+            "java_available": java,
+            "cpu_count": os.cpu_count(),
+            "pooled": run(pooled, args, java),
+            "serial": run(Sandbox(limits, workers=1), args, java),
+        }
+    print(json.dumps(report, indent=2))
+    return 1 if report["pooled"]["wrong_verdicts"] or report["serial"]["wrong_verdicts"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Scaling benchmark for generate_fallback_quiz from 10 KB to 10 MB of text.
+
+Usage: python bench_fallback.py [--sizes 10000,100000,1000000,10000000] [--seed 1]
+                                [--ranking bm25|frequency]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+from quiz_generator import generate_fallback_quiz
+
+VOCABULARY = ("the a of and to in is that for it as with was on by data memory process "
+              "value list function stack queue tree graph network packet index query").split()
+TERMS = ["Python", "Linux", "Kernel", "Scheduler", "Paging", "Mutex", "Semaphore", "Socket",
+         "Router", "Compiler", "Parser", "Database", "Transaction", "Replication", "Cache"]
+
+
+def synthetic_document(size, seed=1):
+    """Lecture-like prose of roughly ``size`` characters."""
+    rng = random.Random(seed)
+    sentences = []
+    total = 0
+    while total < size:
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 30))]
+        if rng.random() < 0.5:
+            words.insert(rng.randrange(len(words)), rng.choice(TERMS))
+        sentence = " ".join(words).capitalize() + rng.choice([". ", ". ", "? ", ".\n\n"])
+        sentences.append(sentence)
+        total += len(sentence)
+    return "".join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default="10000,100000,1000000,10000000")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ranking', choices=['bm25', 'frequency'], default='bm25')
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        text = synthetic_document(size, seed=args.seed)
+        random.seed(args.seed)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            start = time.perf_counter()
+            quiz = json.loads(generate_fallback_quiz(text, ranking=args.ranking))
+            elapsed = time.perf_counter() - start
+        results.append({
+            "bytes": len(text),
+            "questions": len(quiz),
+            "seconds": round(elapsed, 4),
+            "mb_per_second": round(len(text) / elapsed / 1e6, 2),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
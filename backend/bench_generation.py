@@ -0,0 +1,344 @@
+"""Offline benchmark for quiz generation against a local Mistral stand-in.
+
+Starts an HTTP server that imitates the chat-completions endpoint (with
+configurable latency, slow outliers, error rate, 429 bursts and garbled
+replies), points the generator at it and drives jobs at a given
+concurrency. Results are printed as JSON: latency percentiles, throughput,
+fallback rate and CPU time per job. No network access is needed.
+
+With ``--hedge`` a second stand-in serves as the alternate provider and
+the report includes how often hedges fired and won.
+
+Usage: python bench_generation.py [--jobs 50] [--concurrency 8] [--doc-sizes 2000,4000]
+                                  [--latency-ms 200] [--slow 0.05,3000] [--error-rate 0.05]
+                                  [--burst-429 20,3] [--garble-rate 0.05] [--reject-rate 0.3]
+                                  [--hedge] [--hedge-latency-ms 300] [--output results.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Marker in every stand-in question stem; a quiz without it came from the fallback
+STANDIN_MARKER = "(stand-in)"
+TOPIC_WORDS = ("paging scheduler mutex semaphore socket router compiler parser database transaction "
+               "replication cache kernel thread process heap stack queue graph tree index hashing "
+               "sorting recursion pointer register pipeline interrupt deadlock latency bandwidth").split()
+REQUESTED_COUNT_RE = re.compile(r"Generate exactly (\d+) questions")
+
+
+def canned_questions(count, rng, reject_rate=0.0):
+    """``count`` distinct MCQs; ``reject_rate`` of them have placeholder
+    options that sanitization drops."""
+    questions = []
+    for i in range(count):
+        topic = " ".join(rng.sample(TOPIC_WORDS, 3))
+        if rng.random() < reject_rate:
+            options = [f"Option {j + 1}" for j in range(4)]
+        else:
+            options = [f"{topic} fact {j}" for j in range(4)]
+        questions.append({
+            "question": f"Which statement about {topic} is correct {STANDIN_MARKER}?",
+            "options": options,
+            "answer": "ABCD"[i % 4],
+            "type": "mcq",
+        })
+    return questions
+
+
+class StandInConfig:
+    def __init__(self, latency_ms=200.0, jitter_ms=50.0, error_rate=0.0, burst_every=0,
+                 burst_length=0, retry_after=0.2, garble_rate=0.0, reject_rate=0.0, questions=None, seed=1,
+                 slow_rate=0.0, slow_ms=3000.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Occasional very slow replies, the tail that hedging targets
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.garble_rate = garble_rate
+        self.reject_rate = reject_rate
+        # None answers with as many questions as the prompt asks for
+        self.questions = questions
+        self.seed = seed
+
+
+class StandInServer:
+    """Local chat-completions stand-in running on a background thread.
+
+    Every ``burst_every`` requests, the next ``burst_length`` requests get
+    429 with Retry-After. ``error_rate`` of requests get a 500 or 503, and
+    ``slow_rate`` of replies take ``slow_ms`` instead of the usual latency.
+    ``garble_rate`` of successful replies are prose-wrapped, truncated or
+    not JSON at all, and ``reject_rate`` of the questions in a reply are
+    placeholders that sanitization drops. Requests with ``"stream": true`` are answered as
+    server-sent events.
+    """
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or StandInConfig()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "garbled": 0, "slow": 0,
+                      "completion_tokens": 0}
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _decide(self):
+        """Pick the outcome of the next request: status code and garbling."""
+        config = self.config
+        with self._lock:
+            self.stats["requests"] += 1
+            n = self.stats["requests"]
+            if config.burst_every and config.burst_length:
+                position = (n - 1) % config.burst_every
+                if position >= config.burst_every - config.burst_length:
+                    self.stats["rate_limited"] += 1
+                    return 429, None
+            if self._rng.random() < config.error_rate:
+                self.stats["errors"] += 1
+                return self._rng.choice([500, 503]), None
+            latency = max(0.0, self._rng.gauss(config.latency_ms, config.jitter_ms)) / 1000
+            if self._rng.random() < config.slow_rate:
+                self.stats["slow"] += 1
+                latency = config.slow_ms / 1000
+            if self._rng.random() < config.garble_rate:
+                self.stats["garbled"] += 1
+                return 200, (latency, self._rng.choice(["prose", "truncated", "garbage"]))
+            self.stats["ok"] += 1
+            return 200, (latency, None)
+
+    def _content(self, count, garble):
+        with self._lock:
+            questions = canned_questions(count, self._rng, self.config.reject_rate)
+        content = json.dumps(questions)
+        if garble == "prose":
+            return f"Sure! Here is the quiz you asked for:\n```json\n{content}\n```\nGood luck."
+        if garble == "truncated":
+            return content[:int(len(content) * 0.8)]
+        if garble == "garbage":
+            return "I'm sorry, I cannot produce a quiz from this content."
+        return content
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=()):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                status, outcome = server._decide()
+                if status == 429:
+                    return self._send(429, '{"message": "Requests rate limit exceeded"}',
+                                      [('Retry-After', str(server.config.retry_after))])
+                if status != 200:
+                    return self._send(status, '{"message": "Service unavailable"}')
+                latency, garble = outcome
+                time.sleep(latency)
+                count = server.config.questions
+                if count is None:
+                    match = REQUESTED_COUNT_RE.search(json.dumps(payload.get('messages', [])))
+                    count = int(match.group(1)) if match else 10
+                content = server._content(count, garble)
+                usage = {"prompt_tokens": len(json.dumps(payload)) // 4,
+                         "completion_tokens": len(content) // 4}
+                with server._lock:
+                    server.stats["completion_tokens"] += usage["completion_tokens"]
+                if payload.get('stream'):
+                    return self._stream(content, usage)
+                body = {"choices": [{"message": {"role": "assistant", "content": content}}], "usage": usage}
+                self._send(200, json.dumps(body))
+
+            def _stream(self, content, usage):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for i in range(0, len(content), 32):
+                    event = {"choices": [{"delta": {"content": content[i:i + 32]}}]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                event = {"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(event)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+                self.close_connection = True
+
+        return Handler
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def run_scenario(run_job, jobs, concurrency, doc_size, seed):
+    """Drive ``jobs`` generation jobs and summarize their timings."""
+    # Imports quiz_generator, so only once the environment points at the stand-in
+    from bench_fallback import synthetic_document
+
+    documents = [synthetic_document(doc_size, seed=seed + i) for i in range(jobs)]
+    latencies = []
+    outcomes = {"ok": 0, "error": 0, "fallback": 0}
+    question_counts = []
+    lock = threading.Lock()
+
+    def one(index):
+        start = time.perf_counter()
+        result = run_job({"id": index, "text": documents[index], "no_cache": True})
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not result.get('ok'):
+                outcomes["error"] += 1
+            elif not any(STANDIN_MARKER in q.get('question', '') for q in result['questions']):
+                outcomes["fallback"] += 1
+            else:
+                outcomes["ok"] += 1
+                question_counts.append(len(result['questions']))
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(jobs)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    latencies.sort()
+    return {
+        "doc_size": doc_size,
+        "jobs": jobs,
+        "concurrency": concurrency,
+        "outcomes": outcomes,
+        "fallback_rate": round(outcomes["fallback"] / jobs, 4),
+        "error_rate": round(outcomes["error"] / jobs, 4),
+        "questions_per_quiz": round(sum(question_counts) / len(question_counts), 2) if question_counts else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1),
+        },
+        "throughput_jobs_per_s": round(jobs / wall, 2),
+        "cpu_ms_per_job": round(cpu / jobs * 1000, 2),
+        "wall_seconds": round(wall, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--doc-sizes', default="2000,4000", help="Comma-separated document sizes in characters")
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--jitter-ms', type=float, default=50)
+    parser.add_argument('--slow', default="0,3000", metavar="RATE,MS",
+                        help="Make a RATE fraction of replies take MS milliseconds")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--burst-429', default="0,0", metavar="EVERY,LENGTH",
+                        help="Return 429 for LENGTH requests out of every EVERY")
+    parser.add_argument('--garble-rate', type=float, default=0.0)
+    parser.add_argument('--reject-rate', type=float, default=0.0,
+                        help="Fraction of questions per reply that sanitization drops")
+    parser.add_argument('--hedge', action='store_true',
+                        help="Hedge slow requests to a second stand-in acting as the alternate provider")
+    parser.add_argument('--hedge-latency-ms', type=float, default=None,
+                        help="Latency of the alternate stand-in (default: --latency-ms)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    burst_every, burst_length = (int(v) for v in args.burst_429.split(','))
+    slow_rate, slow_ms = (float(v) for v in args.slow.split(','))
+    config = StandInConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                           burst_every=burst_every, burst_length=burst_length,
+                           garble_rate=args.garble_rate, reject_rate=args.reject_rate, seed=args.seed,
+                           slow_rate=slow_rate, slow_ms=slow_ms)
+    hedge_latency = args.hedge_latency_ms if args.hedge_latency_ms is not None else args.latency_ms
+    alternate_config = StandInConfig(latency_ms=hedge_latency, jitter_ms=args.jitter_ms,
+                                     reject_rate=args.reject_rate, seed=args.seed + 1)
+
+    with StandInServer(config) as server, StandInServer(alternate_config) as alternate:
+        # The generator reads its configuration when first used, so point it at
+        # the stand-in before importing it
+        os.environ['MISTRAL_API_URL'] = server.url
+        os.environ.setdefault('MISTRAL_API_KEY', 'benchmark')
+        os.environ['QUIZ_CACHE_DISABLED'] = 'true'
+        os.environ.setdefault('MISTRAL_RATE_LIMIT_RPS', '0')
+        # Hedged-away primary calls hold their connection until they return
+        os.environ.setdefault('MISTRAL_POOL_SIZE', str(args.concurrency * (2 if args.hedge else 1)))
+        if args.hedge:
+            os.environ['QUIZ_HEDGE'] = 'true'
+            os.environ['QUIZ_HEDGE_API_URL'] = alternate.url
+
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            from quiz_generator import run_job
+            scenarios = [run_scenario(run_job, args.jobs, args.concurrency, int(size), args.seed)
+                         for size in args.doc_sizes.split(',')]
+
+        report = {
+            "standin": vars(config),
+            "server": dict(server.stats),
+            "scenarios": scenarios,
+        }
+        if args.hedge:
+            from llm_providers import get_hedger
+            hedger = get_hedger()
+            report["alternate_server"] = dict(alternate.stats)
+            report["hedging"] = dict(hedger.stats, deadline_ms=round(hedger.deadline() * 1000, 1))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Grader benchmark: submissions graded per second per core under a burst.
+
+Queues ``--submissions`` submissions at once, as when an exam closes, and
+times how long the grader takes to work through them. The mix is mostly
+correct python and c programs, plus wrong answers, crashes and a program
+that does not compile (``--tle`` adds infinite loops, each costing the
+CPU limit per test). Every verdict is checked against the one expected.
+Runs with the default worker count and with one worker; set
+``QUIZ_SANDBOX_WARM=false`` to compare with a fresh interpreter per python run.
+
+Usage: python bench_grader.py [--submissions 200] [--tests 5] [--workers 0] [--tle 0] [--seed 1]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+from bench_generation import percentile
+from code_grader import (COMPILE_ERROR_VERDICT, PASS, RUNTIME_ERROR, TIME_LIMIT_EXCEEDED, WRONG_ANSWER,
+                         Grader)
+from code_sandbox import get_sandbox
+
+PY_SUM = "print(sum(int(x) for x in input().split()))\n"
+PY_SUM_OFF_BY_ONE = "print(sum(int(x) for x in input().split()) + 1)\n"
+PY_SUM_CRASH = "values = input().split()\nprint(int(values[0]) + int(values[5]))\n"
+PY_LOOP = "while True:\n    pass\n"
+C_SUM = ('#include <stdio.h>\nint main(void) {\n    long total = 0, x;\n'
+         '    while (scanf("%ld", &x) == 1) total += x;\n    printf("%ld\\n", total);\n    return 0;\n}\n')
+C_BROKEN = '#include <stdio.h>\nint main(void) {\n    long total = 0\n    printf("%ld\\n", total);\n}\n'
+
+# (share, language, code, expected verdict)
+MIX = [
+    (0.5, 'python', PY_SUM, PASS),
+    (0.2, 'c', C_SUM, PASS),
+    (0.15, 'python', PY_SUM_OFF_BY_ONE, WRONG_ANSWER),
+    (0.1, 'python', PY_SUM_CRASH, RUNTIME_ERROR),
+    (0.05, 'c', C_BROKEN, COMPILE_ERROR_VERDICT),
+]
+
+
+def submissions(count, tests, tle, seed=1):
+    """``(submissions, expected)``: the burst and each one's expected verdict."""
+    rng = random.Random(seed)
+    kinds = [(language, code, verdict) for _, language, code, verdict in MIX]
+    weights = [share for share, _, _, _ in MIX]
+    batch = []
+    expected = []
+    for i in range(count):
+        if i < tle:
+            language, code, verdict = 'python', PY_LOOP, TIME_LIMIT_EXCEEDED
+        else:
+            language, code, verdict = rng.choices(kinds, weights)[0]
+        cases = []
+        for _ in range(tests):
+            # At most five numbers, so PY_SUM_CRASH fails on every case
+            numbers = [rng.randint(-1000, 1000) for _ in range(rng.randint(1, 5))]
+            cases.append({"stdin": " ".join(map(str, numbers)) + "\n", "stdout": f"{sum(numbers)}\n"})
+        batch.append({"id": i, "language": language, "code": code, "testCases": cases})
+        expected.append(verdict)
+    rng.shuffle(batch)
+    return batch, expected
+
+
+def run(workers, args):
+    batch, expected = submissions(args.submissions, args.tests, args.tle, args.seed)
+    grader = Grader(get_sandbox(), workers=workers).start()
+    latencies = []
+    events = []
+
+    def emit(event):
+        events.append(event)
+        if event["event"] == "result":
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = grader.grade_batch(batch, emit)
+    seconds = time.perf_counter() - start
+    grader.close()
+
+    wrong = 0
+    for submission, result in zip(batch, results):
+        want = expected[submission["id"]]
+        wrong += not result["ok"] or any(verdict != want for verdict in result["verdicts"])
+    latencies.sort()
+    cores = min(workers, os.cpu_count() or 1)
+    return {"workers": workers,
+            "seconds": round(seconds, 3),
+            "submissions_per_s": round(len(batch) / seconds, 1),
+            "submissions_per_s_per_core": round(len(batch) / seconds / cores, 1),
+            "tests_per_s": round(len(batch) * args.tests / seconds, 1),
+            "result_latency_ms": {"p50": round(percentile(latencies, 50) * 1000, 1),
+                                  "p99": round(percentile(latencies, 99) * 1000, 1)},
+            "verdict_events": sum(1 for event in events if event["event"] == "verdict"),
+            "wrong_grades": wrong}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--submissions', type=int, default=200)
+    parser.add_argument('--tests', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=0, help="Worker threads (default: CPU count)")
+    parser.add_argument('--tle', type=int, default=0, help="Submissions that loop forever")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        report = {"submissions": args.submissions, "tests_per_submission": args.tests,
+                  "cpu_count": os.cpu_count(),
+                  "pooled": run(workers, args),
+                  "single_worker": run(1, args)}
+    print(json.dumps(report, indent=2))
+    return 1 if report["pooled"]["wrong_grades"] or report["single_worker"]["wrong_grades"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
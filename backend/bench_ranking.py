@@ -0,0 +1,149 @@
+"""Block-ranking benchmark: prompt size, topic coverage and ranking time.
+
+Builds lecture-like documents (title page, table of contents, preface and
+copyright notice, then sections that each introduce a few topic terms,
+some with code) and compares the prompt content of:
+- leading: the first ``max_length`` characters, then the first ten blocks
+  that fit the content token budget (how prompts were built before)
+- ranked: ``prepare_input_text`` and ``build_payload`` as they run now
+
+Coverage is the share of sections whose body text (not just the heading
+or the contents page entry) made it into the prompt. Also times
+``select_ranked`` on documents of ``--sizes`` bytes.
+
+Usage: python bench_ranking.py [--documents 50] [--doc-size 60000] [--sizes 100000,1000000] [--seed 1]
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+from bench_fallback import VOCABULARY
+from bench_generation import percentile
+from block_ranking import select_ranked, split_blocks
+from quiz_generator import build_payload, prepare_input_text
+from text_normalizer import normalize_text
+from token_budget import content_token_budget, estimate_tokens, select_blocks
+
+SYLLABLES = "ka lo mi ra ten vor sul bex tri nal dop quen zir fa mor".split()
+
+FRONT_MATTER = """Introduction to Systems Programming
+
+Lecture Notes
+Department of Computer Science
+Spring Term
+
+Table of Contents
+{contents}
+
+Preface
+These notes grew out of the lectures for the course. I would like to thank the students and teaching assistants
+who read early drafts and sent corrections over the years.
+
+Copyright 2024 The Course Staff. All rights reserved. ISBN 978-0-00-000000-0.
+"""
+
+
+def topic_term(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(3))
+
+
+def sentence(rng, terms):
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 20))]
+    for term in rng.sample(terms, rng.randint(1, 2)):
+        words.insert(rng.randrange(len(words)), term)
+    return " ".join(words).capitalize() + "."
+
+
+def lecture_document(size, seed=1):
+    """``(document, topics)``: a lecture of roughly ``size`` characters and
+    the topic terms of each of its sections."""
+    rng = random.Random(seed)
+    sections = []
+    topics = []
+    total = 0
+    while total < size:
+        number = len(sections) + 1
+        terms = [topic_term(rng) for _ in range(3)]
+        paragraphs = [f"{number} {terms[0].capitalize()}",
+                      f"A {terms[0]} is defined as the {rng.choice(VOCABULARY)} {terms[1]} of a {terms[2]}. "
+                      + " ".join(sentence(rng, terms) for _ in range(rng.randint(2, 4)))]
+        for _ in range(rng.randint(2, 5)):
+            paragraphs.append(" ".join(sentence(rng, terms) for _ in range(rng.randint(3, 6))))
+        if rng.random() < 0.3:
+            paragraphs.append(f"def {terms[1]}(items):\n    total = 0\n    for item in items:\n"
+                              f"        total += {terms[2]}(item)\n    return total")
+        section = "\n\n".join(paragraphs)
+        sections.append(section)
+        topics.append(terms)
+        total += len(section) + 2
+    contents = "\n".join(f"{i} {terms[0].capitalize()} {3 + 2 * i}" for i, terms in enumerate(topics, 1))
+    return FRONT_MATTER.format(contents=contents) + "\n\n" + "\n\n".join(sections), topics
+
+
+def leading_content(document, max_length=4000, max_blocks=10):
+    text, _ = normalize_text(document, max_length)
+    blocks = split_blocks(text[:max_length])[:max_blocks]
+    return "\n\n".join(select_blocks(blocks, content_token_budget()))
+
+
+def ranked_content(document):
+    payload = build_payload(prepare_input_text(document))
+    return payload['messages'][-1]['content']
+
+
+def coverage(content, topics):
+    # The contents page and headings name each section's first term only
+    content = content.lower()
+    return sum(1 for terms in topics if any(term in content for term in terms[1:])) / len(topics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--documents', type=int, default=50)
+    parser.add_argument('--doc-size', type=int, default=60000)
+    parser.add_argument('--sizes', default="100000,1000000")
+    parser.add_argument('--repeat', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    strategies = {"leading": leading_content, "ranked": ranked_content}
+    results = {name: {"content_tokens": [], "coverage": [], "covered": 0, "front_matter": 0} for name in strategies}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+        for i in range(args.documents):
+            document, topics = lecture_document(args.doc_size, seed=args.seed + i)
+            for name, strategy in strategies.items():
+                content = strategy(document)
+                results[name]["content_tokens"].append(estimate_tokens(content))
+                share = coverage(content, topics)
+                results[name]["coverage"].append(share)
+                results[name]["covered"] += round(share * len(topics))
+                results[name]["front_matter"] += "table of contents" in content.lower()
+    report = {name: {"content_tokens_mean": round(statistics.mean(r["content_tokens"]), 1),
+                     "coverage_mean": round(statistics.mean(r["coverage"]), 4),
+                     "tokens_per_covered_section": round(sum(r["content_tokens"]) / max(1, r["covered"]), 1),
+                     "prompts_with_contents_page": r["front_matter"]}
+              for name, r in results.items()}
+
+    timings = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        blocks = split_blocks(lecture_document(size, seed=args.seed)[0])
+        samples = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            select_ranked(blocks, 4000)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        timings.append({"bytes": size, "blocks": len(blocks),
+                        "select_ms_p50": round(percentile(samples, 50) * 1000, 2),
+                        "select_ms_p99": round(percentile(samples, 99) * 1000, 2)})
+    report["select_ranked"] = timings
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Microbenchmark for sanitize_questions on large synthetic question arrays.
+
+Usage: python bench_sanitize.py [--count 100000] [--repeat 3]
+"""
+import argparse
+import contextlib
+import copy
+import json
+import os
+import random
+import sys
+import time
+
+from quiz_generator import sanitize_questions
+
+TOPICS = ['binary search', 'hash tables', 'TCP handshakes', 'garbage collection',
+          'normal forms', 'virtual memory', 'recursion', 'public key cryptography']
+
+
+def synthetic_questions(count, seed=7):
+    """A mix of good MCQs, code questions and the junk sanitization rejects."""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        topic = rng.choice(TOPICS)
+        kind = rng.random()
+        if kind < 0.6:
+            questions.append({
+                "question": f"Which statement best describes {topic} (variant {i})?",
+                "options": [f"{topic} fact {j}" for j in range(4)],
+                "answer": rng.choice("ABCD"),
+                "type": "mcq",
+            })
+        elif kind < 0.75:
+            questions.append({
+                "question": f"Write a program that reads n and prints the {topic} result for n. " * rng.randint(1, 12),
+                "type": "code",
+                "language": rng.choice(["python", "c", "java"]),
+            })
+        elif kind < 0.85:
+            questions.append({
+                "question": f"What is {topic}?",
+                "options": [f"A concept related to {topic}", f"A tool for {topic}", "Option 3", "Option 4"],
+                "answer": "A",
+            })
+        elif kind < 0.95:
+            questions.append({"question": f"Choose the correct answer about {topic}", "options": ["x", "y"]})
+        else:
+            questions.append({"question": f"Explain {topic} in detail please", "options": "a, b, a, c"})
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    questions = synthetic_questions(args.count)
+    best = None
+    rejections = []
+    kept = 0
+    for _ in range(args.repeat):
+        batch = copy.deepcopy(questions)
+        rejections = []
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            start = time.perf_counter()
+            kept = len(sanitize_questions(batch, rejections=rejections, limit=None))
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    reasons = {}
+    for rejection in rejections:
+        reasons[rejection['reason']] = reasons.get(rejection['reason'], 0) + 1
+    print(json.dumps({
+        "questions": args.count,
+        "kept": kept,
+        "rejected": reasons,
+        "best_seconds": round(best, 4),
+        "questions_per_second": round(args.count / best),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
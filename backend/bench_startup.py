@@ -0,0 +1,129 @@
+"""Startup-time benchmark for quiz_generator.
+
+Measures, in fresh interpreters:
+- the import of quiz_generator with ``python -X importtime`` (total, the
+  slowest modules, and whether any module that should load lazily crept in)
+- a whole fallback-only run (no API key, cache off) of the CLI
+- a whole cached run of the CLI, against a cache primed in a temp directory
+
+and compares each against a bare ``python -c pass``.
+
+Usage: python bench_startup.py [--repeat 7] [--budget-ms 50] [--check]
+
+With ``--check`` the exit status is 1 when the median import time, or the
+overhead of either run over the bare interpreter, exceeds the budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_fallback import synthetic_document
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Launched like the Node route does; -m reuses the cached bytecode, while a
+# script path would be recompiled on every run
+CLI = [sys.executable, '-m', 'quiz_generator']
+# Modules that only the API or cache paths need
+LAZY_MODULES = ('requests', 'urllib3', 'dotenv', 'sqlite3', 'mistral_client', 'quiz_cache', 'question_bank',
+                'code_sandbox', 'code_validation', 'code_grader')
+
+
+def parse_importtime(stderr):
+    """``[(module, self_us, cumulative_us), ...]`` from ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def timed_run(args, env, stdin=None):
+    start = time.perf_counter()
+    subprocess.run(args, input=stdin, env=env, cwd=HERE, text=True, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def prime_cache(path, env, document):
+    """Store a quiz for ``document`` in a fresh cache, as a real run would."""
+    code = ("import json, quiz_generator as qg\n"
+            "text = qg.prepare_input_text(open(0).read().strip())\n"
+            "cache, key, _ = qg.lookup_cache(text)\n"
+            "qg.store_in_cache(cache, key, qg.generate_fallback_quiz(text))\n")
+    subprocess.run([sys.executable, '-c', code], input=document, env=dict(env, QUIZ_CACHE_PATH=path),
+                   cwd=HERE, text=True, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def median_ms(samples):
+    return round(statistics.median(samples), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=50,
+                        help="Allowed import time and per-run overhead over a bare interpreter")
+    parser.add_argument('--check', action='store_true', help="Exit with status 1 when over budget")
+    args = parser.parse_args()
+
+    # An empty key counts as set for dotenv, so a local .env cannot switch the
+    # fallback-only run onto the API path
+    env = dict(os.environ, MISTRAL_API_KEY='', QUIZ_LOG_LEVEL='ERROR')
+    env.pop('QUIZ_METRICS', None)
+
+    document = synthetic_document(3000)
+    bare = [timed_run([sys.executable, '-c', 'pass'], env) for _ in range(args.repeat)]
+
+    import_totals = []
+    rows = []
+    for _ in range(args.repeat):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import quiz_generator'],
+                                env=env, cwd=HERE, text=True, check=True, capture_output=True)
+        rows = parse_importtime(result.stderr)
+        import_totals.append(next(cum for name, _, cum in rows if name == 'quiz_generator') / 1000)
+    # Everything reported after site.py finished belongs to quiz_generator
+    site_index = max(i for i, row in enumerate(rows) if row[0] == 'site')
+    own_rows = rows[site_index + 1:]
+    slowest = sorted(own_rows, key=lambda row: row[1], reverse=True)[:10]
+    eager = sorted({name for name, _, _ in own_rows if name.split('.')[0] in LAZY_MODULES})
+
+    fallback_env = dict(env, QUIZ_CACHE_DISABLED='true')
+    fallback = [timed_run(CLI, fallback_env, document) for _ in range(args.repeat)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'quiz_cache.sqlite3')
+        cached_env = dict(env, QUIZ_CACHE_PATH=cache_path, QUIZ_CACHE_DISABLED='false')
+        prime_cache(cache_path, cached_env, document)
+        cached = [timed_run(CLI, cached_env, document) for _ in range(args.repeat)]
+
+    bare_ms = median_ms(bare)
+    report = {
+        "python": sys.version.split()[0],
+        "bare_interpreter_ms": bare_ms,
+        "import_ms": median_ms(import_totals),
+        "slowest_imports_ms": [{"module": name, "self": round(us / 1000, 2)} for name, us, _ in slowest],
+        "eagerly_imported": eager,
+        "fallback_run_ms": median_ms(fallback),
+        "fallback_overhead_ms": round(median_ms(fallback) - bare_ms, 1),
+        "cached_run_ms": median_ms(cached),
+        "cached_overhead_ms": round(median_ms(cached) - bare_ms, 1),
+        "budget_ms": args.budget_ms,
+    }
+    report["within_budget"] = (not eager and report["import_ms"] <= args.budget_ms
+                               and report["fallback_overhead_ms"] <= args.budget_ms
+                               and report["cached_overhead_ms"] <= args.budget_ms)
+    print(json.dumps(report, indent=2))
+    if args.check and not report["within_budget"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
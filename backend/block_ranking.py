@@ -0,0 +1,243 @@
+"""Information-density ranking of a document's content blocks.
+
+Lecture PDFs open with a title page, a table of contents and a preface;
+taking the first blocks of the text fills the prompt with them and leaves
+the lectures out. ``rank_blocks`` scores every block (a run of text
+between blank lines) on how much it has to teach per token instead:
+
+- term rarity: the mean self-information of the block's words under the
+  document's own word frequencies (``-log`` of a word's share of all
+  words). Stop words and terms the whole document repeats add little; a
+  block full of terms the rest of the document only touches scores high.
+  Words that occur once (often names and typos) count half.
+- definitions ("X is defined as", "refers to", "X is a ...") and code-like
+  lines earn a bonus, as they are what questions get asked about
+- short blocks (headings, title page lines) and blocks of short lines
+  without sentences are penalized, and tables of contents and front
+  matter (preface, copyright, acknowledgements) nearly ruled out
+
+``select_ranked`` returns a document that fits its budget whole. A longer
+one gets the best blocks, the longest of them cut to their leading
+sentences so that more sections fit, and none that score far below the
+rest even when there is room; the chosen blocks come back in document
+order. Rarity is one split of
+the text into words and prefix sums; the adjustments are only worked out
+for blocks in the running, so selecting from a megabyte of text takes
+tens of milliseconds. Long inputs are ranked over their first
+``QUIZ_RANK_WINDOW`` characters.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from itertools import accumulate, chain
+
+from quiz_env import env_int
+from term_scoring import STOP_WORDS
+from token_budget import SENTENCE_END_RE
+
+BLOCK_SPLIT_RE = re.compile(r"\n{2,}")
+# Punctuation stripped from the ends of whitespace-separated words
+PUNCTUATION = '.,;:!?()[]{}<>"\'`*-/'
+DEFINITION_PHRASES = (' is defined', ' are defined', ' is called', ' refers to', ' means ', ' is a ', ' is an ',
+                      'definition')
+# Characters and keywords that mark a line as code rather than prose
+CODE_MARKS = (';', '{', '==', ' = ', 'def ', 'return ', '#include')
+FRONT_MATTER = ('table of contents', 'preface', 'foreword', 'acknowledg', 'copyright', 'all rights reserved',
+                'isbn', 'about the author', 'dedicated to', 'printed in')
+# "2.3 Virtual memory ..... 41", "Chapter 4 Scheduling 57"
+TOC_LINE_RE = re.compile(r"(?:\.\s?){3,}\s*\d{1,4}$|^(?:\d+(?:\.\d+)*|chapter \w+|part \w+)\s.+\s\d{1,4}$",
+                         re.IGNORECASE)
+
+# Words that occur once in the document count this share of their rarity
+SINGLETON_WEIGHT = 0.5
+# Blocks shorter than this many words are scaled down proportionally
+MIN_WORDS = 12
+# Bonuses: per definition (at most two), and for a block of code lines
+DEFINITION_BONUS = 0.25
+CODE_BONUS = 0.5
+# Blocks of short lines (title pages, lists of headings)
+SHORT_LINE_WORDS = 4
+SHORT_LINES_PENALTY = 0.3
+TOC_PENALTY = 0.05
+FRONT_MATTER_PENALTY = 0.2
+# The most the adjustments can raise a score
+MAX_ADJUSTMENT = 1 + max(CODE_BONUS, 2 * DEFINITION_BONUS)
+# Blocks scoring under this share of the 75th-percentile rarity score are
+# dropped, and selection stops once this share of the budget is left
+LOW_VALUE_SHARE = 0.25
+MIN_FILL_SHARE = 0.02
+# A block that does not fit is only cut down when this share of the
+# budget is left; otherwise smaller blocks fill the rest
+MIN_TRIM_SHARE = 0.25
+# When the budget is short, the best this many blocks (or ``max_blocks``)
+# share it: each is cut to the leading sentences that fit its fair share
+# (a block whose first sentence is longer, such as code, is kept whole),
+# so the budget goes to more sections rather than to the rest of one
+# paragraph. Blocks shorter than the share are not cut.
+TRIM_SLOTS = 20
+
+
+def rank_window():
+    """Characters of normalized input that are ranked (``QUIZ_RANK_WINDOW``)."""
+    return env_int('QUIZ_RANK_WINDOW', 65536)
+
+
+def split_blocks(text):
+    return [block.strip() for block in BLOCK_SPLIT_RE.split(text) if block.strip()]
+
+
+def _is_toc(block, lines):
+    """Whether most lines of a multi-line block end in a page number."""
+    numbered = [line for line in block.split('\n') if line[-1:].isdigit()]
+    return len(numbered) * 2 >= lines and sum(1 for line in numbered if TOC_LINE_RE.search(line)) * 2 >= lines
+
+
+def _rarity_scores(blocks):
+    """Mean word rarity of each block, scaled down for short blocks, with
+    the lowercased blocks and their word counts."""
+    lowered = [block.lower() for block in blocks]
+    block_words = [low.split() for low in lowered]
+    counts = [len(words) for words in block_words]
+    words = list(chain.from_iterable(block_words))
+    if not words:
+        return [0.0] * len(blocks), lowered, counts
+    # Occurrences per term, merging the punctuated forms of a word
+    occurrences = Counter(words)
+    term_counts = Counter()
+    for word, count in occurrences.items():
+        term_counts[word.strip(PUNCTUATION)] += count
+    log_total = math.log(len(words))
+    rarity = {term: (log_total - math.log(count)) * (SINGLETON_WEIGHT if count == 1 else 1.0)
+              for term, count in term_counts.items()}
+    for term in STOP_WORDS.intersection(rarity):
+        rarity[term] = 0.0
+    rarity[''] = 0.0
+    word_rarity = {word: rarity[word.strip(PUNCTUATION)] for word in occurrences}
+    # Prefix sums of per-word rarity give each block's total in one subtraction
+    totals = list(accumulate(map(word_rarity.__getitem__, words), initial=0.0))
+
+    scores = []
+    position = 0
+    for count in counts:
+        if not count:
+            scores.append(0.0)
+            continue
+        score = (totals[position + count] - totals[position]) / count
+        position += count
+        if count < MIN_WORDS:
+            score *= count / MIN_WORDS
+        scores.append(score)
+    return scores, lowered, counts
+
+
+def _adjustment(block, low, words):
+    """Multiplier for definitions, code, short lines and front matter."""
+    factor = 1.0
+    lines = block.count('\n') + 1
+    if sum(map(low.count, CODE_MARKS)) >= lines:
+        factor *= 1 + CODE_BONUS
+    else:
+        definitions = sum(map(low.count, DEFINITION_PHRASES))
+        factor *= 1 + DEFINITION_BONUS * min(definitions, 2)
+        if lines > 1 and words < SHORT_LINE_WORDS * lines:
+            factor *= SHORT_LINES_PENALTY
+    if lines > 1 and _is_toc(block, lines):
+        factor *= TOC_PENALTY
+    elif any(marker in low for marker in FRONT_MATTER):
+        factor *= FRONT_MATTER_PENALTY
+    return factor
+
+
+def rank_blocks(blocks):
+    """Information-density score of each block (higher is better)."""
+    scores, lowered, counts = _rarity_scores(blocks)
+    return [score * _adjustment(block, low, words) if score else 0.0
+            for block, low, words, score in zip(blocks, lowered, counts, scores)]
+
+
+def _trim(block, budget, cost):
+    """The leading sentences of ``block`` that fit in ``budget``."""
+    kept = []
+    for sentence in SENTENCE_END_RE.split(block):
+        budget -= cost(sentence) + (1 if kept else 0)
+        if budget < 0:
+            break
+        kept.append(sentence)
+    return " ".join(kept)
+
+
+def _fits(blocks, budget, cost):
+    total = 0
+    for block in blocks:
+        total += cost(block)
+        if total > budget:
+            return False
+    return True
+
+
+def _fair_share(costs, budget):
+    """The largest per-block cost under which ``costs``, each cut down to
+    it, fit ``budget``; ``budget`` when they fit whole."""
+    remaining = budget
+    costs = sorted(costs)
+    for done, block_cost in enumerate(costs):
+        share = remaining / (len(costs) - done)
+        if block_cost > share:
+            return share
+        remaining -= block_cost
+    return budget
+
+
+def select_ranked(blocks, budget, cost=len, max_blocks=None):
+    """The highest-scoring ``blocks`` that fit ``budget`` (measured with
+    ``cost``, per block), in document order.
+
+    When every block fits (and there are at most ``max_blocks``), they are
+    all returned whole. Otherwise a block longer than its fair share of
+    the budget (see ``TRIM_SLOTS``) is cut to its leading sentences; one
+    that does not fit in what is left is cut the same way when at least a
+    quarter of the budget is left and one sentence fits. ``max_blocks``
+    caps how many blocks are kept.
+
+    Blocks are visited best-first by their rarity score times the largest
+    possible adjustment, and the adjustment is only worked out for blocks
+    popped that way that could still fit, so most of a long document never
+    needs it.
+    """
+    if not blocks:
+        return []
+    if (max_blocks is None or len(blocks) <= max_blocks) and _fits(blocks, budget, cost):
+        return list(blocks)
+    scores, lowered, counts = _rarity_scores(blocks)
+    ordered = sorted(scores)
+    floor = LOW_VALUE_SHARE * ordered[(len(ordered) * 3) // 4]
+    heap = [(-score * MAX_ADJUSTMENT, index, False) for index, score in enumerate(scores) if score > 0]
+    heapq.heapify(heap)
+    likely = heapq.nsmallest(max_blocks or TRIM_SLOTS, heap)
+    block_limit = _fair_share([cost(blocks[index]) for _, index, _ in likely], budget)
+    chosen = {}
+    remaining = budget
+    while heap and remaining > MIN_FILL_SHARE * budget:
+        if max_blocks is not None and len(chosen) >= max_blocks:
+            break
+        bound, index, exact = heapq.heappop(heap)
+        if -bound < floor:
+            break
+        block = blocks[index]
+        block_cost = cost(block)
+        if block_cost > remaining and remaining < MIN_TRIM_SHARE * budget:
+            continue
+        if not exact:
+            score = scores[index] * _adjustment(block, lowered[index], counts[index])
+            heapq.heappush(heap, (-score, index, True))
+            continue
+        limit = min(remaining, block_limit)
+        if block_cost > limit:
+            block = _trim(block, limit, cost) or (block if block_cost <= remaining else '')
+            if not block:
+                continue
+            block_cost = cost(block)
+        chosen[index] = block
+        remaining -= block_cost
+    return [chosen[index] for index in sorted(chosen)]
@@ -0,0 +1,136 @@
+"""Circuit breaker for the generation API.
+
+During an upstream outage every job would otherwise spend its full retry
+budget on a doomed call before falling back. The breaker watches call
+outcomes and, once the API looks down, rejects calls immediately so jobs
+go straight to the cache or the fallback generator:
+
+- closed: calls go through. ``QUIZ_BREAKER_FAILURES`` consecutive
+  failures, or a failure rate of ``QUIZ_BREAKER_ERROR_RATE`` over the last
+  ``QUIZ_BREAKER_WINDOW`` calls, opens it.
+- open: calls are rejected with ``CircuitOpenError`` for
+  ``QUIZ_BREAKER_OPEN_SECONDS``.
+- half-open: a single probe call is let through. Success closes the
+  breaker, failure opens it for another period.
+
+Only failures that point at the upstream (connection errors, timeouts,
+429 and 5xx) count; a reply we could not parse still shows the API is up.
+The breaker is process-wide, so a long-lived worker shares its state
+across jobs. Set ``QUIZ_BREAKER=false`` to turn it off.
+"""
+import collections
+import os
+import threading
+import time
+
+import quiz_logging
+import quiz_metrics
+from quiz_env import env_float, env_int
+
+log = quiz_logging.get_logger('breaker')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream the breaker considers down."""
+
+
+class CircuitBreaker:
+    """Thread-safe closed/open/half-open breaker over call outcomes."""
+
+    def __init__(self, name='api', failure_threshold=5, error_rate=0.5, window=20, min_calls=10,
+                 open_seconds=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probe_started = None
+        self._outcomes = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name='api'):
+        window = env_int('QUIZ_BREAKER_WINDOW', 20)
+        return cls(name,
+                   failure_threshold=env_int('QUIZ_BREAKER_FAILURES', 5),
+                   error_rate=env_float('QUIZ_BREAKER_ERROR_RATE', 0.5),
+                   window=window,
+                   min_calls=max(1, window // 2),
+                   open_seconds=env_float('QUIZ_BREAKER_OPEN_SECONDS', 30.0))
+
+    def allow(self):
+        """Whether a call may go ahead now. In half-open state only one
+        probe is let through at a time; a probe that never reports back
+        stops blocking others after ``open_seconds``."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = self.clock()
+            if self.state == OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self.probe_started = None
+            if self.probe_started is not None and now - self.probe_started < self.open_seconds:
+                return False
+            self.probe_started = now
+        quiz_metrics.incr("circuit_probe")
+        log.info("🔌 Circuit %s half-open, probing the API", self.name)
+        return True
+
+    def record_success(self):
+        with self._lock:
+            self._outcomes.append(True)
+            self.consecutive_failures = 0
+            if self.state == CLOSED:
+                return
+            self.state = CLOSED
+            self.probe_started = None
+            self._outcomes.clear()
+        log.info("✅ Circuit %s closed, the API answered again", self.name)
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            self.consecutive_failures += 1
+            if self.state == OPEN:
+                return
+            if self.state == CLOSED:
+                failures = self._outcomes.count(False)
+                rate_tripped = (len(self._outcomes) >= self.min_calls
+                                and failures / len(self._outcomes) >= self.error_rate)
+                if self.consecutive_failures < self.failure_threshold and not rate_tripped:
+                    return
+            self.state = OPEN
+            self.opened_at = self.clock()
+            self.probe_started = None
+            failures = self.consecutive_failures
+        quiz_metrics.incr("circuit_opened")
+        log.warning("🚧 Circuit %s open after %d consecutive failures, using the fallback for %gs",
+                    self.name, failures, self.open_seconds)
+
+
+def breaker_enabled():
+    return os.getenv('QUIZ_BREAKER', 'true').lower() not in ('0', 'false', 'no')
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker():
+    """The process-wide API breaker, created on first use."""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker.from_env()
+    return _breaker
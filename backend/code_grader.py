@@ -0,0 +1,292 @@
+"""Batch grading of student code submissions against their test cases.
+
+A ``Grader`` keeps a pool of worker threads, started with the service, and
+a queue in front of it: submissions are accepted as fast as they arrive
+and graded as workers free up, so the burst when an exam closes waits in
+the queue instead of being turned away. A full queue (``QUIZ_GRADER_QUEUE``
+submissions) makes ``submit`` block, which pushes back on the reader
+rather than rejecting anything.
+
+Each submission is compiled once and run on its test cases one after the
+other in the ``code_sandbox`` jail, a fresh one per run. Every
+test's verdict is emitted as soon as it is known, then the submission's
+result with its score (the share of tests passed):
+
+    {"id": 7, "event": "verdict", "test": 0, "verdict": "pass", "seconds": 0.021}
+    {"id": 7, "event": "result", "ok": true, "passed": 3, "total": 4, "score": 0.75,
+     "verdicts": ["pass", "pass", "wrong_answer", "pass"]}
+
+Verdicts: pass, wrong_answer, time_limit_exceeded, runtime_error (with a
+``reason`` when a memory or output limit was hit) and compile_error.
+Expected outputs are never echoed back. Once a submission has timed out
+on ``QUIZ_GRADER_MAX_TIMEOUTS`` tests, its remaining tests are not run but
+reported as time_limit_exceeded with ``"skipped": true``: each timeout
+costs the full CPU limit, and a few looping programs would otherwise hold
+up the whole queue.
+
+A test the jail could not run even on a retry is no verdict on the code:
+the submission's result is then ``"ok": false`` with an error, and the
+caller may resubmit it.
+
+Run as a worker reading NDJSON submissions (``{"id", "language", "code",
+"testCases": [{"stdin", "stdout"}]}``) on stdin, or on a Unix socket:
+
+    python code_grader.py [--socket PATH] [--workers N] [--metrics-port PORT]
+
+    QUIZ_GRADER_WORKERS=<cpu count>  QUIZ_GRADER_QUEUE=10000
+    QUIZ_GRADER_MAX_TIMEOUTS=2
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import quiz_logging
+import quiz_metrics
+from code_sandbox import (COMPILE_ERROR, LANGUAGES, MEMORY_LIMIT, OUTPUT_LIMIT, TIMEOUT, UNAVAILABLE,
+                          get_sandbox, outputs_match)
+from quiz_env import env_int
+
+log = quiz_logging.get_logger('grader')
+
+# Test verdicts
+PASS = 'pass'
+WRONG_ANSWER = 'wrong_answer'
+TIME_LIMIT_EXCEEDED = 'time_limit_exceeded'
+RUNTIME_ERROR = 'runtime_error'
+COMPILE_ERROR_VERDICT = 'compile_error'
+
+# Error output passed back to the student
+STDERR_CHARS = 500
+
+_STOP = object()
+
+
+def verdict_for(result, expected):
+    """``(verdict, reason)`` for one sandbox ``RunResult`` the jail ran;
+    an UNAVAILABLE run has no verdict."""
+    if result.ok:
+        return (PASS if outputs_match(expected, result.stdout) else WRONG_ANSWER), None
+    if result.status == TIMEOUT:
+        return TIME_LIMIT_EXCEEDED, None
+    if result.status in (MEMORY_LIMIT, OUTPUT_LIMIT):
+        return RUNTIME_ERROR, result.status
+    return RUNTIME_ERROR, None
+
+
+class Grader:
+    """Grades queued submissions on ``workers`` threads; see the module
+    docstring. ``submit`` returns a ``Future`` of the result event."""
+
+    def __init__(self, sandbox=None, workers=None, max_queue=10000, max_timeouts=2):
+        self.sandbox = sandbox or get_sandbox()
+        self.workers = workers or max(1, os.cpu_count() or 1)
+        self.max_timeouts = max_timeouts
+        self._queue = queue.Queue(maxsize=max(0, max_queue))
+        self._threads = []
+
+    @classmethod
+    def from_env(cls, sandbox=None):
+        return cls(sandbox, workers=env_int('QUIZ_GRADER_WORKERS', 0) or None,
+                   max_queue=env_int('QUIZ_GRADER_QUEUE', 10000),
+                   max_timeouts=env_int('QUIZ_GRADER_MAX_TIMEOUTS', 2))
+
+    def start(self):
+        """Start the workers and check the toolchains up front, so the
+        first submissions pay for neither."""
+        if self._threads:
+            return self
+        for language in LANGUAGES:
+            self.sandbox.available(language)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'grader-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        log.info("🧑‍🏫 Grader ready with %d workers", self.workers)
+        return self
+
+    def close(self):
+        """Finish the queued submissions, then stop the workers."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def submit(self, submission, emit=None):
+        """Queue ``submission``; ``emit`` gets each of its events, called
+        from a worker thread. Blocks only while the queue is full."""
+        future = Future()
+        self._queue.put((submission, emit, future, time.perf_counter()))
+        return future
+
+    def grade_batch(self, submissions, emit=None):
+        """Result events of ``submissions``, in input order."""
+        futures = [self.submit(submission, emit) for submission in submissions]
+        return [future.result() for future in futures]
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            submission, emit, future, queued = item
+            try:
+                future.set_result(self.grade(submission, emit, queued))
+            except Exception as e:
+                log.exception("❌ Grading failed")
+                job_id = submission.get('id') if isinstance(submission, dict) else None
+                result = {"id": job_id, "event": "result", "ok": False, "error": str(e)}
+                if emit is not None:
+                    emit(result)
+                future.set_result(result)
+
+    def grade(self, submission, emit=None, queued=None):
+        """Grade one submission in the calling thread; returns its result
+        event after emitting every event."""
+        emit = emit or (lambda event: None)
+        job_id = submission.get('id') if isinstance(submission, dict) else None
+        with quiz_metrics.track_job(job_id) as metrics:
+            if metrics is not None and queued is not None:
+                metrics.add_time("grade_queue", time.perf_counter() - queued)
+            result = self._grade(submission, job_id, emit)
+            if metrics is not None:
+                metrics.ok = result['ok']
+        emit(result)
+        return result
+
+    def _grade(self, submission, job_id, emit):
+        if not isinstance(submission, dict):
+            return {"id": job_id, "event": "result", "ok": False, "error": "Submission must be a JSON object"}
+        language = (submission.get('language') or 'python').lower()
+        cases = submission.get('testCases')
+        if language not in LANGUAGES:
+            return {"id": job_id, "event": "result", "ok": False, "error": f"Unsupported language: {language}"}
+        if not isinstance(cases, list) or not cases or not all(isinstance(case, dict) for case in cases):
+            return {"id": job_id, "event": "result", "ok": False, "error": "Submission has no test cases"}
+
+        verdicts = []
+        with self.sandbox.compile(language, str(submission.get('code') or '')) as program:
+            if program.result.status == UNAVAILABLE:
+                return {"id": job_id, "event": "result", "ok": False,
+                        "error": f"No {language} toolchain installed"}
+            compile_error = None
+            if program.result.status == COMPILE_ERROR:
+                compile_error = program.result.stderr[-STDERR_CHARS:]
+            for index, case in enumerate(cases):
+                event = {"id": job_id, "event": "verdict", "test": index}
+                if compile_error is not None:
+                    event["verdict"] = COMPILE_ERROR_VERDICT
+                elif self.max_timeouts and verdicts.count(TIME_LIMIT_EXCEEDED) >= self.max_timeouts:
+                    event["verdict"] = TIME_LIMIT_EXCEEDED
+                    event["skipped"] = True
+                else:
+                    stdin = str(case.get('stdin') or '')
+                    run = self.sandbox.run(program, stdin)
+                    if run.status == UNAVAILABLE:
+                        run = self.sandbox.run(program, stdin)
+                    if run.status == UNAVAILABLE:
+                        quiz_metrics.incr("grade_unavailable")
+                        return {"id": job_id, "event": "result", "ok": False,
+                                "error": f"Sandbox unavailable: {run.stderr}"}
+                    verdict, reason = verdict_for(run, str(case.get('stdout') or ''))
+                    event["verdict"] = verdict
+                    event["seconds"] = round(run.seconds, 4)
+                    if reason:
+                        event["reason"] = reason
+                    if verdict == RUNTIME_ERROR and run.stderr:
+                        event["stderr"] = run.stderr[-STDERR_CHARS:]
+                quiz_metrics.incr(f"grade_{event['verdict']}")
+                verdicts.append(event["verdict"])
+                emit(event)
+
+        passed = verdicts.count(PASS)
+        result = {"id": job_id, "event": "result", "ok": True, "passed": passed, "total": len(verdicts),
+                  "score": round(passed / len(verdicts), 4), "verdicts": verdicts}
+        if compile_error is not None:
+            result["compile_error"] = compile_error
+        return result
+
+
+def serve_stream(grader, stream_in, stream_out):
+    """Queue every NDJSON submission read from ``stream_in`` and write its
+    events to ``stream_out`` as they happen, until the input closes and
+    every submission read from it is graded."""
+    lock = threading.Lock()
+
+    def emit(event):
+        line = json.dumps(event) + "\n"
+        with lock:
+            stream_out.write(line)
+            stream_out.flush()
+
+    futures = []
+    for line in stream_in:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            submission = json.loads(line)
+        except json.JSONDecodeError as e:
+            emit({"id": None, "event": "result", "ok": False, "error": f"Invalid submission: {e}"})
+            continue
+        futures.append(grader.submit(submission, emit))
+    for future in futures:
+        future.exception()
+
+
+def serve_unix_socket(grader, path):
+    """Serve submissions on a local Unix socket; all connections share the
+    grader's queue and workers."""
+    import socket_server
+    socket_server.serve_unix_socket(path, lambda reader, writer: serve_stream(grader, reader, writer), "Grader")
+
+
+_grader = None
+_grader_lock = threading.Lock()
+
+
+def get_grader():
+    """The process-wide grader, started on first use."""
+    global _grader
+    if _grader is None:
+        with _grader_lock:
+            if _grader is None:
+                _grader = Grader.from_env().start()
+    return _grader
+
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Grade NDJSON code submissions read on stdin.")
+    parser.add_argument('--socket', metavar='PATH', help="Serve submissions on a Unix socket instead of stdin")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Submissions graded at once (default: QUIZ_GRADER_WORKERS or the CPU count)")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (enables QUIZ_METRICS)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.workers:
+        os.environ['QUIZ_GRADER_WORKERS'] = str(args.workers)
+    if args.metrics_port:
+        os.environ['QUIZ_METRICS'] = 'true'
+        quiz_metrics.serve_prometheus(args.metrics_port)
+        log.info("📈 Metrics on http://127.0.0.1:%d/metrics", args.metrics_port)
+    try:
+        if args.socket:
+            serve_unix_socket(get_grader(), args.socket)
+        else:
+            serve_stream(get_grader(), sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
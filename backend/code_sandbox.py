@@ -0,0 +1,682 @@
+"""Jailed, resource-limited execution of short stdin/stdout programs.
+
+Used to check generated code questions against their reference solution
+and to grade student submissions, so every program is treated as hostile.
+A ``Sandbox`` compiles a program once in a fresh temp directory and runs
+it on any number of inputs in parallel. Each compile and run gets its own
+jail:
+
+- new PID, mount, network, IPC and UTS namespaces: the program sees only
+  its own processes (a fresh ``/proc``), has no network, and everything it
+  started is killed when the run ends or times out, including children
+  that detached with ``setsid``
+- a read-only root holding only the system directories (``/usr``, the
+  libraries, the Python install), a private ``/tmp``, ``/dev/null`` and
+  friends, and the program's directory at ``/sandbox``, read-only except
+  while compiling; nothing of the service (its files, ``/proc``, its
+  environment) is visible
+- a dedicated unprivileged uid per pool thread (``QUIZ_SANDBOX_UID`` and
+  up), no capabilities, ``no_new_privs``, and ``RLIMIT_NPROC`` against
+  fork bombs
+- rlimits on CPU time, address space (Java gets ``-Xmx`` instead, as the
+  JVM reserves far more than it uses) and written output, no core dumps,
+  and a wall-clock timeout
+- the environment is reduced to ``PATH`` and ``LANG``
+
+Setting up the jail needs root, or unprivileged user namespaces (the
+program's uid is then mapped to the service's). When neither works, no
+language is available and nothing runs.
+
+The jails are set up by a small Python launcher that each pool thread
+starts once and keeps warm. Python programs run in a fork of it, which
+saves the interpreter startup (about 10 ms, most of a short test's run
+time) on every run; compiled programs are exec'd. Set
+``QUIZ_SANDBOX_WARM=false`` to start a fresh launcher per run instead.
+
+Languages are those ``detect_language`` emits: python, c (``gcc``) and
+java (``javac``/``java``); a language whose toolchain is not installed is
+reported as unavailable rather than failing every run.
+
+    QUIZ_SANDBOX_CPU_SECONDS=2       QUIZ_SANDBOX_WALL_SECONDS=5
+    QUIZ_SANDBOX_MEMORY_MB=256       QUIZ_SANDBOX_OUTPUT_BYTES=65536
+    QUIZ_SANDBOX_COMPILE_SECONDS=15  QUIZ_SANDBOX_PROCESSES=32
+    QUIZ_SANDBOX_WORKERS=<cpu count> QUIZ_SANDBOX_UID=60000
+    QUIZ_SANDBOX_WARM=true
+"""
+import contextvars
+import itertools
+import json
+import math
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import quiz_logging
+import quiz_metrics
+from quiz_env import env_float, env_int
+
+log = quiz_logging.get_logger('sandbox')
+
+# Run outcomes
+OK = 'ok'
+COMPILE_ERROR = 'compile_error'
+RUNTIME_ERROR = 'runtime_error'
+TIMEOUT = 'timeout'
+OUTPUT_LIMIT = 'output_limit'
+MEMORY_LIMIT = 'memory_limit'
+UNAVAILABLE = 'unavailable'
+
+# Compilers get more room than the programs they build
+COMPILE_MEMORY_MB = 1024
+COMPILE_OUTPUT_BYTES = 64 << 20
+COMPILE_PROCESSES = 256
+COMPILE_TMP_MB = 256
+RUN_TMP_MB = 16
+# Error output kept in results
+STDERR_BYTES = 4096
+SANDBOX_ENV = {'PATH': '/usr/local/bin:/usr/bin:/bin', 'LANG': 'C.UTF-8'}
+# Host paths visible (read-only) inside the jail, when they exist
+JAIL_PATHS = ('/usr', '/bin', '/sbin', '/lib', '/lib32', '/lib64', '/libx32', '/etc/alternatives',
+              '/etc/ld.so.cache', '/etc/ld.so.conf', '/etc/ld.so.conf.d', '/etc/java-17-openjdk',
+              '/etc/java-21-openjdk', sys.base_prefix)
+# Mount point the jails build their root on (each in its own mount namespace)
+JAIL_ROOT = os.path.join(tempfile.gettempdir(), 'quiz-sandbox-root')
+# Distinct uids handed to pool threads, from QUIZ_SANDBOX_UID up
+UID_SLOTS = 64
+# How long the launcher may take to start a run before it is replaced
+START_SECONDS = 5
+
+# The launcher, started with its settings as a JSON argument. It first
+# moves into a mount namespace of its own (and a user namespace when not
+# root) and builds the jail's read-only root there once. Then it reads one
+# run per line (a JSON request), jails it and replies with one JSON line
+# when the run has started ({"pid"}) and one when it has ended
+# ({"returncode"}, {"error"} when the jail could not be set up, or {}
+# after the service killed it).
+#
+# For each run it forks a child that unshares the namespaces (the PID
+# namespace applies to the child's children), which forks the namespace's
+# init: that mounts the run's directory, /tmp and /proc into its copy of
+# the root, forks the program and reports its exit status through a pipe.
+# Killing the child kills init (PDEATHSIG), and the kernel kills whatever
+# is left in the namespace when init exits.
+JAIL = r"""
+import ctypes, json, os, resource, signal, sys
+
+libc = ctypes.CDLL(None, use_errno=True)
+libc.mount.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p)
+CLONE_NEWNS, CLONE_NEWUTS, CLONE_NEWIPC = 0x20000, 0x4000000, 0x8000000
+CLONE_NEWUSER, CLONE_NEWPID, CLONE_NEWNET = 0x10000000, 0x20000000, 0x40000000
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_NOEXEC, MS_REMOUNT = 1, 2, 4, 8, 32
+MS_NOATIME, MS_NODIRATIME, MS_BIND, MS_REC, MS_PRIVATE, MS_RELATIME = 1024, 2048, 4096, 16384, 1 << 18, 1 << 21
+PR_SET_PDEATHSIG, PR_SET_NO_NEW_PRIVS = 1, 38
+DEVICES = ('/dev/null', '/dev/zero', '/dev/random', '/dev/urandom')
+
+
+def check(result, what):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, '%s: %s' % (what, os.strerror(errno)))
+
+
+def mount(source, target, fstype, flags, data=None):
+    check(libc.mount(source and source.encode(), target.encode(), fstype and fstype.encode(), flags,
+                     data and data.encode()), 'mount ' + target)
+
+
+def locked_flags(path):
+    # A bind remount must keep the flags the host mount has
+    flag = os.statvfs(path).f_flag
+    flags = flag & (MS_RDONLY | MS_NOSUID | MS_NODEV | MS_NOEXEC | MS_NOATIME | MS_NODIRATIME)
+    return flags | (MS_RELATIME if flag & 4096 else 0)
+
+
+def bind(root, source, target, writable=False):
+    target = root + target
+    if os.path.islink(source):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.symlink(os.readlink(source), target)
+        return
+    if os.path.isdir(source):
+        os.makedirs(target, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        open(target, 'a').close()
+    mount(source, target, None, MS_BIND | MS_REC)
+    flags = locked_flags(source) | MS_NOSUID | (0 if writable else MS_RDONLY)
+    if not source.startswith('/dev/'):
+        flags |= MS_NODEV
+    mount(None, target, None, MS_BIND | MS_REMOUNT | flags)
+
+
+def enter_namespace(config):
+    if config['userns']:
+        check(libc.unshare(CLONE_NEWUSER | CLONE_NEWNS), 'unshare')
+        for name, text in (('setgroups', 'deny'), ('uid_map', '%d %d 1' % (config['uid'], config['outer_uid'])),
+                           ('gid_map', '%d %d 1' % (config['uid'], config['outer_gid']))):
+            with open('/proc/self/' + name, 'w') as f:
+                f.write(text)
+    else:
+        check(libc.unshare(CLONE_NEWNS), 'unshare')
+
+
+def build_base(config):
+    root = config['root']
+    mount(None, '/', None, MS_REC | MS_PRIVATE)
+    mount('tmpfs', root, 'tmpfs', MS_NOSUID | MS_NODEV, 'size=1m,mode=755')
+    for path in config['paths']:
+        if os.path.lexists(path) and not os.path.lexists(root + path):
+            bind(root, path, path)
+    for path in DEVICES:
+        if os.path.exists(path):
+            bind(root, path, path, writable=True)
+    for path in ('/sandbox', '/tmp', '/proc'):
+        os.makedirs(root + path)
+    mount(None, root, None, MS_REMOUNT | MS_RDONLY | MS_NOSUID | MS_NODEV, 'size=1m,mode=755')
+
+
+def enter_root(request):
+    root = config['root']
+    bind(root, request['workdir'], '/sandbox', writable=request['writable'])
+    mount('tmpfs', root + '/tmp', 'tmpfs', MS_NOSUID | MS_NODEV, 'size=%dm,mode=1777' % request['tmp_mb'])
+    try:
+        mount('proc', root + '/proc', 'proc', MS_NOSUID | MS_NODEV | MS_NOEXEC)
+    except OSError:
+        pass  # Not allowed in some unprivileged setups; the jail then has no /proc at all
+    os.chroot(root)
+    os.chdir('/sandbox')
+
+
+def drop_privileges(request):
+    uid = config['uid']
+    for limit, value in ((resource.RLIMIT_CPU, (request['cpu'], request['cpu'] + 1)),
+                         (resource.RLIMIT_FSIZE, (request['output'], request['output'])),
+                         (resource.RLIMIT_CORE, (0, 0)),
+                         (resource.RLIMIT_NPROC, (request['processes'], request['processes']))):
+        resource.setrlimit(limit, value)
+    if request['memory']:
+        resource.setrlimit(resource.RLIMIT_AS, (request['memory'], request['memory']))
+    if not config['userns']:
+        os.setgroups([])
+    os.setresgid(uid, uid, uid)
+    os.setresuid(uid, uid, uid)
+    # Under a user namespace the uid stays the same, so drop the capabilities explicitly
+    class Header(ctypes.Structure):
+        _fields_ = [('version', ctypes.c_uint32), ('pid', ctypes.c_int)]
+    check(libc.capset(ctypes.byref(Header(0x20080522, 0)), ctypes.byref((ctypes.c_uint32 * 6)())), 'capset')
+    check(libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), 'no_new_privs')
+
+
+def run_python():
+    # Started the way ``python -I -S main.py`` would be
+    sys.stdin = sys.__stdin__ = open(0, 'r', encoding='utf-8', newline='\n', closefd=False)
+    sys.stdout = sys.__stdout__ = open(1, 'w', encoding='utf-8', newline='\n', closefd=False)
+    sys.stderr = sys.__stderr__ = open(2, 'w', buffering=1, encoding='utf-8', errors='backslashreplace',
+                                       newline='\n', closefd=False)
+    path = '/sandbox/main.py'
+    sys.argv = ['main.py']
+    code = 0
+    try:
+        with open(path, 'rb') as f:
+            source = f.read()
+        exec(compile(source, path, 'exec'), {'__name__': '__main__', '__file__': path, '__builtins__': __builtins__})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException as e:
+        # Hide this function's frame from the traceback
+        e.__traceback__ = e.__traceback__.tb_next if e.__traceback__ else None
+        sys.excepthook(type(e), e, e.__traceback__)
+        code = 1
+    try:
+        sys.stdout.flush()
+    except BaseException:
+        code = 120
+    try:
+        sys.stderr.flush()
+    except BaseException:
+        pass
+    os._exit(code & 0xff)
+
+
+def program(request, files):
+    for fd, handle in enumerate(files):
+        os.dup2(handle, fd)
+    os.closerange(3, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    try:
+        drop_privileges(request)
+        if request['python']:
+            run_python()
+        for number in (signal.SIGPIPE, signal.SIGXFSZ, signal.SIGINT):
+            signal.signal(number, signal.SIG_DFL)
+        os.execvpe(request['command'][0], request['command'], request['env'])
+    except BaseException as e:
+        os.write(2, ('sandbox: %s\n' % e).encode('utf-8', 'replace'))
+    os._exit(127)
+
+
+def init(request, status):
+    check(libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL, 0, 0, 0), 'pdeathsig')
+    files = [os.open(request['files'][0], os.O_RDONLY),
+             os.open(request['files'][1], os.O_WRONLY), os.open(request['files'][2], os.O_WRONLY)]
+    if request['writable'] and not config['userns']:
+        os.chown(request['workdir'], config['uid'], config['uid'])
+    enter_root(request)
+    pid = os.fork()
+    if pid == 0:
+        program(request, files)
+    returncode = os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+    os.write(status, json.dumps({'returncode': returncode}).encode('utf-8'))
+
+
+def child(request, status):
+    check(libc.unshare(CLONE_NEWPID | CLONE_NEWNS | CLONE_NEWNET | CLONE_NEWIPC | CLONE_NEWUTS), 'unshare')
+    pid = os.fork()
+    if pid == 0:
+        try:
+            init(request, status)
+        except BaseException as e:
+            os.write(status, json.dumps({'error': str(e)}).encode('utf-8'))
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+config = json.loads(sys.argv[1])
+try:
+    enter_namespace(config)
+    build_base(config)
+    setup_error = None
+except OSError as e:
+    setup_error = str(e)
+
+while True:
+    line = sys.stdin.buffer.readline()
+    if not line:
+        break
+    request = json.loads(line)
+    if setup_error:
+        sys.stdout.write(json.dumps({'pid': 0}) + '\n' + json.dumps({'error': setup_error}) + '\n')
+        sys.stdout.flush()
+        continue
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_end)
+            child(request, write_end)
+        except BaseException as e:
+            os.write(write_end, json.dumps({'error': str(e)}).encode('utf-8'))
+        os._exit(0)
+    os.close(write_end)
+    sys.stdout.write(json.dumps({'pid': pid}) + '\n')
+    sys.stdout.flush()
+    os.waitpid(pid, 0)
+    chunks = []
+    while True:
+        chunk = os.read(read_end, 4096)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_end)
+    sys.stdout.write((b''.join(chunks).decode('utf-8') or '{}') + '\n')
+    sys.stdout.flush()
+"""
+
+
+class Language:
+    """How to build and run a single-file program. ``{memory_mb}`` in a
+    command is replaced by the memory limit; ``tools`` must be on the
+    ``PATH`` for the language to be available. ``in_process`` programs
+    are Python run by the launcher's own interpreter rather than exec'd."""
+
+    def __init__(self, name, source_name, run, compile=None, tools=(), limit_address_space=True,
+                 in_process=False):
+        self.name = name
+        self.source_name = source_name
+        self.run = run
+        self.compile = compile
+        self.tools = tools
+        self.limit_address_space = limit_address_space
+        self.in_process = in_process
+
+
+LANGUAGES = {
+    'python': Language('python', 'main.py', [sys.executable, '-I', '-S', 'main.py'], tools=(sys.executable,),
+                       in_process=True),
+    'c': Language('c', 'main.c', ['./main'], compile=['gcc', '-O2', '-std=gnu11', '-o', 'main', 'main.c', '-lm'],
+                  tools=('gcc',)),
+    'java': Language('java', 'Main.java',
+                     ['java', '-Xmx{memory_mb}m', '-Xss64m', '-XX:+UseSerialGC', '-XX:TieredStopAtLevel=1',
+                      '-cp', '.', 'Main'],
+                     compile=['javac', '-J-Xmx512m', 'Main.java'], tools=('javac', 'java'),
+                     limit_address_space=False),
+}
+
+
+class SandboxLimits:
+    def __init__(self, cpu_seconds=2.0, wall_seconds=5.0, memory_mb=256, output_bytes=1 << 16,
+                 compile_seconds=15.0, processes=32):
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_mb = memory_mb
+        self.output_bytes = output_bytes
+        self.compile_seconds = compile_seconds
+        self.processes = processes
+
+    @classmethod
+    def from_env(cls):
+        return cls(cpu_seconds=env_float('QUIZ_SANDBOX_CPU_SECONDS', 2.0),
+                   wall_seconds=env_float('QUIZ_SANDBOX_WALL_SECONDS', 5.0),
+                   memory_mb=env_int('QUIZ_SANDBOX_MEMORY_MB', 256),
+                   output_bytes=env_int('QUIZ_SANDBOX_OUTPUT_BYTES', 1 << 16),
+                   compile_seconds=env_float('QUIZ_SANDBOX_COMPILE_SECONDS', 15.0),
+                   processes=env_int('QUIZ_SANDBOX_PROCESSES', 32))
+
+
+class RunResult:
+    """Outcome of one compile or run: ``status`` is one of the module's
+    outcome constants."""
+
+    def __init__(self, status, stdout='', stderr='', returncode=None, seconds=0.0):
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+
+class Program:
+    """A program written (and compiled, when the language needs it) in its
+    own temp directory. ``result`` is the compile outcome; ``close``
+    removes the directory."""
+
+    def __init__(self, language, workdir, result):
+        self.language = language
+        self.workdir = workdir
+        self.result = result
+
+    @property
+    def ready(self):
+        return self.result.ok
+
+    def close(self):
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def normalize_output(text):
+    """Output as compared with expected output: line endings unified,
+    trailing whitespace and trailing blank lines dropped."""
+    lines = (text or '').replace('\r\n', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).rstrip('\n')
+
+
+def outputs_match(expected, actual):
+    return normalize_output(expected) == normalize_output(actual)
+
+
+class JailError(OSError):
+    """The jail for a run could not be set up."""
+
+
+class _Launcher:
+    """One running ``JAIL`` launcher, used by one thread at a time; its
+    runs get ``uid``."""
+
+    def __init__(self, uid):
+        self.uid = uid
+        config = {'uid': uid, 'root': JAIL_ROOT, 'paths': JAIL_PATHS, 'userns': os.geteuid() != 0,
+                  'outer_uid': os.geteuid(), 'outer_gid': os.getegid()}
+        os.makedirs(JAIL_ROOT, exist_ok=True)
+        self.process = subprocess.Popen([sys.executable, '-I', '-S', '-c', JAIL, json.dumps(config)], cwd='/',
+                                        env=SANDBOX_ENV, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        start_new_session=True)
+        self._buffer = b''
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, request, wall_seconds):
+        """``(returncode, timed_out)`` of one run. Raises ``JailError``
+        when the jail could not be set up and ``OSError`` when the
+        launcher is unusable."""
+        self.process.stdin.write((json.dumps(request) + '\n').encode('utf-8'))
+        self.process.stdin.flush()
+        pid = json.loads(self._read_line(START_SECONDS))['pid']
+        line = self._read_line(wall_seconds, required=False)
+        timed_out = line is None
+        if timed_out:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            line = self._read_line(START_SECONDS)
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise JailError(reply['error'])
+        return reply.get('returncode', -signal.SIGKILL), timed_out
+
+    def _read_line(self, timeout, required=True):
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                if required:
+                    raise OSError("sandbox launcher stopped responding")
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise OSError("sandbox launcher exited")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def close(self):
+        try:
+            self.process.kill()
+            self.process.wait()
+        except OSError:
+            pass
+
+
+class Sandbox:
+    """Compiles and runs programs under ``limits`` on a pool of
+    ``workers`` threads, each driving one jailed run at a time."""
+
+    def __init__(self, limits=None, workers=None, warm=True, uid=60000):
+        self.limits = limits or SandboxLimits()
+        self.workers = workers or max(2, os.cpu_count() or 1)
+        self.warm = warm
+        self.uid = uid
+        self._local = threading.local()
+        self._slots = itertools.count()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sandbox')
+        self._available = {}
+        self._jail_error = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        workers = env_int('QUIZ_SANDBOX_WORKERS', 0) or None
+        uid = env_int('QUIZ_SANDBOX_UID', 60000)
+        warm = os.getenv('QUIZ_SANDBOX_WARM', 'true').lower() not in ('0', 'false', 'no')
+        return cls(SandboxLimits.from_env(), workers, warm, uid)
+
+    def available(self, language):
+        """Whether the toolchain for ``language`` is installed and programs
+        can be jailed."""
+        spec = LANGUAGES.get(language)
+        if spec is None:
+            return False
+        with self._lock:
+            if self._jail_error is None:
+                self._jail_error = self._probe_jail()
+                if self._jail_error:
+                    log.error("🔒 Cannot jail programs (%s), no code will be run", self._jail_error)
+            if self._jail_error:
+                return False
+            if language not in self._available:
+                self._available[language] = all(shutil.which(tool) for tool in spec.tools)
+                if not self._available[language]:
+                    log.info("🧰 No %s toolchain installed, %s programs will not be run", language, language)
+            return self._available[language]
+
+    def _probe_jail(self):
+        """'' when a trivial program runs in the jail, else why not."""
+        workdir = tempfile.mkdtemp(prefix='quiz-sandbox-')
+        try:
+            self._prepare(workdir, 'main.py', '')
+            result = self._execute([], workdir, '', 1, START_SECONDS, 64, 1024, in_process=True)
+            if result.ok:
+                return ''
+            return result.stderr.strip() or f"probe run ended with {result.status}"
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def map(self, function, items):
+        """``[function(item) for item in items]`` on the pool, each call in
+        a copy of the caller's context so metrics follow the job."""
+        futures = [self._pool.submit(contextvars.copy_context().run, function, item) for item in items]
+        return [future.result() for future in futures]
+
+    def compile(self, language, source):
+        """A ``Program`` for ``source``; check ``ready`` before running it."""
+        if not self.available(language):
+            return Program(language, None, RunResult(UNAVAILABLE))
+        spec = LANGUAGES[language]
+        workdir = tempfile.mkdtemp(prefix='quiz-sandbox-')
+        self._prepare(workdir, spec.source_name, source)
+        if spec.compile is None:
+            return Program(language, workdir, RunResult(OK))
+        with quiz_metrics.span("sandbox_compile"):
+            result = self._execute(spec.compile, workdir, '', self.limits.compile_seconds,
+                                   self.limits.compile_seconds, COMPILE_MEMORY_MB, COMPILE_OUTPUT_BYTES,
+                                   processes=COMPILE_PROCESSES, writable=True)
+        if result.status != UNAVAILABLE and not result.ok:
+            quiz_metrics.incr("sandbox_compile_errors")
+            result.status = COMPILE_ERROR
+        return Program(language, workdir, result)
+
+    def run(self, program, stdin):
+        """Run a ready ``program`` on ``stdin``."""
+        if not program.ready:
+            return RunResult(program.result.status, stderr=program.result.stderr)
+        spec = LANGUAGES[program.language]
+        limits = self.limits
+        command = [part.format(memory_mb=limits.memory_mb) for part in spec.run]
+        quiz_metrics.incr("sandbox_runs")
+        result = self._execute(command, program.workdir, stdin, limits.cpu_seconds, limits.wall_seconds,
+                               limits.memory_mb if spec.limit_address_space else None, limits.output_bytes,
+                               in_process=spec.in_process)
+        if not result.ok:
+            quiz_metrics.incr(f"sandbox_{result.status}")
+        return result
+
+    @staticmethod
+    def _prepare(workdir, source_name, source):
+        # The jailed uid reads the directory, and writes it only while compiling
+        os.chmod(workdir, 0o755)
+        path = os.path.join(workdir, source_name)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(source)
+        os.chmod(path, 0o644)
+
+    def _launcher(self):
+        """This thread's launcher, started on first use (a fresh one per
+        run when ``warm`` is off)."""
+        launcher = getattr(self._local, 'launcher', None)
+        if launcher is None or not launcher.alive:
+            launcher = _Launcher(self.uid + next(self._slots) % UID_SLOTS)
+            if self.warm:
+                self._local.launcher = launcher
+        return launcher
+
+    def _request(self, command, workdir, files, cpu_seconds, memory_mb, output_bytes, processes, writable,
+                 in_process):
+        return {'command': command, 'python': in_process, 'workdir': workdir,
+                'files': [handle.name for handle in files], 'writable': writable,
+                'cpu': max(1, math.ceil(cpu_seconds)), 'memory': memory_mb << 20 if memory_mb else 0,
+                'output': output_bytes, 'processes': processes,
+                'tmp_mb': COMPILE_TMP_MB if writable else RUN_TMP_MB, 'env': SANDBOX_ENV}
+
+    def _execute(self, command, workdir, stdin, cpu_seconds, wall_seconds, memory_mb, output_bytes,
+                 processes=None, writable=False, in_process=False):
+        with tempfile.NamedTemporaryFile(dir=workdir) as stdin_file, \
+                tempfile.NamedTemporaryFile(dir=workdir) as stdout_file, \
+                tempfile.NamedTemporaryFile(dir=workdir) as stderr_file:
+            stdin_file.write((stdin or '').encode('utf-8'))
+            stdin_file.flush()
+            request = self._request(command, workdir, (stdin_file, stdout_file, stderr_file), cpu_seconds,
+                                    memory_mb, output_bytes, processes or self.limits.processes, writable,
+                                    in_process)
+            start = time.perf_counter()
+            launcher = None
+            try:
+                launcher = self._launcher()
+                returncode, timed_out = launcher.run(request, wall_seconds)
+            except (OSError, ValueError, KeyError) as error:
+                quiz_metrics.incr("sandbox_jail_failures")
+                if not isinstance(error, JailError) and launcher is not None:
+                    launcher.close()
+                    self._local.launcher = None
+                log.warning("⚠️ Sandbox run failed: %s", error)
+                return RunResult(UNAVAILABLE, stderr=str(error))
+            finally:
+                if launcher is not None and not self.warm:
+                    launcher.close()
+            status = TIMEOUT if timed_out else OK
+            seconds = time.perf_counter() - start
+            stdout_file.seek(0)
+            stdout = stdout_file.read(output_bytes)
+            stderr_file.seek(0, os.SEEK_END)
+            stderr_file.seek(max(0, stderr_file.tell() - STDERR_BYTES))
+            stderr = stderr_file.read().decode('utf-8', 'replace')
+        if status == OK and returncode:
+            # Python ignores SIGXFSZ and fails the write instead, so a full
+            # stdout file counts as hitting the limit too
+            if returncode == -signal.SIGXFSZ or len(stdout) >= output_bytes:
+                status = OUTPUT_LIMIT
+            elif returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+                status = TIMEOUT
+            elif 'MemoryError' in stderr or 'OutOfMemoryError' in stderr:
+                status = MEMORY_LIMIT
+            else:
+                status = RUNTIME_ERROR
+        return RunResult(status, stdout.decode('utf-8', 'replace'), stderr, returncode, seconds)
+
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def get_sandbox():
+    """The process-wide sandbox, created on first use."""
+    global _sandbox
+    if _sandbox is None:
+        with _sandbox_lock:
+            if _sandbox is None:
+                _sandbox = Sandbox.from_env()
+    return _sandbox
@@ -0,0 +1,128 @@
+"""Check generated code questions' test cases against a reference solution.
+
+The model writes each code question's test cases by predicting the
+program's output, and gets the arithmetic wrong often enough that a
+correct student answer can fail. It also writes a reference solution,
+which is executable and far more reliable, so the solution is the oracle:
+
+- a case the solution reproduces is kept
+- a case whose expected output differs is repaired with the solution's
+  output, when that is short printable text; other output is never put
+  in front of students, and the case is dropped instead
+- a case the solution crashes, times out on or prints nothing for is
+  dropped: its input is most likely invalid for the problem
+- a question whose solution disagrees with every one of several cases is
+  dropped: the solution answers a different problem than the cases, and
+  neither can be trusted
+- a question whose solution does not compile, whose language has no
+  toolchain installed, or that the jail failed to run keeps its cases
+  unchecked
+
+All solutions of a quiz are compiled in parallel, then all their cases run
+in parallel, on the shared ``code_sandbox`` pool, in the same jail as
+student submissions. The solution is removed from every question either
+way; it is never shown to students. Repaired output cannot leak the
+service's environment: the jail gives the solution a fixed one.
+"""
+import os
+
+import quiz_logging
+import quiz_metrics
+from code_sandbox import UNAVAILABLE, get_sandbox, normalize_output
+
+log = quiz_logging.get_logger('code_check')
+
+# Longest solution output written into a test case
+REPAIR_CHARS = 2000
+
+
+def validation_enabled():
+    return os.getenv('QUIZ_VALIDATE_CODE', 'true').lower() not in ('0', 'false', 'no')
+
+
+def _repairable(output):
+    """Whether solution ``output`` may become a case's expected output."""
+    if len(output) > REPAIR_CHARS:
+        return False
+    return all(line.isprintable() for line in output.replace('\t', ' ').split('\n'))
+
+
+def _reconcile(question, program, results):
+    """Apply the checks to ``question``; returns it, or None to drop it."""
+    cases = question.get('testCases') or []
+    kept = []
+    agreed = repaired = dropped = 0
+    for case, result in zip(cases, results):
+        actual = normalize_output(result.stdout)
+        if not result.ok or not actual:
+            dropped += 1
+            continue
+        expected = normalize_output(case.get('stdout'))
+        if expected == actual:
+            agreed += 1
+        elif not _repairable(actual):
+            dropped += 1
+            continue
+        else:
+            repaired += 1
+            case = dict(case, stdout=actual + '\n')
+        kept.append(case)
+    quiz_metrics.incr("code_cases_confirmed", agreed)
+    if len(cases) > 1 and repaired and not agreed:
+        log.info("🧪 Dropping code question: its solution disagrees with all %d test cases: %.60s",
+                 len(cases), question.get('question', ''))
+        quiz_metrics.incr("code_questions_dropped")
+        return None
+    if not kept:
+        log.info("🧪 Dropping code question: its solution failed on every test case: %.60s",
+                 question.get('question', ''))
+        quiz_metrics.incr("code_questions_dropped")
+        return None
+    if repaired or dropped:
+        log.info("🧪 Code question %s test cases: %d confirmed, %d repaired, %d dropped",
+                 program.language, agreed, repaired, dropped)
+        quiz_metrics.incr("code_cases_repaired", repaired)
+        quiz_metrics.incr("code_cases_dropped", dropped)
+    question['testCases'] = kept
+    return question
+
+
+def validate_code_questions(questions, sandbox=None):
+    """``questions`` with their code questions checked (see the module
+    docstring; ``QUIZ_VALIDATE_CODE=false`` only strips the solutions).
+    Order is kept; dropped questions are left out."""
+    checks = []
+    enabled = validation_enabled()
+    for question in questions:
+        solution = question.pop('solution', None)
+        if enabled and question.get('type') == 'code' and solution and question.get('testCases'):
+            checks.append((question, solution))
+    if not checks:
+        return questions
+
+    sandbox = sandbox or get_sandbox()
+    with quiz_metrics.span("validate_code"):
+        programs = sandbox.map(lambda check: sandbox.compile(check[0].get('language') or 'python', check[1]),
+                               checks)
+        try:
+            runs = [(program, case['stdin'])
+                    for program, (question, _) in zip(programs, checks) if program.ready
+                    for case in question['testCases']]
+            results = iter(sandbox.map(lambda run: sandbox.run(*run), runs))
+            verdicts = {}
+            for program, (question, _) in zip(programs, checks):
+                if not program.ready:
+                    quiz_metrics.incr("code_validation_skipped")
+                    log.info("🧪 Leaving code question unchecked: solution %s", program.result.status)
+                    continue
+                case_results = [next(results) for _ in question['testCases']]
+                if any(result.status == UNAVAILABLE for result in case_results):
+                    quiz_metrics.incr("code_validation_skipped")
+                    log.info("🧪 Leaving code question unchecked: the sandbox could not run its solution")
+                    continue
+                verdicts[id(question)] = _reconcile(question, program, case_results)
+        finally:
+            for program in programs:
+                program.close()
+    return [question for question in questions
+            if id(question) not in verdicts or verdicts[id(question)] is not None]
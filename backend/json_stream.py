@@ -0,0 +1,140 @@
+"""Incremental parsing of the JSON array of questions an LLM streams back.
+
+The model is asked for a single JSON array of question objects. While the
+reply is still arriving we can already hand out every object that has been
+closed, so callers see the first question after roughly one question's
+worth of tokens instead of after the whole completion.
+
+The same scanner salvages replies that are not valid JSON as a whole: prose
+or a Markdown fence around the array, or an array cut off mid-object when
+the completion hit ``max_tokens``. Every object that was closed is still
+recovered, and only the unfinished tail is lost.
+"""
+import json
+import re
+
+# The characters that can change the scanner's state; everything between
+# them is skipped by the regex engine rather than by a Python loop.
+STRUCTURAL_RE = re.compile(r'[\[\]{}"\\]')
+# Start of an array of objects; a bare '[' in surrounding prose is not enough
+ARRAY_START_RE = re.compile(r'\[\s*\{')
+
+
+class IncrementalArrayParser:
+    """Pull complete top-level objects out of a JSON array fed in chunks.
+
+    The scanner tracks string and escape state, so brackets inside string
+    values never confuse it. Anything before the opening ``[{`` (for
+    example a Markdown code fence or a sentence of prose) is skipped. Only
+    the text of the object currently being read is kept in memory, and each
+    chunk is scanned once, so the cost is linear in the reply length.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.started = False
+        self.done = False
+        self._buffer = []
+        self._pending = ''
+        self.skipped = 0
+        self.parsed = 0
+
+    @property
+    def truncated(self):
+        """True when the array was opened but never closed."""
+        return self.started and not self.done
+
+    def feed(self, chunk):
+        """Consume ``chunk`` and return the objects completed by it."""
+        completed = []
+        if self.done:
+            return completed
+        if not self.started:
+            chunk = self._find_start(chunk)
+            if chunk is None:
+                return completed
+
+        # Index in this chunk where the current object's text begins; 0 when
+        # the object was opened in an earlier chunk
+        obj_start = 0 if self.depth >= 2 else None
+        skip_to = 0
+        if self.escaped:
+            self.escaped = False
+            skip_to = 1
+        for match in STRUCTURAL_RE.finditer(chunk):
+            i = match.start()
+            if i < skip_to:
+                continue
+            ch = match.group()
+            if self.in_string:
+                if ch == '\\':
+                    if i + 1 < len(chunk):
+                        skip_to = i + 2
+                    else:
+                        self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                self.in_string = True
+            elif ch in '[{':
+                self.depth += 1
+                if self.depth == 2:
+                    obj_start = i
+                    self._buffer = []
+            elif ch in ']}':
+                self.depth -= 1
+                if self.depth == 1:
+                    self._buffer.append(chunk[obj_start:i + 1])
+                    obj_start = None
+                    obj = self._finish_object()
+                    if obj is not None:
+                        completed.append(obj)
+                elif self.depth == 0:
+                    self.done = True
+                    return completed
+        if obj_start is not None:
+            self._buffer.append(chunk[obj_start:])
+        return completed
+
+    def _find_start(self, chunk):
+        """Return the part of the input after the opening ``[``, or None if
+        it has not arrived yet."""
+        text = self._pending + chunk
+        match = ARRAY_START_RE.search(text)
+        if match is None:
+            # A '[' at the very end may be completed by the next chunk
+            bracket = text.rfind('[')
+            self._pending = text[bracket:] if bracket >= 0 and not text[bracket + 1:].strip() else ''
+            return None
+        self._pending = ''
+        self.started = True
+        self.depth = 1
+        return text[match.start() + 1:]
+
+    def _finish_object(self):
+        text = ''.join(self._buffer)
+        self._buffer = []
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            self.skipped += 1
+            return None
+        if not isinstance(obj, dict):
+            self.skipped += 1
+            return None
+        self.parsed += 1
+        return obj
+
+
+def salvage_objects(text):
+    """Recover the complete objects of the first array of objects in a
+    reply that is not valid JSON as a whole.
+
+    Returns ``(objects, parser)``; the parser tells whether the array was
+    ``truncated`` and how many objects were ``skipped`` as malformed.
+    """
+    parser = IncrementalArrayParser()
+    return parser.feed(text), parser
@@ -0,0 +1,225 @@
+"""Pluggable chat-completions providers and hedged requests.
+
+A ``Provider`` is a named endpoint, model and key behind a pooled
+``MistralClient``. With hedging on (``QUIZ_HEDGE=true``), a generation
+request goes to the primary provider first; if it has not produced a
+usable reply by a deadline taken from the primary's recent latencies
+(``QUIZ_HEDGE_PERCENTILE``, p95 by default), the same payload is sent to
+the alternate provider as well. The first reply the caller accepts wins
+and the other attempt is cancelled.
+
+The alternate defaults to the primary endpoint and key, so setting only
+``QUIZ_HEDGE_MODEL`` hedges onto another model of the same provider:
+
+    QUIZ_HEDGE=true
+    QUIZ_HEDGE_API_URL=https://...       # default: MISTRAL_API_URL
+    QUIZ_HEDGE_API_KEY=...               # default: MISTRAL_API_KEY
+    QUIZ_HEDGE_AUTH_HEADER=api-key       # default: Authorization (Bearer)
+    QUIZ_HEDGE_MODEL=mistral-small       # default: the payload's model
+
+The deadline adapts once ``HEDGE_MIN_SAMPLES`` primary calls have been
+timed, so it is most effective in long-lived processes (worker mode,
+batch runs); before that ``QUIZ_HEDGE_DELAY_MS`` is used.
+
+``requests`` cannot abort a call already on the wire, so a cancelled
+attempt stops retrying but its connection stays busy until the reply
+arrives; leave headroom in ``MISTRAL_POOL_SIZE`` when hedging.
+"""
+import bisect
+import collections
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import quiz_logging
+import quiz_metrics
+from mistral_client import MistralClient, RequestCancelled, get_client
+from quiz_env import env_float, env_int
+
+log = quiz_logging.get_logger('providers')
+
+# Primary latencies kept for the deadline, and how many are needed before
+# the percentile is trusted over the configured initial delay
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+
+
+class Provider:
+    """One chat-completions endpoint. ``model`` (when set) replaces the
+    model named in each payload."""
+
+    def __init__(self, name, client, model=None):
+        self.name = name
+        self.client = client
+        self.model = model
+
+    def chat(self, payload, cancel=None):
+        if self.model:
+            payload = dict(payload, model=self.model)
+        return self.client.chat(payload, cancel=cancel)
+
+    def chat_stream(self, payload):
+        if self.model:
+            payload = dict(payload, model=self.model)
+        return self.client.chat_stream(payload)
+
+
+class LatencyWindow:
+    """The most recent call latencies, kept sorted for percentile lookups."""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self._recent = collections.deque(maxlen=size)
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            if len(self._recent) == self._recent.maxlen:
+                del self._sorted[bisect.bisect_left(self._sorted, self._recent[0])]
+            self._recent.append(seconds)
+            bisect.insort(self._sorted, seconds)
+
+    def __len__(self):
+        return len(self._recent)
+
+    def percentile(self, pct):
+        with self._lock:
+            if not self._sorted:
+                return None
+            index = min(len(self._sorted) - 1, max(0, math.ceil(len(self._sorted) * pct / 100) - 1))
+            return self._sorted[index]
+
+
+class HedgedRequester:
+    """Send a request to ``primary`` and, past the deadline, to
+    ``alternate`` too; return the first reply that ``accept`` takes."""
+
+    def __init__(self, primary, alternate, percentile=95, initial_delay=2.0, min_delay=0.05,
+                 max_workers=32):
+        self.primary = primary
+        self.alternate = alternate
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.latencies = LatencyWindow()
+        self.stats = {"requests": 0, "hedged": 0, "hedge_won": 0, "primary_won": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        # Losing attempts keep their worker until their HTTP call returns
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+
+    @classmethod
+    def from_env(cls, primary_client):
+        primary = Provider('primary', primary_client)
+        alternate_client = MistralClient.from_env(
+            api_url=os.getenv('QUIZ_HEDGE_API_URL') or primary_client.api_url,
+            api_key=os.getenv('QUIZ_HEDGE_API_KEY') or os.getenv('MISTRAL_API_KEY'),
+            auth_header=os.getenv('QUIZ_HEDGE_AUTH_HEADER', 'Authorization'),
+        )
+        alternate = Provider('alternate', alternate_client, model=os.getenv('QUIZ_HEDGE_MODEL') or None)
+        return cls(primary, alternate,
+                   percentile=env_float('QUIZ_HEDGE_PERCENTILE', 95),
+                   initial_delay=env_float('QUIZ_HEDGE_DELAY_MS', 2000) / 1000,
+                   min_delay=env_float('QUIZ_HEDGE_MIN_DELAY_MS', 50) / 1000,
+                   max_workers=env_int('QUIZ_HEDGE_WORKERS', 32))
+
+    def deadline(self):
+        """Seconds to wait for the primary before hedging."""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return self.initial_delay
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _attempt(self, provider, payload, accept, cancel):
+        stage = "api_request" if provider is self.primary else "api_hedge"
+        start = time.perf_counter()
+        with quiz_metrics.span(stage):
+            response = provider.chat(payload, cancel=cancel)
+        if provider is self.primary:
+            self.latencies.add(time.perf_counter() - start)
+        if cancel.is_set():
+            # The other attempt already won; don't parse or count this reply
+            response.close()
+            raise RequestCancelled(f"{provider.name} reply arrived after the race was decided")
+        result = accept(response)
+        if not result:
+            raise ValueError(f"{provider.name} reply had no usable questions")
+        return result
+
+    def _submit(self, provider, payload, accept, cancel):
+        # Run in a copy of the caller's context so metrics and the debug log
+        # buffer follow the request onto the pool thread
+        ctx = contextvars.copy_context()
+        return self._pool.submit(ctx.run, self._attempt, provider, payload, accept, cancel)
+
+    def request(self, payload, accept):
+        """Return ``accept(response)`` for the first provider reply it
+        accepts. ``accept`` raises (or returns nothing) for unusable replies;
+        when every attempt fails the last error is raised."""
+        self._count("requests")
+        cancels = {self.primary: threading.Event(), self.alternate: threading.Event()}
+        primary = self._submit(self.primary, payload, accept, cancels[self.primary])
+        deadline = self.deadline()
+        done, _ = wait([primary], timeout=deadline)
+        if done:
+            try:
+                result = primary.result()
+            except Exception:
+                self._count("failed")
+                raise
+            self._count("primary_won")
+            return result
+
+        self._count("hedged")
+        quiz_metrics.incr("hedge_fired")
+        log.info("🪁 Primary has not answered in %.0f ms, hedging to %s",
+                 deadline * 1000, self.alternate.model or self.alternate.client.api_url)
+        futures = {primary: self.primary,
+                   self._submit(self.alternate, payload, accept, cancels[self.alternate]): self.alternate}
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    log.info("⚠️ %s attempt failed: %s", futures[future].name, e)
+                    error = e
+                    continue
+                for provider, cancel in cancels.items():
+                    if provider is not futures[future]:
+                        cancel.set()
+                if futures[future] is self.alternate:
+                    self._count("hedge_won")
+                    quiz_metrics.incr("hedge_won")
+                else:
+                    self._count("primary_won")
+                return result
+        self._count("failed")
+        raise error
+
+
+def hedging_enabled():
+    return os.getenv('QUIZ_HEDGE', '').lower() in ('1', 'true', 'yes')
+
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger():
+    """The process-wide hedged requester, or None when hedging is off."""
+    global _hedger
+    if not hedging_enabled():
+        return None
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = HedgedRequester.from_env(get_client())
+    return _hedger
@@ -0,0 +1,245 @@
+"""Shared HTTP client for the Mistral chat-completions endpoint.
+
+A long-lived process (worker mode, batch runs) reuses one pooled
+``requests.Session`` so connections and TLS sessions survive across quizzes,
+and every call is bounded by connect/read timeouts. Transient failures
+(429, 5xx gateways, timeouts) are retried with backoff before the caller
+gives up and falls back.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from quiz_env import env_float, env_int
+
+# Child of the generator's "quiz" logger, so retries land in the same
+# stderr output and per-job debug buffer
+log = logging.getLogger("quiz.mistral")
+
+DEFAULT_API_URL = "https://api.mistral.ai/v1/chat/completions"
+
+# Statuses worth another attempt; anything else (400, 401, 403, ...) is final
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class RequestCancelled(Exception):
+    """Raised when a call's cancel event is set before it could complete."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to stay under the provider's rate limit.
+
+    ``rate`` tokens are added per second up to ``capacity``; ``acquire``
+    blocks until a token is available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, returning the number of seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def parse_retry_after(value):
+    """Seconds to wait according to a Retry-After header, or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by a total wait budget."""
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=8.0, max_total_wait=20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total_wait = max_total_wait
+
+    def delay_for(self, retry, response=None):
+        """Delay before retry number ``retry`` (1-based); Retry-After wins."""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+class MistralClient:
+    """Keep-alive client around a chat-completions endpoint.
+
+    Any OpenAI-compatible endpoint works; ``auth_header`` names the header
+    carrying the key (``Authorization`` sends it as a Bearer token, any
+    other header sends the bare key).
+    """
+
+    def __init__(self, api_key, api_url=DEFAULT_API_URL, connect_timeout=5.0,
+                 read_timeout=60.0, pool_connections=2, pool_maxsize=8, rate_limiter=None,
+                 retry_policy=None, auth_header="Authorization"):
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=0)
+        self.stats = {"calls": 0, "retries": 0, "retry_wait_seconds": 0.0, "exhausted": 0}
+        self._stats_lock = threading.Lock()
+        self.session = requests.Session()
+        # pool_block keeps the number of open connections at pool_maxsize;
+        # extra callers wait for a free connection instead of opening more.
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            auth_header: f"Bearer {api_key}" if auth_header == "Authorization" else api_key,
+            "Content-Type": "application/json",
+        })
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """Client configured from the ``MISTRAL_*`` variables; keyword
+        arguments override individual settings (e.g. another endpoint)."""
+        rate = env_float('MISTRAL_RATE_LIMIT_RPS', 1)
+        rate_limiter = TokenBucket(rate, env_float('MISTRAL_RATE_LIMIT_BURST', max(1, rate))) if rate > 0 else None
+        settings = dict(
+            api_key=os.getenv('MISTRAL_API_KEY'),
+            api_url=os.getenv('MISTRAL_API_URL', DEFAULT_API_URL),
+            connect_timeout=env_float('MISTRAL_CONNECT_TIMEOUT', 5),
+            read_timeout=env_float('MISTRAL_READ_TIMEOUT', 60),
+            pool_maxsize=env_int('MISTRAL_POOL_SIZE', 8),
+            rate_limiter=rate_limiter,
+            retry_policy=RetryPolicy(
+                max_retries=env_int('MISTRAL_MAX_RETRIES', 3),
+                max_total_wait=env_float('MISTRAL_RETRY_MAX_WAIT', 20),
+            ),
+        )
+        settings.update(overrides)
+        return cls(**settings)
+
+    def chat(self, payload, cancel=None):
+        """POST a chat-completions payload and return the final response.
+
+        Retryable statuses and connection errors/timeouts are retried under
+        the retry policy. When retries run out the last response is returned
+        (or the last exception re-raised) so the caller can fall back.
+
+        Setting the ``cancel`` event stops further attempts and retry waits
+        with ``RequestCancelled``; a request already on the wire is left to
+        finish, since ``requests`` cannot abort it.
+        """
+        return self._post(payload, cancel=cancel)
+
+    def chat_stream(self, payload):
+        """Stream a completion, yielding content deltas as they arrive.
+
+        Retries only cover getting the stream started; once content is
+        flowing, a broken connection is raised to the caller. A non-200
+        status raises ``requests.HTTPError``.
+        """
+        response = self._post(dict(payload, stream=True), stream=True)
+        with response:
+            response.raise_for_status()
+            for raw_line in response.iter_lines():
+                line = raw_line.decode('utf-8')
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                event = json.loads(data)
+                for choice in event.get('choices', []):
+                    delta = (choice.get('delta') or {}).get('content')
+                    if delta:
+                        yield delta
+
+    def _post(self, payload, stream=False, cancel=None):
+        policy = self.retry_policy
+        retries = 0
+        waited = 0.0
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise RequestCancelled(f"cancelled after {retries} retries")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            error = response = None
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if response is not None and response.status_code not in RETRYABLE_STATUS:
+                self._record(retries, waited, exhausted=False)
+                return response
+
+            reason = error if error is not None else f"status {response.status_code}"
+            delay = policy.delay_for(retries + 1, response)
+            if retries >= policy.max_retries or waited + delay > policy.max_total_wait:
+                self._record(retries, waited, exhausted=True)
+                log.warning("⚠️ Giving up after %d retries (%.1fs waited): %s", retries, waited, reason)
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None:
+                response.close()
+            retries += 1
+            log.info("🔁 Retry %d/%d in %.2fs after %s", retries, policy.max_retries, delay, reason)
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+            waited += delay
+
+    def _record(self, retries, waited, exhausted):
+        with self._stats_lock:
+            self.stats["calls"] += 1
+            self.stats["retries"] += retries
+            self.stats["retry_wait_seconds"] += waited
+            self.stats["exhausted"] += int(exhausted)
+        if retries:
+            log.info("📊 Mistral call needed %d retries, waited %.2fs", retries, waited)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MistralClient.from_env()
+    return _client
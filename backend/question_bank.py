@@ -0,0 +1,400 @@
+"""Question bank: reuse questions across near-duplicate documents.
+
+Many uploads are lightly edited copies of earlier documents (a new date,
+an added paragraph), which the exact-text quiz cache misses. The bank
+keeps every API-generated question together with a fingerprint of its
+source document, so a quiz for a near-duplicate can be assembled from
+banked questions and the API asked only about the new material.
+
+Per source document we store:
+- a 64-bit SimHash over word 3-shingles, which differs in only a few bits
+  between lightly edited copies and in about half of them between
+  unrelated documents
+- a CRC32 per paragraph, to tell which paragraphs of a new upload are new
+- each question with its topic terms (content words of the question that
+  occur in the source), to drop questions whose topic was edited out
+
+Rows live in SQLite like the quiz cache. Lookups go through an in-memory
+``DocumentIndex`` built from flat ``array`` tables sorted on 16-bit
+fingerprint blocks and on paragraph hashes, so finding candidates costs a
+few binary searches. The block tables only guarantee finding documents
+within 3 bits, so a banked document farther than that from the upload
+matches only if the two share a paragraph; ``QUIZ_BANK_MAX_DISTANCE``
+(default 12) bounds those. The sorted tables are saved next to the
+database and only documents added since are indexed at start-up.
+"""
+import bisect
+import json
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+
+from quiz_cache import normalize_text
+from quiz_env import env_int
+from term_scoring import STOP_WORDS, TOKEN_RE
+
+DEFAULT_BANK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'question_bank.sqlite3')
+
+SHINGLE_WORDS = 3
+WORD_RE = re.compile(r"\w+")
+PARAGRAPH_RE = re.compile(r"\n{2,}")
+# Four 16-bit blocks: two fingerprints within 3 bits agree exactly on at
+# least one block, so the block tables find them without a scan. Farther
+# ones are only found through a shared paragraph, so a document sharing
+# none with the upload matches only within BLOCK_DISTANCE bits
+BLOCK_SHIFTS = (0, 16, 32, 48)
+BLOCK_MASK = 0xFFFF
+BLOCK_DISTANCE = len(BLOCK_SHIFTS) - 1
+POSITION_MASK = 0xFFFFFFFF
+# Lightly edited copies sharing a paragraph sit under this; unrelated
+# documents around 32, though among hundreds of thousands a few come
+# within 12 bits by chance
+DEFAULT_MAX_DISTANCE = 12
+# Paragraph hashes indexed per document: the smallest few, a sample that an
+# added or edited paragraph rarely changes entirely
+PARAGRAPH_SAMPLE = 4
+# Paragraphs shared by more documents than this (boilerplate) find no candidates
+MAX_PARAGRAPH_POSTINGS = 64
+# Documents indexed outside the sorted tables before they are merged in
+TAIL_LIMIT = 256
+# Share of a banked question's topic terms the new document must still contain
+MIN_TERM_COVERAGE = 0.8
+MIN_PARAGRAPH_CHARS = 40
+
+INDEX_MAGIC = b'QBIX1\0\0\0'
+_HEADER = struct.Struct('<8sQQQ')
+# Bit j of each byte value, for counting set bits column-wise in C
+_BIT_TABLES = [bytes((value >> j) & 1 for value in range(256)) for j in range(8)]
+
+
+def paragraph_hash(paragraph):
+    """CRC32 of a normalized paragraph, or None for one too short (a
+    heading, a page number) to identify its document."""
+    normalized = normalize_text(paragraph).lower()
+    if len(normalized) < MIN_PARAGRAPH_CHARS:
+        return None
+    return zlib.crc32(normalized.encode('utf-8'))
+
+
+def paragraph_hashes(text):
+    hashes = {paragraph_hash(p) for p in PARAGRAPH_RE.split(text or '')}
+    hashes.discard(None)
+    return array('I', sorted(hashes))
+
+
+def simhash(text):
+    """64-bit SimHash of ``text`` over word 3-shingles."""
+    words = [w.encode('utf-8') for w in WORD_RE.findall((text or '').lower())]
+    hashes = array('Q')
+    for i in range(max(1, len(words) - SHINGLE_WORDS + 1)):
+        shingle = b" ".join(words[i:i + SHINGLE_WORDS])
+        hashes.append(zlib.crc32(shingle) | zlib.crc32(shingle, 0x9E3779B9) << 32)
+    if sys.byteorder == 'big':
+        hashes.byteswap()
+    # Byte k of every hash is one strided slice; translating it to bit j
+    # and counting the ones tallies bit 8k+j over all shingles
+    data = hashes.tobytes()
+    half = len(hashes) / 2
+    fingerprint = 0
+    for k in range(8):
+        column = data[k::8]
+        for j, table in enumerate(_BIT_TABLES):
+            if column.translate(table).count(1) > half:
+                fingerprint |= 1 << (8 * k + j)
+    return fingerprint
+
+
+def content_terms(text):
+    return {t for t in TOKEN_RE.findall((text or '').lower()) if t not in STOP_WORDS}
+
+
+def question_terms(question, document_terms):
+    """Content words of a question's stem and options found in its source."""
+    parts = [str(question.get('question', ''))]
+    if isinstance(question.get('options'), list):
+        parts.extend(str(option) for option in question['options'])
+    return sorted(content_terms(" ".join(parts)) & document_terms)
+
+
+def _to_signed(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class DocumentIndex:
+    """Fingerprints and paragraph hashes of banked documents.
+
+    Position ``i`` holds ``fingerprints[i]`` and ``doc_ids[i]``. Each sorted
+    table holds ``key << 32 | position`` entries, one table per fingerprint
+    block and one for paragraph hashes. Documents added since the last
+    ``compact`` sit in a small tail that is checked directly.
+    """
+
+    def __init__(self):
+        self.fingerprints = array('Q')
+        self.doc_ids = array('q')
+        self.block_tables = [array('Q') for _ in BLOCK_SHIFTS]
+        self.paragraph_table = array('Q')
+        self.sorted_count = 0
+        self._tail_paragraphs = {}
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    @property
+    def last_doc_id(self):
+        return self.doc_ids[-1] if self.doc_ids else 0
+
+    def add(self, doc_id, fingerprint, hashes):
+        """Index a document; ``hashes`` are its sorted paragraph hashes."""
+        position = len(self.fingerprints)
+        self.fingerprints.append(fingerprint)
+        self.doc_ids.append(doc_id)
+        for h in hashes[:PARAGRAPH_SAMPLE]:
+            self._tail_paragraphs.setdefault(h, []).append(position)
+
+    def compact(self):
+        """Merge the tail into the sorted tables."""
+        start = self.sorted_count
+        if start == len(self.fingerprints):
+            return
+        tail = range(start, len(self.fingerprints))
+        for table, shift in zip(self.block_tables, BLOCK_SHIFTS):
+            merged = sorted(list(table) + [((self.fingerprints[i] >> shift) & BLOCK_MASK) << 32 | i for i in tail])
+            table[:] = array('Q', merged)
+        new_keys = [h << 32 | i for h, positions in self._tail_paragraphs.items() for i in positions]
+        self.paragraph_table[:] = array('Q', sorted(list(self.paragraph_table) + new_keys))
+        self.sorted_count = len(self.fingerprints)
+        self._tail_paragraphs = {}
+
+    @staticmethod
+    def _postings(table, key):
+        low = bisect.bisect_left(table, key << 32)
+        high = bisect.bisect_left(table, (key + 1) << 32, low)
+        return low, high
+
+    def candidates(self, fingerprint, hashes):
+        """Positions of the documents sharing a fingerprint block with the
+        upload, and of those sharing a paragraph hash."""
+        by_block = set()
+        for table, shift in zip(self.block_tables, BLOCK_SHIFTS):
+            low, high = self._postings(table, (fingerprint >> shift) & BLOCK_MASK)
+            by_block.update(table[j] & POSITION_MASK for j in range(low, high))
+        # Tail documents sharing no paragraph are still compared by fingerprint
+        by_block.update(range(self.sorted_count, len(self.fingerprints)))
+        by_paragraph = set()
+        for h in hashes:
+            low, high = self._postings(self.paragraph_table, h)
+            tail = self._tail_paragraphs.get(h, ())
+            if high - low + len(tail) > MAX_PARAGRAPH_POSTINGS:
+                continue
+            by_paragraph.update(self.paragraph_table[j] & POSITION_MASK for j in range(low, high))
+            by_paragraph.update(tail)
+        return by_block, by_paragraph
+
+    def find(self, fingerprint, hashes, max_distance):
+        """``[(distance, doc_id), ...]`` within ``max_distance`` bits (within
+        ``BLOCK_DISTANCE`` for documents sharing no paragraph hash), nearest
+        first and newest first among equals."""
+        by_block, by_paragraph = self.candidates(fingerprint, hashes)
+        block_distance = min(max_distance, BLOCK_DISTANCE)
+        matches = []
+        for position in by_block | by_paragraph:
+            distance = bin(self.fingerprints[position] ^ fingerprint).count('1')
+            if distance <= (max_distance if position in by_paragraph else block_distance):
+                matches.append((distance, -self.doc_ids[position]))
+        return [(distance, -negated) for distance, negated in sorted(matches)]
+
+    def save(self, path):
+        """Write the sorted part of the index atomically."""
+        self.compact()
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, len(self.fingerprints), len(self.paragraph_table), self.last_doc_id))
+            self.fingerprints.tofile(f)
+            self.doc_ids.tofile(f)
+            for table in self.block_tables:
+                table.tofile(f)
+            self.paragraph_table.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """The index saved at ``path``, or an empty one if it is missing or
+        unreadable (it is rebuilt from the database)."""
+        index = cls()
+        try:
+            with open(path, 'rb') as f:
+                magic, count, paragraph_count, _ = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != INDEX_MAGIC:
+                    return index
+                index.fingerprints.fromfile(f, count)
+                index.doc_ids.fromfile(f, count)
+                for table in index.block_tables:
+                    table.fromfile(f, count)
+                index.paragraph_table.fromfile(f, paragraph_count)
+        except (OSError, EOFError, struct.error):
+            return cls()
+        index.sorted_count = count
+        return index
+
+
+class BankMatch:
+    """Banked questions that still fit a new document, plus the paragraphs
+    of that document its source did not have."""
+
+    def __init__(self, doc_id, distance, questions, new_text):
+        self.doc_id = doc_id
+        self.distance = distance
+        self.questions = questions
+        self.new_text = new_text
+
+
+class QuestionBank:
+    def __init__(self, path=DEFAULT_BANK_PATH, max_distance=DEFAULT_MAX_DISTANCE):
+        self.path = path
+        self.index_path = f"{path}.index"
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bank_documents ("
+            " id INTEGER PRIMARY KEY,"
+            " fingerprint INTEGER NOT NULL,"
+            " paragraphs BLOB NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bank_questions ("
+            " doc_id INTEGER NOT NULL,"
+            " question TEXT NOT NULL,"
+            " terms TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bank_questions_doc ON bank_questions (doc_id)")
+        self.index = DocumentIndex.load(self.index_path)
+        if self.index.last_doc_id > self._max_doc_id():
+            # Saved for another database; start over
+            self.index = DocumentIndex()
+        self._refresh()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('QUIZ_BANK_PATH', DEFAULT_BANK_PATH),
+            max_distance=env_int('QUIZ_BANK_MAX_DISTANCE', DEFAULT_MAX_DISTANCE),
+        )
+
+    def _max_doc_id(self):
+        (max_id,) = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM bank_documents").fetchone()
+        return max_id
+
+    def _refresh(self):
+        """Index documents added since (by this or another process)."""
+        rows = self._conn.execute(
+            "SELECT id, fingerprint, paragraphs FROM bank_documents WHERE id > ? ORDER BY id",
+            (self.index.last_doc_id,),
+        ).fetchall()
+        for doc_id, fingerprint, blob in rows:
+            hashes = array('I')
+            hashes.frombytes(blob)
+            self.index.add(doc_id, _to_unsigned(fingerprint), hashes)
+        if len(self.index) - self.index.sorted_count > TAIL_LIMIT:
+            self.index.save(self.index_path)
+
+    def find(self, text):
+        """The nearest banked source of ``text`` as a ``BankMatch``, or None."""
+        fingerprint = simhash(text)
+        hashes = paragraph_hashes(text)
+        with self._lock:
+            self._refresh()
+            matches = self.index.find(fingerprint, hashes, self.max_distance)
+            if not matches:
+                return None
+            distance, doc_id = matches[0]
+            (blob,) = self._conn.execute(
+                "SELECT paragraphs FROM bank_documents WHERE id = ?", (doc_id,)).fetchone()
+            rows = self._conn.execute(
+                "SELECT question, terms FROM bank_questions WHERE doc_id = ? ORDER BY rowid", (doc_id,)).fetchall()
+        source_hashes = array('I')
+        source_hashes.frombytes(blob)
+        source_hashes = set(source_hashes)
+        document_terms = content_terms(text)
+        questions = []
+        for question, terms in rows:
+            terms = terms.split()
+            if terms and sum(t in document_terms for t in terms) < MIN_TERM_COVERAGE * len(terms):
+                continue
+            questions.append(json.loads(question))
+        new_paragraphs = []
+        for paragraph in PARAGRAPH_RE.split(text):
+            h = paragraph_hash(paragraph)
+            if h is not None and h not in source_hashes:
+                new_paragraphs.append(paragraph.strip())
+        new_text = "\n\n".join(new_paragraphs)
+        return BankMatch(doc_id, distance, questions, new_text)
+
+    def add(self, text, questions):
+        """Bank ``questions`` generated for ``text``; returns the document id,
+        or None when an identical document is already banked."""
+        if not questions:
+            return None
+        fingerprint = simhash(text)
+        hashes = paragraph_hashes(text)
+        document_terms = content_terms(text)
+        with self._lock:
+            self._refresh()
+            for distance, doc_id in self.index.find(fingerprint, hashes, 0):
+                (blob,) = self._conn.execute(
+                    "SELECT paragraphs FROM bank_documents WHERE id = ?", (doc_id,)).fetchone()
+                if blob == hashes.tobytes():
+                    return None
+            self._conn.execute("BEGIN")
+            cursor = self._conn.execute(
+                "INSERT INTO bank_documents (fingerprint, paragraphs, created_at) VALUES (?, ?, ?)",
+                (_to_signed(fingerprint), hashes.tobytes(), time.time()),
+            )
+            doc_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO bank_questions (doc_id, question, terms) VALUES (?, ?, ?)",
+                [(doc_id, json.dumps(q), " ".join(question_terms(q, document_terms))) for q in questions],
+            )
+            self._conn.execute("COMMIT")
+            self._refresh()
+        return doc_id
+
+    def stats(self):
+        with self._lock:
+            (documents,) = self._conn.execute("SELECT COUNT(*) FROM bank_documents").fetchone()
+            (questions,) = self._conn.execute("SELECT COUNT(*) FROM bank_questions").fetchone()
+        return {"documents": documents, "questions": questions}
+
+    def close(self):
+        self._conn.close()
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def bank_disabled():
+    return os.getenv('QUIZ_BANK_DISABLED', '').lower() in ('1', 'true', 'yes')
+
+
+def get_bank():
+    """Return the process-wide question bank, opening it on first use."""
+    global _bank
+    if _bank is None:
+        with _bank_lock:
+            if _bank is None:
+                _bank = QuestionBank.from_env()
+    return _bank
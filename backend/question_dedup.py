@@ -0,0 +1,161 @@
+"""Near-duplicate detection for generated questions.
+
+Questions are compared on the content words of their stems, and two
+questions only count as duplicates when their correct answers also agree.
+A stem's shingles are its content words (stop words dropped) and each
+adjacent pair of them, so "time complexity of merge sort" and "time
+complexity of heap sort" share only half their shingles, while "What is"
+vs "What's" rewordings do not matter at all. Each stem gets a MinHash
+signature, and an LSH index over signature bands turns "find similar
+questions" into a few dict lookups, so filtering stays roughly linear in
+the number of questions instead of comparing every pair; the candidates
+found are then checked on their exact shingle sets.
+"""
+import hashlib
+import json
+import re
+from array import array
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+STOP_WORDS = frozenset("""
+a an the of in on at to for from by with and or but not no is are was were be been being do does did
+has have had it its this that these those which what who whom whose when where why how following
+best most correct true false statement describes describe s t
+""".split())
+
+
+def _normalize(text):
+    return re.sub(r'\W+', ' ', str(text).lower()).strip()
+
+
+def question_parts(question):
+    """Normalized ``(stem, correct_answer)``; the answer is '' for code questions."""
+    answer = ''
+    options = question.get('options')
+    letter = str(question.get('answer') or '').strip().upper()
+    if isinstance(options, list) and len(letter) == 1 and 'A' <= letter <= 'Z':
+        index = ord(letter) - ord('A')
+        if index < len(options):
+            answer = _normalize(options[index])
+    return _normalize(question.get('question', '')), answer
+
+
+def shingles(text):
+    """Content words and adjacent content-word pairs of normalized
+    ``text``; all its words when it has no content words."""
+    words = text.split()
+    content = [word for word in words if word not in STOP_WORDS] or words or [text]
+    return frozenset(content + [first + ' ' + second for first, second in zip(content, content[1:])])
+
+
+def minhash(shingle_set):
+    """MinHash signature of ``shingle_set`` as a tuple of NUM_PERM ints.
+
+    One SHAKE-128 digest per shingle yields all NUM_PERM 32-bit hashes at
+    once, instead of NUM_PERM hash computations in Python.
+    """
+    rows = [array('I', hashlib.shake_128(shingle.encode('utf-8')).digest(4 * NUM_PERM))
+            for shingle in shingle_set]
+    return tuple(map(min, zip(*rows)))
+
+
+def similarity(set_a, set_b):
+    """Jaccard similarity of two shingle sets."""
+    if not set_a or not set_b:
+        return 0.0
+    shared = len(set_a & set_b)
+    return shared / (len(set_a) + len(set_b) - shared)
+
+
+class NearDuplicateIndex:
+    """LSH index of question signatures.
+
+    With 16 bands of 8 rows, pairs above roughly 0.8 similarity almost
+    always share a bucket, and pairs below 0.4 almost never do, so stems
+    built from one template are not all compared with each other.
+    Candidates are then checked against ``threshold`` on their shingles.
+    """
+
+    def __init__(self, threshold=0.7):
+        self.threshold = threshold
+        self.shingles = []
+        self.answers = []
+        self._buckets = {}
+
+    def _bands(self, signature):
+        for band in range(BANDS):
+            yield (band, signature[band * ROWS:(band + 1) * ROWS])
+
+    def find(self, shingle_set, answer='', signature=None):
+        """Index of a stored near-duplicate, or None.
+
+        A similar stem with a different correct answer is a different
+        question ("binary search" vs "linear search" complexity).
+        """
+        checked = set()
+        for band_key in self._bands(signature or minhash(shingle_set)):
+            for candidate in self._buckets.get(band_key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                other_answer = self.answers[candidate]
+                if answer and other_answer and answer != other_answer:
+                    continue
+                if similarity(shingle_set, self.shingles[candidate]) >= self.threshold:
+                    return candidate
+        return None
+
+    def add(self, shingle_set, answer='', signature=None):
+        index = len(self.shingles)
+        self.shingles.append(shingle_set)
+        self.answers.append(answer)
+        for band_key in self._bands(signature or minhash(shingle_set)):
+            self._buckets.setdefault(band_key, []).append(index)
+        return index
+
+    def add_question(self, question):
+        """Add ``question`` unless it duplicates one already indexed.
+
+        Returns True when the question was new.
+        """
+        stem, answer = question_parts(question)
+        shingle_set = shingles(stem)
+        signature = minhash(shingle_set)
+        if self.find(shingle_set, answer, signature) is not None:
+            return False
+        self.add(shingle_set, answer, signature)
+        return True
+
+    def save(self, path):
+        """Persist the index, e.g. one index file per course."""
+        with open(path, 'w') as f:
+            json.dump({"threshold": self.threshold, "shingles": [sorted(s) for s in self.shingles],
+                       "answers": self.answers}, f)
+
+    @classmethod
+    def load(cls, path):
+        """An index saved by ``save``. Files from before word shingles
+        hold only signatures, which cannot be checked, and load empty."""
+        with open(path) as f:
+            data = json.load(f)
+        index = cls(threshold=data.get('threshold', 0.7))
+        for shingle_list, answer in zip(data.get('shingles', []), data.get('answers', [])):
+            index.add(frozenset(shingle_list), answer)
+        return index
+
+
+def dedup_questions(questions, previous=None, threshold=0.7, index=None):
+    """Drop near-duplicate questions, keeping the first of each group.
+
+    ``previous`` is a list of already generated questions (for example the
+    course's earlier quizzes) that new questions must not repeat; an
+    existing ``index`` can be passed instead and is updated in place.
+    """
+    if index is None:
+        index = NearDuplicateIndex(threshold)
+        for question in previous or []:
+            if isinstance(question, dict):
+                index.add_question(question)
+    return [q for q in questions if isinstance(q, dict) and index.add_question(q)]
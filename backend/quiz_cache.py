@@ -0,0 +1,117 @@
+"""On-disk cache of generated quizzes, keyed on the normalized input text.
+
+Entries live in a small SQLite file so several worker processes can share
+them. The key covers everything that changes the LLM output (text, model,
+temperature, prompt version); entries expire after a TTL and the least
+recently used ones are evicted once the cache grows past ``max_entries``.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from quiz_env import env_float, env_int
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quiz_cache.sqlite3')
+
+
+def normalize_text(text):
+    """Collapse whitespace so re-extracted copies of a PDF hash the same."""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def make_key(text, model, temperature, prompt_version):
+    h = hashlib.sha256()
+    for part in (normalize_text(text), model, repr(float(temperature)), str(prompt_version)):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class QuizCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=2000, ttl_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quiz_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS quiz_cache_accessed ON quiz_cache (accessed_at)")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('QUIZ_CACHE_PATH', DEFAULT_CACHE_PATH),
+            max_entries=env_int('QUIZ_CACHE_MAX_ENTRIES', 2000),
+            ttl_seconds=env_float('QUIZ_CACHE_TTL_DAYS', 30) * 24 * 3600,
+        )
+
+    def get(self, key):
+        """Return the cached quiz JSON for ``key`` or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM quiz_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM quiz_cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE quiz_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quiz_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            # Drop everything past the newest max_entries by last access
+            self._conn.execute(
+                "DELETE FROM quiz_cache WHERE key IN ("
+                " SELECT key FROM quiz_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM quiz_cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_disabled():
+    return os.getenv('QUIZ_CACHE_DISABLED', '').lower() in ('1', 'true', 'yes')
+
+
+def get_cache():
+    """Return the process-wide cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QuizCache.from_env()
+    return _cache
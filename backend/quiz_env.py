@@ -0,0 +1,20 @@
+"""Settings read from the environment.
+
+A malformed value falls back to the default rather than failing the
+service at startup.
+"""
+import os
+
+
+def env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+def env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return int(default)
@@ -1,53 +1,112 @@
-import requests
 import os
 import sys
 import json
-from dotenv import load_dotenv
 import re
 import random
+import logging
+from contextlib import contextmanager
 
-# Load environment variables
-load_dotenv()
+# Only cheap modules are imported here. requests (via mistral_client), dotenv
+# and sqlite3 (via quiz_cache) are imported on first use, so fallback-only and
+# cached runs start fast; bench_startup.py keeps an eye on this.
+import quiz_logging
+import quiz_metrics
+from block_ranking import rank_window, select_ranked, split_blocks
+from circuit_breaker import CircuitOpenError, breaker_enabled, get_breaker
+from json_stream import IncrementalArrayParser, salvage_objects
+from question_dedup import NearDuplicateIndex, dedup_questions
+from term_scoring import SentenceTermMatrix
+from text_normalizer import TextNormalizer
+from token_budget import completion_budget, content_token_budget, estimate_tokens, record_usage, select_blocks
 
-MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
-if not MISTRAL_API_KEY:
-    print("❌ Error: MISTRAL_API_KEY not found in environment variables", file=sys.stderr)
-    sys.exit(1)
+log = quiz_logging.get_logger()
 
-print("✅ Mistral API key loaded", file=sys.stderr)
+MODEL = "mistral-medium"
+TEMPERATURE = 0.5
+# Bump whenever the prompt changes so cached quizzes from the old prompt are not reused
+PROMPT_VERSION = 4
+# Upper bound on the questions kept for one quiz
+MAX_QUESTIONS = 12
+# Smallest section worth a separate request in chunked mode
+MIN_SECTION_TOKENS = 750
+# Questions asked for in one quiz
+TARGET_QUESTIONS = 10
+# Follow-up requests for questions lost to sanitization: at most this many
+# rounds and this many completion tokens in all
+TOPUP_MAX_ROUNDS = 2
+TOPUP_MAX_TOKENS = 1500
+# A near-duplicate's banked questions make a quiz when at least this many
+# still fit; new material shorter than this gets no request of its own
+MIN_BANKED_QUESTIONS = TARGET_QUESTIONS // 2
+MIN_NEW_MATERIAL_TOKENS = 60
+# API statuses that mean the upstream is unavailable, for the circuit breaker
+UPSTREAM_FAILURE_STATUS = {429, 500, 502, 503, 504}
+
+# Sanitization rules, compiled once at import. Each rule family is a single
+# alternation so a question is checked with one regex pass per field.
+CODE_PROMPT_RE = re.compile("|".join([
+    r"write\s+a\s+program",
+    r"implement\s+(a|the)\s+function",
+    r"complete\s+the\s+function",
+    r"create\s+a\s+function",
+    r"develop\s+a\s+program",
+    r"code\s+(a|the)\s+",
+    r"programming\s+",
+    r"stdin|stdout|input\(|scanf|printf|System\.out|public\s+static\s+void\s+main",
+    r"algorithm\s+to\s+",
+    r"write\s+code",
+    r"write\s+an?\s+algorithm",
+]))
+C_LANGUAGE_RE = re.compile(r"#include\s*<|scanf|printf|\bptr\b|\*\s*\w|->")
+JAVA_LANGUAGE_RE = re.compile(r"public\s+class|public\s+static\s+void\s+main|System\.out|Scanner\s*\(")
+PYTHON_LANGUAGE_RE = re.compile(r"def\s+\w+\(|print\(|input\(|list\(|dict\(|len\(")
+
+# trivial/placeholder phrases in a question stem
+LOW_QUALITY_RE = re.compile("|".join(re.escape(phrase) for phrase in [
+    'what is this', 'choose the correct', 'lorem ipsum', 'sample question',
+    'as described above', 'select the right answer',
+    'a concept related to', 'a technology used in', 'a method for', 'a tool for',
+]))
+# generic placeholder options
+GENERIC_OPTION_RE = re.compile("|".join([
+    r'a concept related to',
+    r'a technology used in',
+    r'a method for',
+    r'a tool for',
+    r'option \d+',
+    r'answer \d+',
+]))
+# phrases that make a coding question depend on the source document
+BAD_CODE_PREFIXES = (
+    'based on the provided content',
+    'from the document above',
+    'according to the content',
+    'as described in the document',
+    'implement a program that accomplishes the following based on',
+    'write a program based on the provided',
+)
+TASK_KEYWORDS_RE = re.compile(r'write|implement|create|calculate|find|return|print')
+SENTENCE_SPLIT_RE = re.compile(r'[.!?]\s+')
+
+# Rejection reasons reported by validate_question
+REJECT_NOT_OBJECT = 'not_an_object'
+REJECT_LOW_QUALITY = 'low_quality'
+REJECT_GENERIC_OPTIONS = 'generic_options'
+REJECT_INSUFFICIENT_OPTIONS = 'insufficient_options'
 
-API_URL = "https://api.mistral.ai/v1/chat/completions"
-headers = {
-    "Authorization": f"Bearer {MISTRAL_API_KEY}",
-    "Content-Type": "application/json"
-}
 
 def is_code_prompt(s: str) -> bool:
-    s = (s or '').lower()
-    patterns = [
-        r"write\s+a\s+program",
-        r"implement\s+(a|the)\s+function",
-        r"complete\s+the\s+function",
-        r"create\s+a\s+function",
-        r"develop\s+a\s+program",
-        r"code\s+(a|the)\s+",
-        r"programming\s+",
-        r"stdin|stdout|input\(|scanf|printf|System\.out|public\s+static\s+void\s+main",
-        r"algorithm\s+to\s+",
-        r"write\s+code",
-        r"write\s+an?\s+algorithm",
-    ]
-    return any(re.search(p, s) for p in patterns)
+    return CODE_PROMPT_RE.search((s or '').lower()) is not None
 
 
 def detect_language(s: str) -> str:
     s = (s or '').lower()
     # Heuristics: C, Java, Python
-    if re.search(r"#include\s*<|scanf|printf|\bptr\b|\*\s*\w|->", s):
+    if C_LANGUAGE_RE.search(s):
         return "c"
-    if re.search(r"public\s+class|public\s+static\s+void\s+main|System\.out|Scanner\s*\(", s):
+    if JAVA_LANGUAGE_RE.search(s):
         return "java"
-    if re.search(r"def\s+\w+\(|print\(|input\(|list\(|dict\(|len\(", s):
+    if PYTHON_LANGUAGE_RE.search(s):
         return "python"
     # Fallback default
     return "python"
@@ -63,300 +122,888 @@ def starter_code_for(language: str) -> str:
     return """# TODO: write your solution\n# Example:\n# n = int(input())\n# print(n)\n"""
 
 
-def sanitize_questions(raw_questions):
+def clean_code_question_text(question_text):
+    """Turn an LLM coding prompt into a concise, standalone problem statement."""
+    # Remove references to document/content that make it not standalone
+    question_text_clean = question_text.strip()
+
+    # Check if question is too long (likely contains full document)
+    max_question_length = 500
+    if len(question_text_clean) > max_question_length:
+        log.debug("⚠️ Coding question too long (%d chars), truncating", len(question_text_clean))
+        # Try to extract just the problem statement
+        # Look for sentence boundaries
+        truncated = question_text_clean[:max_question_length]
+        last_period = max(truncated.rfind('.'), truncated.rfind('!'), truncated.rfind('?'))
+        if last_period > max_question_length * 0.7:
+            question_text_clean = truncated[:last_period + 1]
+        else:
+            question_text_clean = truncated.rstrip() + "..."
+
+    # Remove phrases that indicate it references external content
+    question_lower = question_text_clean.lower()
+    for prefix in BAD_CODE_PREFIXES:
+        if question_lower.startswith(prefix):
+            # Try to extract the actual task after the prefix
+            remaining = question_text_clean[len(prefix):].strip()
+            if len(remaining) > 30:
+                question_text_clean = remaining
+            break
+
+    # Ensure it's a standalone problem statement
+    if not question_text_clean.strip().endswith(('.', '!', '?')):
+        question_text_clean = question_text_clean.strip() + "."
+
+    # Final length check - if still too long, truncate more aggressively
+    if len(question_text_clean) > 400:
+        # Find first sentence that contains task keywords
+        sentences = SENTENCE_SPLIT_RE.split(question_text_clean)
+        for sent in sentences[:5]:  # Check first 5 sentences
+            if TASK_KEYWORDS_RE.search(sent.lower()):
+                question_text_clean = sent.strip()
+                if not question_text_clean.endswith(('.', '!', '?')):
+                    question_text_clean += "."
+                break
+
+        # If still too long, just take first 350 chars at sentence boundary
+        if len(question_text_clean) > 400:
+            truncated = question_text_clean[:350]
+            last_period = max(truncated.rfind('.'), truncated.rfind('!'), truncated.rfind('?'))
+            if last_period > 250:
+                question_text_clean = truncated[:last_period + 1]
+            else:
+                question_text_clean = truncated.rstrip() + "..."
+
+    return question_text_clean
+
+
+def validate_question(q):
+    """Validate and normalize one question in a single pass.
+
+    Returns ``(question, None)`` for a kept question (normalized in place)
+    or ``(None, reason)`` with one of the ``REJECT_*`` reasons.
+    """
+    if not isinstance(q, dict):
+        return None, REJECT_NOT_OBJECT
+    qtype = (q.get('type') or 'mcq').lower()
+    question_text = q.get('question') or ''
+    t = question_text.strip()
+    if len(t) < 15 or LOW_QUALITY_RE.search(t.lower()):
+        return None, REJECT_LOW_QUALITY
+
+    if qtype == 'code':
+        lang = detect_language(question_text + ' ' + (q.get('language') or ''))
+        q['type'] = 'code'
+        q['language'] = lang
+        q['question'] = clean_code_question_text(question_text)
+        if not q.get('starterCode'):
+            q['starterCode'] = starter_code_for(lang)
+        if not isinstance(q.get('solution'), str):
+            q.pop('solution', None)
+        tcs = q.get('testCases')
+        tcs = [tc for tc in tcs if isinstance(tc, dict)] if isinstance(tcs, list) else []
+        if len(tcs) == 0:
+            q['testCases'] = [{ 'stdin': '1\n', 'stdout': '1\n' }]
+        else:
+            q['testCases'] = [dict(tc, stdin=str(tc.get('stdin') or ''), stdout=str(tc.get('stdout') or ''))
+                              for tc in tcs]
+        return q, None
+
+    # MCQ normalization
+    options = q.get('options')
+    if not isinstance(options, list):
+        # Attempt to split string into options
+        if isinstance(options, str):
+            options = [o.strip() for o in options.split(',') if o.strip()]
+        else:
+            options = []
+    options = [o for o in options if o]
+
+    # Filter out generic placeholder options; the patterns never span a
+    # newline, so all options can be checked with one search
+    if GENERIC_OPTION_RE.search("\n".join(str(o) for o in options).lower()):
+        log.debug("⚠️ Skipping question with generic options: %.50s...", question_text)
+        return None, REJECT_GENERIC_OPTIONS
+
+    # De-duplicate while preserving order
+    seen = set()
+    dedup = []
+    for o in options:
+        key = o.strip().lower()
+        if key not in seen:
+            seen.add(key)
+            dedup.append(o)
+    options = dedup[:4]
+
+    # If we don't have enough meaningful options, skip this question
+    if len(options) < 4:
+        log.debug("⚠️ Skipping question with insufficient options: %.50s...", question_text)
+        return None, REJECT_INSUFFICIENT_OPTIONS
+
+    answer_letter = (q.get('answer') or q.get('correctAnswer') or '').strip().upper()
+    if answer_letter not in ['A', 'B', 'C', 'D']:
+        # Default to A if invalid
+        answer_letter = 'A'
+    q['type'] = 'mcq'
+    q['options'] = options
+    q['answer'] = answer_letter
+    return q, None
+
+
+@quiz_metrics.timed("sanitize")
+def sanitize_questions(raw_questions, rejections=None, limit=MAX_QUESTIONS):
     """Post-process and validate questions returned by the LLM.
     - Drop empty/low-quality items
     - Normalize MCQs to have 4 distinct options and a valid answer letter
     - Ensure code questions have language and at least one test case
+
+    When ``rejections`` is a list, one ``{"index", "reason"}`` record is
+    appended per dropped item. ``limit=None`` keeps every valid question
+    (used when re-checking a whole question bank).
     """
     if not isinstance(raw_questions, list):
         return []
 
     sanitized = []
+    for index, q in enumerate(raw_questions):
+        question, reason = validate_question(q)
+        if question is not None:
+            sanitized.append(question)
+            continue
+        quiz_metrics.incr(f"dropped_{reason}")
+        if rejections is not None:
+            rejections.append({"index": index, "reason": reason})
 
-    def is_low_quality(text: str) -> bool:
-        t = (text or '').strip()
-        if len(t) < 15:
-            return True
-        # trivial/placeholder phrases
-        bad = [
-            'what is this', 'choose the correct', 'lorem ipsum', 'sample question',
-            'as described above', 'select the right answer',
-            'a concept related to', 'a technology used in', 'a method for', 'a tool for'
-        ]
-        return any(b in t.lower() for b in bad)
-    
-    def has_generic_options(options_list) -> bool:
-        """Check if options are generic placeholders"""
-        if not isinstance(options_list, list):
-            return False
-        generic_patterns = [
-            r'a concept related to',
-            r'a technology used in',
-            r'a method for',
-            r'a tool for',
-            r'option \d+',
-            r'answer \d+'
-        ]
-        for opt in options_list:
-            opt_str = str(opt).lower()
-            if any(re.search(pattern, opt_str) for pattern in generic_patterns):
-                return True
+    # Limit to a reasonable number
+    return sanitized[:limit] if limit is not None else sanitized
+
+
+def store_in_cache(cache, key, quiz):
+    """Remember an API-generated quiz; empty results are not worth caching.
+    A cache that cannot be written is skipped; the quiz is returned anyway."""
+    if cache is not None and quiz != "[]":
+        try:
+            cache.put(key, quiz)
+        except Exception as e:
+            log.warning("⚠️ Could not cache quiz: %s", e)
+    return quiz
+
+
+def prepare_input_text(text, max_length=4000):
+    """Validate and clean the raw document text before it goes into a prompt.
+
+    ``max_length=None`` keeps the whole document (used by chunked mode).
+    """
+    if not text or len(text.strip()) == 0:
+        raise ValueError("No text content provided")
+
+    # Fold punctuation and whitespace and strip page furniture; only as much
+    # of the input is normalized as the ranking below looks at
+    raw_length = len(text)
+    normalizer = TextNormalizer()
+    text = normalizer.normalize(text, None if max_length is None else max(max_length, rank_window()))
+    quiz_metrics.incr("normalize_chars_saved", normalizer.chars_saved)
+    quiz_metrics.incr("normalize_tokens_saved", normalizer.tokens_saved)
+    log.info("🧹 Normalized input: saved %d chars (~%d tokens): %d header/footer lines, %d page numbers, "
+             "%d hyphenations", normalizer.chars_saved, normalizer.tokens_saved,
+             normalizer.stats["header_footer_lines"], normalizer.stats["page_numbers"],
+             normalizer.stats["hyphenations"])
+    if not text.strip():
+        raise ValueError("No text content provided")
+
+    # Keep the most informative blocks rather than the first max_length
+    # characters, which are often the title page and table of contents
+    if max_length is not None and len(text) > max_length:
+        with quiz_metrics.span("rank_blocks"):
+            blocks = select_ranked(split_blocks(text), max_length, cost=lambda block: len(block) + 2)
+        log.info("⚠️ Input text too long (%d chars), keeping the densest %d blocks within %d chars",
+                 raw_length, len(blocks), max_length)
+        text = "\n\n".join(blocks) if blocks else text[:max_length]
+    log.debug("📄 Using input text length: %d characters", len(text))
+    log.debug("🔍 Preview of input:\n%.300s ...", text)
+    return text
+
+
+def build_payload(text, question_count=TARGET_QUESTIONS, max_blocks=10, exclude=None, max_tokens=None,
+                  content_tokens=-1):
+    """Build the chat-completions payload for one quiz over ``text``.
+
+    ``max_blocks`` caps how many content blocks are sent (None sends every
+    block). ``exclude`` lists question stems the model must not repeat
+    (used by top-up requests). ``max_tokens`` defaults to a budget sized
+    to ``question_count``. The most informative blocks that fit in
+    ``content_tokens`` (the configured content budget by default) are
+    sent; ``content_tokens=None`` sends the leading blocks whole.
+    """
+    # Split into smaller topical blocks to encourage mixed output
+    blocks = split_blocks(text)
+    if content_tokens == -1:
+        content_tokens = content_token_budget()
+    if content_tokens is None:
+        trimmed_blocks = blocks[:max_blocks] if max_blocks is not None else blocks
+    else:
+        # The densest blocks that fit, in document order
+        trimmed_blocks = (select_ranked(blocks, content_tokens, cost=estimate_tokens, max_blocks=max_blocks)
+                          or select_blocks(blocks[:max_blocks], content_tokens))
+    joined_blocks = "\n\n".join(trimmed_blocks)
+    if max_tokens is None:
+        # Leave room for code questions only when the content has coding tasks
+        code_questions = max(1, question_count // 3) if is_code_prompt(joined_blocks) else 0
+        max_tokens = completion_budget(question_count, code_questions)
+
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "You are a quiz generator and classifier. Respond ONLY with a single JSON array. "
+                "You must classify parts of the provided content as either CODING or THEORY and generate a mixed quiz: "
+                "- For THEORY: generate 1-2 high-quality MCQs per topic chunk.\n"
+                "- For CODING: generate a code question with detailed problem statement, language, starter code, and 1-3 test cases.\n\n"
+                "For MCQ questions:\n"
+                "{\n  \"question\": \"...\",\n  \"options\": [\"Option A text\", \"Option B text\", \"Option C text\", \"Option D text\"],\n  \"answer\": \"A\",\n  \"type\": \"mcq\"\n}\n\n"
+                "CRITICAL REQUIREMENTS FOR MCQ OPTIONS:\n"
+                "- Each option must be a SPECIFIC, MEANINGFUL answer related to the question topic\n"
+                "- DO NOT use generic placeholders like 'A concept related to X', 'A technology used in X', 'A method for X', or 'A tool for X'\n"
+                "- Options should contain REAL, CONCRETE information from the content\n"
+                "- At least one option must be clearly correct based on the actual content\n"
+                "- Wrong options should be plausible but incorrect alternatives\n"
+                "- Example GOOD question: {\"question\": \"What is Big Data?\", \"options\": [\"Large volumes of structured and unstructured data\", \"Small datasets under 1MB\", \"Only numeric data\", \"Data stored in a single file\"], \"answer\": \"A\", \"type\": \"mcq\"}\n"
+                "- Example BAD question (DO NOT CREATE): {\"question\": \"What is Big Data?\", \"options\": [\"A concept related to big data\", \"A technology used in big data\", \"A method for big data\", \"A tool for big data\"], ...}\n\n"
+                "For code questions:\n"
+                "{\n  \"question\": \"<CONCISE PROBLEM STATEMENT (100-300 words max) with what to implement, input/output format, and 1-2 examples>\",\n  \"type\": \"code\",\n  \"language\": \"python|c|java\",\n  \"starterCode\": \"<short starter code>\",\n  \"testCases\": [ { \"stdin\": \"input\", \"stdout\": \"expected\" } ],\n  \"solution\": \"<complete reference program>\"\n}\n\n"
+                "CRITICAL for coding questions:\n"
+                "- Keep 'question' field CONCISE (under 300 words, ideally 100-200 words)\n"
+                "- DO NOT include the entire document content in the question field\n"
+                "- DO NOT say 'based on the provided content' or 'from the document above'\n"
+                "- Write a STANDALONE problem statement that makes sense on its own\n"
+                "- Format: Brief description (2-3 sentences) + Input format + Output format + 1-2 examples\n"
+                "- Example GOOD: \"Write a function to calculate factorial of n. Input: integer n (0<=n<=10). Output: factorial of n. Example: Input 5, Output 120.\"\n"
+                "- Example BAD (DO NOT DO): \"Implement a program that accomplishes the following based on the provided content: [entire document here]\"\n"
+                "- 'solution' is a complete, correct program in the question's language (a Java class must be named Main) that reads the test input from stdin and prints exactly the expected stdout; it is used to check the test cases and is never shown to students\n"
+                "Choose language heuristically: use C if #include/scanf/printf, Java if public static void main/System.out, otherwise Python. "
+                f"Generate exactly {question_count} questions total; include MCQs from theory parts and code questions from coding parts."
+            )
+        },
+        {
+            "role": "user",
+            "content": (
+                "Classify and generate a mixed quiz from the following content blocks. "
+                "For each block: If it describes implementation/programming tasks, produce a code question; otherwise produce MCQs.\n\n"
+                f"CONTENT BLOCKS:\n\n{joined_blocks}"
+            )
+        }
+    ]
+    if exclude:
+        messages[1]["content"] += (
+            "\n\nThese questions already exist. Do NOT repeat or paraphrase them; cover other points:\n"
+            + "\n".join(f"- {stem[:150]}" for stem in exclude)
+        )
+
+    payload = {
+        "model": MODEL,
+        "messages": messages,
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens,
+        "top_p": 0.9
+    }
+    return payload
+
+
+_env_loaded = False
+
+
+def load_environment():
+    """Load variables from ``.env`` once, on first use. Variables already set
+    in the process environment take precedence."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    quiz_logging.apply_env_level()
+    _env_loaded = True
+
+
+def api_client():
+    """The shared Mistral client, created (and requests imported) on first use.
+
+    Raises if no API key is configured, so callers fall back as they do for
+    any other API failure.
+    """
+    load_environment()
+    if not os.getenv('MISTRAL_API_KEY'):
+        raise RuntimeError("MISTRAL_API_KEY not found in environment variables")
+    from mistral_client import get_client
+    return get_client()
+
+
+def hedged_requester():
+    """The shared hedged requester, or None unless ``QUIZ_HEDGE`` is on."""
+    api_client()
+    from llm_providers import get_hedger
+    return get_hedger()
+
+
+class ApiStatusError(Exception):
+    """The API answered with a non-200 status."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def is_upstream_failure(error):
+    """True for errors that say the API is unavailable (connection errors,
+    timeouts, 429/5xx), as opposed to a reply we could not use."""
+    if isinstance(error, ApiStatusError):
+        return error.status in UPSTREAM_FAILURE_STATUS
+    if 'requests' not in sys.modules:
         return False
+    import requests
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in UPSTREAM_FAILURE_STATUS
+    return isinstance(error, requests.RequestException)
 
-    for q in raw_questions:
-        if not isinstance(q, dict):
-            continue
-        qtype = (q.get('type') or 'mcq').lower()
-        question_text = q.get('question') or ''
-        if is_low_quality(question_text):
-            continue
 
-        if qtype == 'code':
-            lang = detect_language(question_text + ' ' + (q.get('language') or ''))
-            q['type'] = 'code'
-            q['language'] = lang
-            
-            # Clean up and validate coding question text
-            # Remove references to document/content that make it not standalone
-            question_text_clean = question_text.strip()
-            
-            # Check if question is too long (likely contains full document)
-            max_question_length = 500
-            if len(question_text_clean) > max_question_length:
-                print(f"⚠️ Coding question too long ({len(question_text_clean)} chars), truncating", file=sys.stderr)
-                # Try to extract just the problem statement
-                # Look for sentence boundaries
-                truncated = question_text_clean[:max_question_length]
-                last_period = max(truncated.rfind('.'), truncated.rfind('!'), truncated.rfind('?'))
-                if last_period > max_question_length * 0.7:
-                    question_text_clean = truncated[:last_period + 1]
-                else:
-                    question_text_clean = truncated.rstrip() + "..."
-            
-            # Remove phrases that indicate it references external content
-            bad_prefixes = [
-                'based on the provided content',
-                'from the document above',
-                'according to the content',
-                'as described in the document',
-                'implement a program that accomplishes the following based on',
-                'write a program based on the provided'
-            ]
-            
-            question_lower = question_text_clean.lower()
-            for prefix in bad_prefixes:
-                if question_lower.startswith(prefix):
-                    # Try to extract the actual task after the prefix
-                    remaining = question_text_clean[len(prefix):].strip()
-                    if len(remaining) > 30:
-                        question_text_clean = remaining
-                    break
-            
-            # Ensure it's a standalone problem statement
-            if not question_text_clean.strip().endswith(('.', '!', '?')):
-                question_text_clean = question_text_clean.strip() + "."
-            
-            # Final length check - if still too long, truncate more aggressively
-            if len(question_text_clean) > 400:
-                # Find first sentence that contains task keywords
-                sentences = re.split(r'[.!?]\s+', question_text_clean)
-                for sent in sentences[:5]:  # Check first 5 sentences
-                    if any(kw in sent.lower() for kw in ['write', 'implement', 'create', 'calculate', 'find', 'return', 'print']):
-                        question_text_clean = sent.strip()
-                        if not question_text_clean.endswith(('.', '!', '?')):
-                            question_text_clean += "."
-                        break
-                
-                # If still too long, just take first 350 chars at sentence boundary
-                if len(question_text_clean) > 400:
-                    truncated = question_text_clean[:350]
-                    last_period = max(truncated.rfind('.'), truncated.rfind('!'), truncated.rfind('?'))
-                    if last_period > 250:
-                        question_text_clean = truncated[:last_period + 1]
-                    else:
-                        question_text_clean = truncated.rstrip() + "..."
-            
-            q['question'] = question_text_clean
-            
-            if not q.get('starterCode'):
-                q['starterCode'] = starter_code_for(lang)
-            tcs = q.get('testCases')
-            if not isinstance(tcs, list) or len(tcs) == 0:
-                q['testCases'] = [{ 'stdin': '1\n', 'stdout': '1\n' }]
-            sanitized.append(q)
-            continue
+@contextmanager
+def upstream_call():
+    """Guard one API call with the shared circuit breaker.
 
-        # MCQ normalization
-        options = q.get('options')
-        if not isinstance(options, list):
-            # Attempt to split string into options
-            if isinstance(options, str):
-                options = [o.strip() for o in options.split(',') if o.strip()]
-            else:
-                options = []
-        # Ensure 4 options (pad by simple variants if needed)
-        options = [o for o in options if o]
-        
-        # Filter out generic placeholder options
-        if has_generic_options(options):
-            print(f"⚠️ Skipping question with generic options: {question_text[:50]}...", file=sys.stderr)
-            continue
-        
-        # De-duplicate while preserving order
-        seen = set()
-        dedup = []
-        for o in options:
-            key = o.strip().lower()
-            if key not in seen:
-                seen.add(key)
-                dedup.append(o)
-        options = dedup[:4]
-        
-        # If we don't have enough meaningful options, skip this question
-        if len(options) < 4:
-            print(f"⚠️ Skipping question with insufficient options: {question_text[:50]}...", file=sys.stderr)
-            continue
+    Raises ``CircuitOpenError`` without calling the API while the breaker
+    is open, and reports the outcome of the ``with`` block to it.
+    """
+    if not breaker_enabled():
+        yield
+        return
+    breaker = get_breaker()
+    if not breaker.allow():
+        quiz_metrics.incr("circuit_rejected")
+        raise CircuitOpenError("circuit open: the API has been failing, skipping the call")
+    try:
+        yield
+    except Exception as e:
+        if is_upstream_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    breaker.record_success()
 
-        answer_letter = (q.get('answer') or q.get('correctAnswer') or '').strip().upper()
-        if answer_letter not in ['A', 'B', 'C', 'D']:
-            # Default to A if invalid
-            answer_letter = 'A'
-        q['type'] = 'mcq'
-        q['options'] = options
-        q['answer'] = answer_letter
-        sanitized.append(q)
 
-    # Limit to a reasonable number
-    return sanitized[:12]
+def lookup_cache(text, use_cache=True, variant=''):
+    """Return ``(cache, key, cached_quiz)``; cache is None when bypassed.
 
+    ``variant`` separates results of different generation modes for the
+    same text.
+    """
+    if not use_cache:
+        return None, None, None
+    load_environment()
+    from quiz_cache import cache_disabled, get_cache, make_key
+    if cache_disabled():
+        return None, None, None
+    try:
+        cache = get_cache()
+        cache_key = make_key(text, MODEL, TEMPERATURE, f"{PROMPT_VERSION}{variant}")
+        with quiz_metrics.span("cache_lookup"):
+            cached = cache.get(cache_key)
+    except Exception as e:
+        log.warning("⚠️ Quiz cache unavailable: %s", e)
+        return None, None, None
+    if cached is not None:
+        quiz_metrics.incr("cache_hit")
+        if log.isEnabledFor(logging.INFO):
+            log.info("⚡ Quiz cache hit (%s)", cache.stats())
+    return cache, cache_key, cached
 
-def generate_questions_from_text(text):
+
+def open_bank(use_cache=True):
+    """The shared question bank, or None when bypassed or unavailable."""
+    if not use_cache:
+        return None
+    load_environment()
+    from question_bank import bank_disabled, get_bank
+    if bank_disabled():
+        return None
     try:
-        if not text or len(text.strip()) == 0:
-            raise ValueError("No text content provided")
+        return get_bank()
+    except Exception as e:
+        log.warning("⚠️ Question bank unavailable: %s", e)
+        return None
 
-        # Sanitize input text: remove non-printable and problematic characters
-        text = re.sub(r'[^\x20-\x7E\n\r]', '', text)
 
-        # Truncate input text to avoid exceeding API limits
-        max_length = 4000
-        if len(text) > max_length:
-            print(f"⚠️ Input text too long ({len(text)} chars), truncating to {max_length} chars", file=sys.stderr)
-            text = text[:max_length]
-        print(f"📄 Using input text length: {len(text)} characters", file=sys.stderr)
-        print("🔍 Preview of input:\n", text[:300], "...\n", file=sys.stderr)
+def lookup_bank(text, use_cache=True):
+    """Return ``(bank, match)``; match is the nearest banked source of
+    ``text`` as a ``BankMatch``, or None."""
+    bank = open_bank(use_cache)
+    if bank is None:
+        return None, None
+    try:
+        with quiz_metrics.span("bank_lookup"):
+            match = bank.find(text)
+    except Exception as e:
+        log.warning("⚠️ Question bank lookup failed: %s", e)
+        return bank, None
+    if match is not None:
+        quiz_metrics.incr("bank_match")
+        log.info("🏦 Near-duplicate of banked document %d (%d bits apart), %d banked questions still fit",
+                 match.doc_id, match.distance, len(match.questions))
+    return bank, match
 
-        # Try Mistral API first (mixed classification: code vs theory→MCQ)
+
+def bank_questions(bank, text, questions):
+    """Keep an API-generated quiz for reuse on near-duplicates of ``text``."""
+    if bank is None or not questions:
+        return
+    try:
+        with quiz_metrics.span("bank_store"):
+            bank.add(text, questions)
+    except Exception as e:
+        log.warning("⚠️ Could not bank questions: %s", e)
+
+
+def quiz_from_bank(text, match):
+    """Assemble a quiz from a near-duplicate's banked questions.
+
+    Only the paragraphs the banked source did not have are sent to the
+    API, for a share of the quiz matching their share of the text. Returns
+    None when too few banked questions still fit the document.
+    """
+    banked = match.questions
+    if len(banked) < MIN_BANKED_QUESTIONS:
+        return None
+    fresh = []
+    new_tokens = estimate_tokens(match.new_text) if match.new_text else 0
+    if new_tokens >= MIN_NEW_MATERIAL_TOKENS:
+        share = new_tokens / max(1, estimate_tokens(text))
+        count = min(TARGET_QUESTIONS, max(1, round(TARGET_QUESTIONS * share), TARGET_QUESTIONS - len(banked)))
+        log.info("➕ Requesting %d questions for %d tokens of new material", count, new_tokens)
+        quiz_metrics.incr("bank_new_material")
         try:
-            # Split into smaller topical blocks to encourage mixed output
-            blocks = [blk.strip() for blk in re.split(r"\n{2,}", text) if blk.strip()]
-            trimmed_blocks = blocks[:10] if len(blocks) > 10 else blocks
-            joined_blocks = "\n\n".join(trimmed_blocks)
-
-            messages = [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a quiz generator and classifier. Respond ONLY with a single JSON array. "
-                        "You must classify parts of the provided content as either CODING or THEORY and generate a mixed quiz: "
-                        "- For THEORY: generate 1-2 high-quality MCQs per topic chunk.\n"
-                        "- For CODING: generate a code question with detailed problem statement, language, starter code, and 1-3 test cases.\n\n"
-                        "For MCQ questions:\n"
-                        "{\n  \"question\": \"...\",\n  \"options\": [\"Option A text\", \"Option B text\", \"Option C text\", \"Option D text\"],\n  \"answer\": \"A\",\n  \"type\": \"mcq\"\n}\n\n"
-                        "CRITICAL REQUIREMENTS FOR MCQ OPTIONS:\n"
-                        "- Each option must be a SPECIFIC, MEANINGFUL answer related to the question topic\n"
-                        "- DO NOT use generic placeholders like 'A concept related to X', 'A technology used in X', 'A method for X', or 'A tool for X'\n"
-                        "- Options should contain REAL, CONCRETE information from the content\n"
-                        "- At least one option must be clearly correct based on the actual content\n"
-                        "- Wrong options should be plausible but incorrect alternatives\n"
-                        "- Example GOOD question: {\"question\": \"What is Big Data?\", \"options\": [\"Large volumes of structured and unstructured data\", \"Small datasets under 1MB\", \"Only numeric data\", \"Data stored in a single file\"], \"answer\": \"A\", \"type\": \"mcq\"}\n"
-                        "- Example BAD question (DO NOT CREATE): {\"question\": \"What is Big Data?\", \"options\": [\"A concept related to big data\", \"A technology used in big data\", \"A method for big data\", \"A tool for big data\"], ...}\n\n"
-                        "For code questions:\n"
-                        "{\n  \"question\": \"<CONCISE PROBLEM STATEMENT (100-300 words max) with what to implement, input/output format, and 1-2 examples>\",\n  \"type\": \"code\",\n  \"language\": \"python|c|java\",\n  \"starterCode\": \"<short starter code>\",\n  \"testCases\": [ { \"stdin\": \"input\", \"stdout\": \"expected\" } ]\n}\n\n"
-                        "CRITICAL for coding questions:\n"
-                        "- Keep 'question' field CONCISE (under 300 words, ideally 100-200 words)\n"
-                        "- DO NOT include the entire document content in the question field\n"
-                        "- DO NOT say 'based on the provided content' or 'from the document above'\n"
-                        "- Write a STANDALONE problem statement that makes sense on its own\n"
-                        "- Format: Brief description (2-3 sentences) + Input format + Output format + 1-2 examples\n"
-                        "- Example GOOD: \"Write a function to calculate factorial of n. Input: integer n (0<=n<=10). Output: factorial of n. Example: Input 5, Output 120.\"\n"
-                        "- Example BAD (DO NOT DO): \"Implement a program that accomplishes the following based on the provided content: [entire document here]\"\n"
-                        "Choose language heuristically: use C if #include/scanf/printf, Java if public static void main/System.out, otherwise Python. "
-                        "Generate exactly 10 questions total; include MCQs from theory parts and code questions from coding parts."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        "Classify and generate a mixed quiz from the following content blocks. "
-                        "For each block: If it describes implementation/programming tasks, produce a code question; otherwise produce MCQs.\n\n"
-                        f"CONTENT BLOCKS:\n\n{joined_blocks}"
-                    )
-                }
-            ]
-
-            payload = {
-                "model": "mistral-medium",
-                "messages": messages,
-                "temperature": 0.5,
-                "max_tokens": 3000,  # Increased to support 10 questions
-                "top_p": 0.9
-            }
-            print("Payload being sent:", json.dumps(payload, indent=2), file=sys.stderr)
-            response = requests.post(API_URL, headers=headers, json=payload)
+            with quiz_metrics.span("build_payload"):
+                payload = build_payload(match.new_text, question_count=count,
+                                        exclude=[q.get('question', '') for q in banked])
+            with quiz_metrics.span("dedup"):
+                fresh = dedup_questions(request_questions(payload), previous=banked)[:count]
+        except Exception as new_material_error:
+            log.warning("⚠️ Questions for the new material failed: %s, using banked questions only",
+                        new_material_error)
+    questions = banked[:TARGET_QUESTIONS - len(fresh)] + fresh
+    quiz_metrics.incr("bank_questions_reused", len(questions) - len(fresh))
+    if len(questions) < TARGET_QUESTIONS:
+        questions = top_up_questions(text, questions)
+    return questions
 
-            print(f"📬 Mistral API response status: {response.status_code}", file=sys.stderr)
 
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
-                print("✅ Raw response received", file=sys.stderr)
+def check_code_questions(questions):
+    """Check code questions' test cases against the reference solutions the
+    model wrote for them (see ``code_validation``) and strip the solutions.
 
-                try:
-                    # Try to parse as JSON directly
-                    quiz_json = json.loads(content)
-                    print("✅ JSON format validated", file=sys.stderr)
-                    quiz_json = sanitize_questions(quiz_json)
-                    return json.dumps(quiz_json)
-                except json.JSONDecodeError as e:
-                    # Try to extract JSON array from the content using regex
-                    print(f"⚠️ Raw content not valid JSON, attempting to extract JSON array. Raw content:\n{content}", file=sys.stderr)
-                    match = re.search(r'(\[.*\])', content, re.DOTALL)
-                    if match:
-                        try:
-                            quiz_json = json.loads(match.group(1))
-                            print("✅ Extracted JSON array from response", file=sys.stderr)
-                            quiz_json = sanitize_questions(quiz_json)
-                            return json.dumps(quiz_json)
-                        except Exception as e2:
-                            print(f"❌ Still invalid after extraction: {e2}", file=sys.stderr)
-                    raise ValueError(f"Invalid JSON returned by Mistral: {e}")
+    The sandbox is only loaded for replies that carry solutions. If the
+    check itself fails the test cases are kept as they are.
+    """
+    if not any('solution' in question for question in questions):
+        return questions
+    from code_validation import validate_code_questions
+    try:
+        return validate_code_questions(questions)
+    except Exception as check_error:
+        log.warning("⚠️ Code question check failed: %s, keeping test cases unchecked", check_error)
+        for question in questions:
+            question.pop('solution', None)
+        return questions
 
-            else:
-                print("❌ API Error:", response.text, file=sys.stderr)
-                if response.status_code == 429:
-                    print("⚠️ API rate limit exceeded, using fallback quiz generator", file=sys.stderr)
-                    raise Exception("API rate limit exceeded")
-                else:
-                    raise Exception(f"Failed to generate quiz. Status code: {response.status_code}")
-                    
+
+def finish_questions(quiz_json):
+    """Sanitize a parsed reply, drop near-duplicates within it and check its
+    code questions."""
+    questions = sanitize_questions(quiz_json)
+    with quiz_metrics.span("dedup"):
+        unique = dedup_questions(questions)
+    if len(unique) < len(questions):
+        quiz_metrics.incr("dropped_duplicate", len(questions) - len(unique))
+    return check_code_questions(unique)
+
+
+def request_questions(payload):
+    """Send one generation request and return the sanitized question list.
+
+    Raises on API errors and unparseable replies so callers can decide how
+    to fall back.
+    """
+    log.debug("Payload being sent: %s", quiz_logging.lazy_json(payload))
+    with upstream_call():
+        hedger = hedged_requester()
+        if hedger is not None:
+            return hedger.request(payload, lambda response: questions_from_response(payload, response))
+        with quiz_metrics.span("api_request"):
+            response = api_client().chat(payload)
+        return questions_from_response(payload, response)
+
+
+def questions_from_response(payload, response):
+    """Sanitized questions from one chat-completions response to ``payload``."""
+    log.debug("📬 Mistral API response status: %d", response.status_code)
+
+    if response.status_code == 200:
+        with quiz_metrics.span("parse_json"):
+            result = response.json()
+            choice = result['choices'][0]
+            content = choice['message']['content']
+        record_usage(payload, result.get('usage'), choice.get('finish_reason'))
+        log.debug("✅ Raw response received")
+
+        try:
+            # Try to parse as JSON directly
+            with quiz_metrics.span("parse_json"):
+                quiz_json = json.loads(content)
+            if isinstance(quiz_json, list):
+                log.debug("✅ JSON format validated")
+                return finish_questions(quiz_json)
+            error = "reply is not a JSON array"
+        except json.JSONDecodeError as e:
+            error = e
+
+        # Recover every complete question object from a prose-wrapped or
+        # truncated reply instead of throwing the whole completion away
+        log.info("⚠️ Raw content not valid JSON (%s, finish_reason=%s), salvaging question objects",
+                 error, choice.get('finish_reason'))
+        log.debug("Raw content:\n%s", content)
+        with quiz_metrics.span("json_salvage"):
+            quiz_json, parser = salvage_objects(content)
+        if parser.truncated:
+            quiz_metrics.incr("json_truncated")
+        if parser.skipped:
+            quiz_metrics.incr("json_skipped_objects", parser.skipped)
+        if quiz_json:
+            log.info("✅ Salvaged %d question objects from the reply (truncated=%s, malformed=%d)",
+                     len(quiz_json), parser.truncated, parser.skipped)
+            quiz_metrics.incr("json_salvaged")
+            quiz_metrics.incr("json_salvaged_objects", len(quiz_json))
+            return finish_questions(quiz_json)
+        quiz_metrics.incr("json_unparseable")
+        raise ValueError(f"Invalid JSON returned by Mistral: {error}")
+
+    else:
+        log.warning("❌ API Error %d: %.300s", response.status_code, response.text)
+        log.debug("API error body:\n%s", response.text)
+        quiz_metrics.incr(f"api_status_{response.status_code}")
+        if response.status_code == 429:
+            log.warning("⚠️ API rate limit exceeded, using fallback quiz generator")
+            raise ApiStatusError("API rate limit exceeded", response.status_code)
+        else:
+            raise ApiStatusError(f"Failed to generate quiz. Status code: {response.status_code}",
+                                 response.status_code)
+
+
+def top_up_questions(text, questions, target=TARGET_QUESTIONS, max_rounds=TOPUP_MAX_ROUNDS,
+                     max_tokens=TOPUP_MAX_TOKENS):
+    """Ask for just the questions that sanitization and dedup left missing.
+
+    Each round requests the current shortfall with the accepted stems as
+    exclusions and a ``max_tokens`` budget sized to that shortfall. Stops at
+    ``target`` questions, after ``max_rounds`` rounds, when ``max_tokens``
+    completion tokens have been spent, or when a round adds nothing. A
+    failed round keeps what has been accepted so far. Returns the merged
+    list (``questions`` first).
+    """
+    accepted = list(questions)
+    tokens_left = max_tokens
+    for round_number in range(1, max_rounds + 1):
+        shortfall = target - len(accepted)
+        if shortfall <= 0 or tokens_left < completion_budget(1):
+            break
+        code_questions = max(1, shortfall // 3) if is_code_prompt(text) else 0
+        round_tokens = min(tokens_left, completion_budget(shortfall, code_questions))
+        tokens_left -= round_tokens
+        stems = [q.get('question', '') for q in accepted]
+        log.info("➕ Top-up round %d: requesting %d missing questions", round_number, shortfall)
+        quiz_metrics.incr("topup_rounds")
+        try:
+            with quiz_metrics.span("build_payload"):
+                payload = build_payload(text, question_count=shortfall, exclude=stems, max_tokens=round_tokens)
+            extra = request_questions(payload)
+        except Exception as topup_error:
+            log.warning("⚠️ Top-up round %d failed: %s", round_number, topup_error)
+            break
+        with quiz_metrics.span("dedup"):
+            extra = dedup_questions(extra, previous=accepted)[:shortfall]
+        if not extra:
+            break
+        quiz_metrics.incr("topup_questions", len(extra))
+        accepted.extend(extra)
+    return accepted
+
+
+def generate_questions_from_text(text, use_cache=True):
+    try:
+        with quiz_metrics.span("prepare_input"):
+            text = prepare_input_text(text)
+
+        cache, cache_key, cached = lookup_cache(text, use_cache)
+        if cached is not None:
+            return cached
+
+        bank, match = lookup_bank(text, use_cache)
+        if match is not None:
+            questions = quiz_from_bank(text, match)
+            if questions:
+                bank_questions(bank, text, questions)
+                return store_in_cache(cache, cache_key, json.dumps(questions))
+
+        # Try Mistral API first (mixed classification: code vs theory→MCQ)
+        try:
+            with quiz_metrics.span("build_payload"):
+                payload = build_payload(text)
+            questions = request_questions(payload)
+            if len(questions) < TARGET_QUESTIONS:
+                questions = top_up_questions(text, questions)
         except Exception as api_error:
-            print(f"⚠️ Mistral API failed: {api_error}, using fallback generator", file=sys.stderr)
+            log.warning("⚠️ Mistral API failed: %s, using fallback generator", api_error)
             # Fallback to simple quiz generation
             return generate_fallback_quiz(text)
-            
+        bank_questions(bank, text, questions)
+        return store_in_cache(cache, cache_key, json.dumps(questions))
+
     except Exception as e:
-        print(f"❌ Exception in quiz generation: {e}", file=sys.stderr)
+        log.error("❌ Exception in quiz generation: %s", e)
         return f"Error: {str(e)}"
 
-def generate_fallback_quiz(text):
-    """Generate a simple quiz when API is not available - improved to avoid generic answers"""
-    print("🔄 Using fallback quiz generator", file=sys.stderr)
-    print("⚠️ WARNING: Fallback generator may produce lower quality questions. Consider checking Mistral API configuration.", file=sys.stderr)
+
+def split_into_sections(text, max_tokens=1000):
+    """Pack blank-line separated blocks into sections of about ``max_tokens``.
+
+    Blocks longer than the budget are split at sentence boundaries, and a
+    single overlong sentence is hard-cut.
+    """
+    max_chars = max_tokens * 4
+    pieces = []
+    for block in re.split(r"\n{2,}", text):
+        block = block.strip()
+        if not block:
+            continue
+        if len(block) <= max_chars:
+            pieces.append(block)
+            continue
+        current = ''
+        for sentence in re.split(r'(?<=[.!?])\s+', block):
+            while len(sentence) > max_chars:
+                if current:
+                    pieces.append(current)
+                    current = ''
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+        if current:
+            pieces.append(current)
+
+    sections = []
+    current = []
+    size = 0
+    for piece in pieces:
+        if current and size + len(piece) > max_chars:
+            sections.append("\n\n".join(current))
+            current = []
+            size = 0
+        current.append(piece)
+        size += len(piece) + 2
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def merge_section_questions(section_questions, target_questions):
+    """Merge per-section results into one quiz of ``target_questions``.
+
+    Questions are taken round-robin across sections so that coverage spans
+    the whole document, skipping near-duplicates of questions already taken
+    (overlapping sections often yield paraphrases of the same question).
+    """
+    merged = []
+    index = NearDuplicateIndex()
+    queues = [list(questions) for questions in section_questions if questions]
+    while queues and len(merged) < target_questions:
+        for queue in list(queues):
+            while queue:
+                question = queue.pop(0)
+                if index.add_question(question):
+                    merged.append(question)
+                    break
+            if not queue:
+                queues.remove(queue)
+            if len(merged) >= target_questions:
+                break
+    return merged
+
+
+def generate_questions_chunked(text, target_questions=10, max_sections=8, concurrency=4, use_cache=True):
+    """Map-reduce generation over the whole document instead of its first
+    4000 characters.
+
+    The text is split into at most about ``max_sections`` token-budgeted
+    sections, each section is asked for its share of the questions in
+    parallel, and the results are merged with ``merge_section_questions``.
+    Returns JSON like ``generate_questions_from_text``.
+    """
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        with quiz_metrics.span("prepare_input"):
+            text = prepare_input_text(text, max_length=None)
+
+        variant = f":chunked:{target_questions}:{max_sections}"
+        cache, cache_key, cached = lookup_cache(text, use_cache, variant)
+        if cached is not None:
+            return cached
+
+        section_tokens = max(MIN_SECTION_TOKENS, -(-estimate_tokens(text) // max(1, max_sections)))
+        with quiz_metrics.span("split_sections"):
+            sections = split_into_sections(text, section_tokens)
+        # One extra question per section leaves room for duplicates and rejects
+        quota = min(MAX_QUESTIONS, -(-target_questions // len(sections)) + 1)
+        log.info("🧩 Split input into %d sections, %d questions each", len(sections), quota)
+
+        def run_section(index_and_section):
+            index, section = index_and_section
+            try:
+                return request_questions(build_payload(section, question_count=quota, max_blocks=None,
+                                                       content_tokens=None))
+            except Exception as section_error:
+                quiz_metrics.incr("section_failed")
+                log.warning("⚠️ Section %d failed: %s", index + 1, section_error)
+                return []
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(sections)))) as pool:
+            # Run each section in a copy of this job's context so its metrics
+            # and debug log follow it onto the pool thread
+            futures = [pool.submit(contextvars.copy_context().run, run_section, item)
+                       for item in enumerate(sections)]
+            section_questions = [future.result() for future in futures]
+
+        with quiz_metrics.span("merge_sections"):
+            questions = merge_section_questions(section_questions, target_questions)
+        if not questions:
+            log.warning("⚠️ No section produced questions, using fallback generator")
+            return generate_fallback_quiz(text)
+        return store_in_cache(cache, cache_key, json.dumps(questions))
+
+    except Exception as e:
+        log.error("❌ Exception in quiz generation: %s", e)
+        return f"Error: {str(e)}"
+
+
+def stream_questions_from_text(text, emit, use_cache=True):
+    """Generate a quiz, passing each sanitized question to ``emit`` as soon
+    as the model has finished writing it.
+
+    Uses the provider's streaming responses and parses the JSON array
+    incrementally. If the stream fails before producing any usable
+    question, the fallback quiz is emitted instead. Returns the number of
+    questions emitted.
+    """
+    with quiz_metrics.span("prepare_input"):
+        text = prepare_input_text(text)
+
+    cache, cache_key, cached = lookup_cache(text, use_cache)
+    if cached is not None:
+        questions = json.loads(cached)
+        for question in questions:
+            emit(question)
+        return len(questions)
+
+    bank, match = lookup_bank(text, use_cache)
+    if match is not None:
+        questions = quiz_from_bank(text, match)
+        if questions:
+            for question in questions:
+                emit(question)
+            bank_questions(bank, text, questions)
+            store_in_cache(cache, cache_key, json.dumps(questions))
+            return len(questions)
+
+    emitted = []
+    index = NearDuplicateIndex()
+    try:
+        parser = IncrementalArrayParser()
+        with upstream_call():
+            for delta in api_client().chat_stream(build_payload(text)):
+                with quiz_metrics.span("parse_json"):
+                    objects = parser.feed(delta)
+                for obj in objects:
+                    questions = sanitize_questions([obj])
+                    unique = [question for question in questions if index.add_question(question)]
+                    if len(unique) < len(questions):
+                        quiz_metrics.incr("dropped_duplicate", len(questions) - len(unique))
+                    for question in check_code_questions(unique):
+                        emitted.append(question)
+                        emit(question)
+                if parser.done or len(emitted) >= MAX_QUESTIONS:
+                    break
+        if parser.skipped:
+            quiz_metrics.incr("json_skipped_objects", parser.skipped)
+            log.info("⚠️ Skipped %d malformed objects in streamed response", parser.skipped)
+        if emitted:
+            if len(emitted) < TARGET_QUESTIONS:
+                for question in top_up_questions(text, emitted)[len(emitted):]:
+                    emitted.append(question)
+                    emit(question)
+            bank_questions(bank, text, emitted)
+            store_in_cache(cache, cache_key, json.dumps(emitted))
+            return len(emitted)
+        log.warning("⚠️ Streamed response contained no usable questions, using fallback generator")
+    except Exception as api_error:
+        if emitted:
+            # The teacher already has these questions; a partial quiz beats a restart
+            log.warning("⚠️ Stream broke after %d questions: %s", len(emitted), api_error)
+            return len(emitted)
+        log.warning("⚠️ Mistral streaming failed: %s, using fallback generator", api_error)
+
+    questions = json.loads(generate_fallback_quiz(text))
+    for question in questions:
+        emit(question)
+    return len(questions)
+
+
+class TermIndex:
+    """Lazily built term -> sentence-indices index over lowercased sentences.
+
+    Each term's posting list is computed once, on first use, with a single
+    pass over the pre-lowercased sentences (substring match, like the
+    original ``term in s.lower()`` scan).
+    """
+
+    def __init__(self, lowered_sentences):
+        self.lowered = lowered_sentences
+        self._postings = {}
+
+    def __getitem__(self, term):
+        hits = self._postings.get(term)
+        if hits is None:
+            hits = [i for i, s in enumerate(self.lowered) if term in s]
+            self._postings[term] = hits
+        return hits
+
+
+@quiz_metrics.timed("fallback")
+def generate_fallback_quiz(text, ranking='bm25'):
+    """Generate a simple quiz when API is not available - improved to avoid generic answers
+
+    With ``ranking='bm25'`` terms are ranked by BM25 salience over the
+    sentences and distractors are the sentences most similar to the
+    correct one; ``ranking='frequency'`` keeps the original raw-count terms
+    and randomly shuffled distractors.
+    """
+    quiz_metrics.incr("fallback_used")
+    log.info("🔄 Using fallback quiz generator")
+    log.warning("⚠️ WARNING: Fallback generator may produce lower quality questions. Consider checking Mistral API configuration.")
     
     if not text or len(text.strip()) < 50:
-        print("❌ Error: Insufficient content in PDF to generate quiz", file=sys.stderr)
+        log.error("❌ Error: Insufficient content in PDF to generate quiz")
         raise ValueError("Insufficient content in PDF. Please ensure the PDF contains readable text (at least 50 characters).")
     
     questions = []
@@ -383,8 +1030,14 @@ def generate_fallback_quiz(text):
     
     # Get significant terms - include terms that appear at least once if we don't have enough
     # Get more terms to ensure we can generate 10 questions
-    significant_terms = sorted([(term, count) for term, count in term_counts.items() if count >= 1], 
-                              key=lambda x: x[1], reverse=True)[:15]
+    with quiz_metrics.span("fallback_ranking"):
+        if ranking == 'bm25':
+            term_matrix = SentenceTermMatrix(meaningful_sentences)
+            significant_terms = term_matrix.rank_terms(term_counts, limit=15)
+        else:
+            term_matrix = None
+            significant_terms = sorted([(term, count) for term, count in term_counts.items() if count >= 1],
+                                      key=lambda x: x[1], reverse=True)[:15]
     
     # If text looks like coding prompt, create a code question first
     if is_code_prompt(text):
@@ -445,139 +1098,132 @@ def generate_fallback_quiz(text):
     
     # Track used sentences/options across all questions to avoid duplicates
     used_sentences = set()
-    
+
+    # Lowercase every sentence once and index which sentences mention each
+    # significant term, instead of rescanning all sentences per term
+    term_index = TermIndex([s.lower() for s in meaningful_sentences])
+
     # Generate questions from significant terms found in the text
     # Use actual content sentences as options
     processed_terms = 0
     for term, count in significant_terms:
         if processed_terms >= 10:  # Limit to 10 questions
             break
-            
-        term_lower = term.lower()
-        # Find sentences containing this term
-        context_sentences = [s for s in meaningful_sentences if term_lower in s.lower() and s not in used_sentences]
-        
-        if context_sentences:
-            # Pick a context sentence that hasn't been used yet
-            context = None
-            for ctx in context_sentences:
-                if ctx not in used_sentences:
-                    context = ctx
-                    break
-            
-            if not context:
-                continue  # Skip if all context sentences are used
-            
-            # Create a question
-            question_text = f"What does the content say about {term}?"
-            
-            # Create correct option from context - normalize to avoid duplicates
-            correct_option_raw = context[:120].strip()
-            if len(context) > 120:
-                correct_option_raw += "..."
-            
-            # Normalize the option for comparison (remove extra spaces, lowercase first 50 chars)
-            correct_option_normalized = correct_option_raw.lower().strip()[:50]
-            
-            # Mark this sentence as used
-            used_sentences.add(context)
-            
-            # Find other sentences for distractors - avoid already used ones
-            distractors = []
-            other_sentences = [s for s in meaningful_sentences 
-                             if s != context 
-                             and s not in used_sentences
-                             and term_lower not in s.lower()]
-            
+
+        # Pick the first sentence mentioning this term that hasn't been used yet
+        term_hits = term_index[term.lower()]
+        context_index = next((i for i in term_hits if meaningful_sentences[i] not in used_sentences), None)
+        if context_index is None:
+            continue  # Skip if all context sentences are used
+        context = meaningful_sentences[context_index]
+
+        # Create a question
+        question_text = f"What does the content say about {term}?"
+
+        # Create correct option from context - normalize to avoid duplicates
+        correct_option_raw = context[:120].strip()
+        if len(context) > 120:
+            correct_option_raw += "..."
+
+        # Normalize the option for comparison (remove extra spaces, lowercase first 50 chars)
+        correct_option_normalized = correct_option_raw.lower().strip()[:50]
+
+        # Mark this sentence as used
+        used_sentences.add(context)
+
+        # Find other sentences for distractors - avoid already used ones and
+        # any sentence mentioning the term (which includes the context itself)
+        distractors = []
+        distractor_keys = set()
+        hit_set = set(term_hits)
+        if term_matrix is not None:
+            # Most similar sentences first: plausible but wrong answers
+            other_sentences = [meaningful_sentences[i] for i in term_matrix.rank_similar(context_index, exclude=hit_set)
+                               if meaningful_sentences[i] not in used_sentences]
+        else:
+            other_sentences = [s for i, s in enumerate(meaningful_sentences)
+                               if i not in hit_set and s not in used_sentences]
+
             # Shuffle to get variety
             random.shuffle(other_sentences)
-            
-            # Use up to 3 other sentences as distractors, ensuring uniqueness
-            for other_sent in other_sentences:
+
+        # Use up to 3 other sentences as distractors, ensuring uniqueness
+        for other_sent in other_sentences:
+            if len(distractors) >= 3:
+                break
+
+            distractor_raw = other_sent[:120].strip()
+            if len(other_sent) > 120:
+                distractor_raw += "..."
+
+            # Normalize for comparison
+            distractor_normalized = distractor_raw.lower().strip()[:50]
+
+            # Check if this distractor is unique (not same as correct, not same as other distractors)
+            if (distractor_raw and distractor_normalized != correct_option_normalized
+                    and distractor_normalized not in distractor_keys):
+                distractors.append(distractor_raw)
+                distractor_keys.add(distractor_normalized)
+                used_sentences.add(other_sent)  # Mark as used to avoid reuse in other questions
+
+        # If we still don't have enough distractors, try creating variations
+        if len(distractors) < 3:
+            # Get more sentences that aren't used
+            remaining_sentences = [s for s in meaningful_sentences
+                                   if s not in used_sentences
+                                   and s != context
+                                   and s[:120].strip().lower()[:50] not in distractor_keys]
+
+            random.shuffle(remaining_sentences)
+
+            for other_sent in remaining_sentences:
                 if len(distractors) >= 3:
                     break
-                    
+
                 distractor_raw = other_sent[:120].strip()
                 if len(other_sent) > 120:
                     distractor_raw += "..."
-                
-                # Normalize for comparison
+
                 distractor_normalized = distractor_raw.lower().strip()[:50]
-                
-                # Check if this distractor is unique (not same as correct, not same as other distractors)
-                is_unique = (distractor_normalized != correct_option_normalized and
-                           distractor_normalized not in [d.lower().strip()[:50] for d in distractors])
-                
-                if distractor_raw and is_unique:
+                if (distractor_raw and distractor_normalized != correct_option_normalized
+                        and distractor_normalized not in distractor_keys):
                     distractors.append(distractor_raw)
-                    used_sentences.add(other_sent)  # Mark as used to avoid reuse in other questions
-            
-            # If we still don't have enough distractors, try creating variations
-            if len(distractors) < 3:
-                # Get more sentences that aren't used
-                remaining_sentences = [s for s in meaningful_sentences 
-                                     if s not in used_sentences 
-                                     and s != context
-                                     and s[:120].strip().lower()[:50] not in [d.lower().strip()[:50] for d in distractors]]
-                
-                random.shuffle(remaining_sentences)
-                
-                for other_sent in remaining_sentences:
-                    if len(distractors) >= 3:
-                        break
-                    
-                    distractor_raw = other_sent[:120].strip()
-                    if len(other_sent) > 120:
-                        distractor_raw += "..."
-                    
-                    distractor_normalized = distractor_raw.lower().strip()[:50]
-                    is_unique = (distractor_normalized != correct_option_normalized and
-                               distractor_normalized not in [d.lower().strip()[:50] for d in distractors])
-                    
-                    if distractor_raw and is_unique:
-                        distractors.append(distractor_raw)
-                        used_sentences.add(other_sent)
-            
-            # Only add if we have at least 1 distractor (2 total options minimum)
-            if len(distractors) >= 1:
-                # If we still don't have 3 distractors, create unique generic ones
-                generic_counter = 1
-                while len(distractors) < 3:
-                    distractor = f"A different point discussed in the document"
-                    distractor_normalized = distractor.lower().strip()[:50]
-                    if (distractor_normalized not in [d.lower().strip()[:50] for d in distractors] and
-                        distractor_normalized != correct_option_normalized):
-                        distractors.append(distractor)
-                    else:
-                        generic_counter += 1
-                        if generic_counter > 5:  # Avoid infinite loop
-                            break
-                
-                # Ensure we have exactly 4 options
-                while len(distractors) < 3:
-                    # Add placeholder that will be unique
-                    distractor = f"Additional information from section {len(distractors) + 1}"
-                    distractors.append(distractor)
-                
-                options = [correct_option_raw] + distractors[:3]
-                
-                # Shuffle options but remember correct answer index
-                correct_idx = 0
-                indices = list(range(4))
-                random.shuffle(indices)
-                shuffled_options = [options[i] for i in indices]
-                correct_idx = indices.index(0)
-                answer_letter = chr(65 + correct_idx)  # A, B, C, or D
-                
-                question = {
-                    "question": question_text,
-                    "options": shuffled_options,
-                    "answer": answer_letter,
-                    "type": "mcq"
-                }
-                questions.append(question)
-                processed_terms += 1
-    
+                    distractor_keys.add(distractor_normalized)
+                    used_sentences.add(other_sent)
+
+        # Only add if we have at least 1 distractor (2 total options minimum)
+        if len(distractors) >= 1:
+            # If we still don't have 3 distractors, add one generic distractor
+            distractor = "A different point discussed in the document"
+            distractor_normalized = distractor.lower().strip()[:50]
+            if (len(distractors) < 3 and distractor_normalized not in distractor_keys
+                    and distractor_normalized != correct_option_normalized):
+                distractors.append(distractor)
+
+            # Ensure we have exactly 4 options
+            while len(distractors) < 3:
+                # Add placeholder that will be unique
+                distractor = f"Additional information from section {len(distractors) + 1}"
+                distractors.append(distractor)
+
+            options = [correct_option_raw] + distractors[:3]
+
+            # Shuffle options but remember correct answer index
+            indices = list(range(4))
+            random.shuffle(indices)
+            shuffled_options = [options[i] for i in indices]
+            correct_idx = indices.index(0)
+            answer_letter = chr(65 + correct_idx)  # A, B, C, or D
+
+            question = {
+                "question": question_text,
+                "options": shuffled_options,
+                "answer": answer_letter,
+                "type": "mcq"
+            }
+            questions.append(question)
+            processed_terms += 1
+
     # If we still don't have enough questions, try creating simple comprehension questions
     # Use sentences that haven't been used yet
     # Continue generating until we have at least 10 questions (or can't generate more)
@@ -605,6 +1251,7 @@ def generate_fallback_quiz(text):
                 
                 # Use other unused sentences as distractors
                 distractors = []
+                distractor_keys = set()
                 remaining_unused = [s for s in unused_sentences if s != sent and s not in used_sentences]
                 random.shuffle(remaining_unused)
                 
@@ -619,19 +1266,17 @@ def generate_fallback_quiz(text):
                         distractor_normalized = distractor_raw.lower().strip()[:50]
                         if (distractor_raw and 
                             distractor_normalized != correct_option_normalized and
-                            distractor_normalized not in [d.lower().strip()[:50] for d in distractors]):
+                            distractor_normalized not in distractor_keys):
                             distractors.append(distractor_raw)
+                            distractor_keys.add(distractor_normalized)
                             used_sentences.add(other_sent)
                 
-                # Fill remaining slots with unique placeholders
-                while len(distractors) < 3:
-                    placeholder = f"Content from a different part of the document"
-                    placeholder_normalized = placeholder.lower().strip()[:50]
-                    if (placeholder_normalized not in [d.lower().strip()[:50] for d in distractors] and
-                        placeholder_normalized != correct_option_normalized):
-                        distractors.append(placeholder)
-                    else:
-                        break
+                # Fill a remaining slot with a unique placeholder
+                placeholder = "Content from a different part of the document"
+                placeholder_normalized = placeholder.lower().strip()[:50]
+                if (len(distractors) < 3 and placeholder_normalized not in distractor_keys and
+                    placeholder_normalized != correct_option_normalized):
+                    distractors.append(placeholder)
                 
                 if len(distractors) >= 1:
                     options = [correct_option_raw] + distractors[:3]
@@ -662,36 +1307,236 @@ def generate_fallback_quiz(text):
     
     # Final check - if we still have no questions, raise an error
     if len(questions) == 0:
-        print("❌ Error: Could not extract enough content from PDF to generate quiz", file=sys.stderr)
+        log.error("❌ Error: Could not extract enough content from PDF to generate quiz")
         raise ValueError("Unable to generate quiz from PDF content. The PDF may be empty, contain only images, or have insufficient text. Please ensure the PDF contains readable text content.")
     
-    print(f"✅ Generated {len(questions)} fallback questions from content analysis", file=sys.stderr)
+    log.info("✅ Generated %d fallback questions from content analysis", len(questions))
     return json.dumps(questions)
 
-if __name__ == "__main__":
-    try:
-        print("📥 Reading input from stdin...", file=sys.stderr)
-        notes_content = sys.stdin.read().strip()
+def run_job(job):
+    """Run a single worker job and build its result record.
 
-        if not notes_content:
-            print("❗ Error: No input provided", file=sys.stderr)
-            sys.exit(1)
+    A job is a dict with an optional ``id``, the document ``text`` and the
+    optional flags ``no_cache``, ``chunked`` and ``questions`` (chunked
+    target). ``previous_questions`` lists questions the course already has;
+    near-duplicates of them are dropped. The result echoes the id so
+    callers can match replies to requests.
+    """
+    job_id = job.get('id') if isinstance(job, dict) else None
+    with quiz_logging.capture() as debug_log, quiz_metrics.track_job(job_id) as metrics:
+        result = _run_job(job, job_id)
+        if metrics is not None:
+            metrics.ok = result['ok']
+            metrics.questions = len(result.get('questions') or ())
+        if not result['ok']:
+            quiz_logging.dump(debug_log, f"job {job_id}: {result['error']}")
+        return result
 
-        print("⚙️ Generating quiz from content...", file=sys.stderr)
-        quiz = generate_questions_from_text(notes_content)
 
+def _run_job(job, job_id):
+    try:
+        if not isinstance(job, dict):
+            raise ValueError("Job must be a JSON object")
+        use_cache = not job.get('no_cache')
+        if job.get('chunked'):
+            quiz = generate_questions_chunked(job.get('text') or '',
+                                              target_questions=int(job.get('questions') or 10),
+                                              use_cache=use_cache)
+        else:
+            quiz = generate_questions_from_text(job.get('text') or '', use_cache=use_cache)
         if quiz.startswith("Error:"):
-            print(quiz, file=sys.stderr)
+            return {"id": job_id, "ok": False, "error": quiz[len("Error:"):].strip()}
+        questions = json.loads(quiz)
+        if job.get('previous_questions'):
+            with quiz_metrics.span("dedup_previous"):
+                questions = dedup_questions(questions, previous=job['previous_questions'])
+        return {"id": job_id, "ok": True, "questions": questions}
+    except Exception as e:
+        return {"id": job_id, "ok": False, "error": str(e)}
+
+
+async def generate_quizzes_batch(texts, concurrency=4, use_cache=True):
+    """Generate quizzes for many documents concurrently.
+
+    Each item of ``texts`` is a document's text, or a whole worker job
+    (see ``run_job``) to pass ``chunked``, ``questions`` or
+    ``previous_questions`` too. At most ``concurrency`` documents are in
+    flight at once; API calls are additionally paced by the client's token
+    bucket. Results come back in input order as ``run_job`` records, so
+    one failing document does not abort the batch; an item without an
+    ``id`` gets its index in ``texts``. ``use_cache=False`` sets
+    ``no_cache`` on every job.
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(index, job):
+        if isinstance(job, str):
+            job = {"text": job}
+        if isinstance(job, dict):
+            job = dict(job, id=job.get('id', index))
+            if not use_cache:
+                job['no_cache'] = True
+        async with semaphore:
+            return await asyncio.to_thread(run_job, job)
+
+    return await asyncio.gather(*(run_one(i, job) for i, job in enumerate(texts)))
+
+
+def parse_job(line):
+    """``(job, None)`` for one NDJSON input line, or ``(None, result)``
+    with the error result to reply when it is not JSON."""
+    try:
+        return json.loads(line), None
+    except json.JSONDecodeError as e:
+        return None, {"id": None, "ok": False, "error": f"Invalid job: {e}"}
+
+
+def run_batch(stream_in, stream_out, concurrency=4, use_cache=True):
+    """Read all NDJSON jobs from the input, run them as one batch and write
+    the results in input order. Lines that are not valid jobs get an error
+    result in their place, as in ``run_worker``."""
+    import asyncio
+
+    parsed = [parse_job(line) for line in stream_in if line.strip()]
+    jobs = [job for job, error in parsed if isinstance(job, dict)]
+    results = iter(asyncio.run(generate_quizzes_batch(jobs, concurrency=concurrency, use_cache=use_cache)))
+    for job, error in parsed:
+        if error is None:
+            # Lines that are JSON but not objects fail in run_job, as in run_worker
+            error = next(results) if isinstance(job, dict) else run_job(job)
+        stream_out.write(json.dumps(error) + "\n")
+    stream_out.flush()
+
+
+def run_worker(stream_in, stream_out):
+    """Serve newline-delimited JSON jobs until the input stream closes.
+
+    Each input line is one job, each output line is one result. stdout is
+    reserved for results; diagnostics keep going to stderr.
+    """
+    log.info("👷 Quiz worker ready")
+    for line in stream_in:
+        line = line.strip()
+        if not line:
+            continue
+        job, result = parse_job(line)
+        if result is None:
+            result = run_job(job)
+        stream_out.write(json.dumps(result) + "\n")
+        stream_out.flush()
+
+
+def serve_unix_socket(path):
+    """Serve worker jobs on a local Unix socket, one thread per connection."""
+    import socket_server
+    socket_server.serve_unix_socket(path, run_worker, "Quiz worker")
+
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate a quiz from text read on stdin.")
+    parser.add_argument('--worker', action='store_true',
+                        help="Stay alive and serve newline-delimited JSON jobs on stdin")
+    parser.add_argument('--socket', metavar='PATH',
+                        help="With --worker, serve jobs on a Unix socket instead of stdin")
+    parser.add_argument('--batch', action='store_true',
+                        help="Read newline-delimited JSON jobs on stdin and run them concurrently")
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help="With --batch, the number of documents generated at once")
+    parser.add_argument('--stream', action='store_true',
+                        help="Write each question as an NDJSON line as soon as it is generated")
+    parser.add_argument('--chunked', action='store_true',
+                        help="Generate from the whole document in parallel sections instead of its first 4000 characters")
+    parser.add_argument('--questions', type=int, default=10,
+                        help="With --chunked, the total number of questions to produce")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Bypass the quiz cache and always call the API")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="With --worker, serve Prometheus metrics on http://127.0.0.1:PORT/metrics "
+                             "(enables QUIZ_METRICS)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    load_environment()
+    if args.worker:
+        if args.metrics_port:
+            os.environ['QUIZ_METRICS'] = 'true'
+            quiz_metrics.serve_prometheus(args.metrics_port)
+            log.info("📈 Metrics on http://127.0.0.1:%d/metrics", args.metrics_port)
+        try:
+            if args.socket:
+                serve_unix_socket(args.socket)
+            else:
+                run_worker(sys.stdin, sys.stdout)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.stream:
+        def emit(question):
+            sys.stdout.write(json.dumps(question) + "\n")
+            sys.stdout.flush()
+
+        try:
+            with quiz_logging.capture() as debug_log, quiz_metrics.track_job() as metrics:
+                try:
+                    count = stream_questions_from_text(sys.stdin.read().strip(), emit, use_cache=not args.no_cache)
+                except ValueError as ve:
+                    quiz_logging.dump(debug_log, str(ve))
+                    raise
+                if metrics is not None:
+                    metrics.ok = True
+                    metrics.questions = count
+        except ValueError as ve:
+            error_msg = f"Error: {str(ve)}"
+            print(error_msg, file=sys.stderr)
+            print(error_msg)
             sys.exit(1)
+        sys.exit(0)
 
-        print(quiz)
-    except ValueError as ve:
-        # ValueError from fallback generator - return clear error message
-        error_msg = f"Error: {str(ve)}"
-        print(error_msg, file=sys.stderr)
-        print(error_msg)  # Also output to stdout so backend can catch it
-        sys.exit(1)
-    except Exception as e:
-        print(f"🚨 Main error: {e}", file=sys.stderr)
-        print(f"Error: Quiz generation failed: {str(e)}")  # Output to stdout too
-        sys.exit(1)
+    if args.batch:
+        run_batch(sys.stdin, sys.stdout, concurrency=args.concurrency, use_cache=not args.no_cache)
+        sys.exit(0)
+
+    with quiz_logging.capture() as debug_log:
+        try:
+            log.debug("📥 Reading input from stdin...")
+            notes_content = sys.stdin.read().strip()
+
+            if not notes_content:
+                log.error("❗ Error: No input provided")
+                sys.exit(1)
+
+            log.debug("⚙️ Generating quiz from content...")
+            with quiz_metrics.track_job() as metrics:
+                if args.chunked:
+                    quiz = generate_questions_chunked(notes_content, target_questions=args.questions,
+                                                      use_cache=not args.no_cache)
+                else:
+                    quiz = generate_questions_from_text(notes_content, use_cache=not args.no_cache)
+                if metrics is not None:
+                    metrics.ok = not quiz.startswith("Error:")
+                    metrics.questions = len(json.loads(quiz)) if metrics.ok else None
+
+            if quiz.startswith("Error:"):
+                quiz_logging.dump(debug_log, quiz)
+                print(quiz, file=sys.stderr)
+                sys.exit(1)
+
+            print(quiz)
+        except ValueError as ve:
+            # ValueError from fallback generator - return clear error message
+            error_msg = f"Error: {str(ve)}"
+            quiz_logging.dump(debug_log, error_msg)
+            print(error_msg, file=sys.stderr)
+            print(error_msg)  # Also output to stdout so backend can catch it
+            sys.exit(1)
+        except Exception as e:
+            log.error("🚨 Main error: %s", e)
+            quiz_logging.dump(debug_log, str(e))
+            print(f"Error: Quiz generation failed: {str(e)}")  # Output to stdout too
+            sys.exit(1)
@@ -0,0 +1,125 @@
+"""Level-gated logging with a per-job debug ring buffer.
+
+Everything logs through the standard ``logging`` module under the ``quiz``
+logger, with %-style arguments so a message is only formatted when some
+handler actually needs it. Records at ``QUIZ_LOG_LEVEL`` (INFO by default)
+and above go to stderr as they happen.
+
+Every record, DEBUG included, is also kept in a bounded in-memory buffer
+belonging to the current job (``QUIZ_LOG_BUFFER`` records, default 200).
+The buffer is written out only when the job fails, so a failure comes with
+the payload and raw reply that led to it while successful jobs stay quiet.
+"""
+import collections
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+from quiz_env import env_int
+
+LOGGER_NAME = 'quiz'
+DEFAULT_BUFFER_SIZE = 200
+
+_buffer = contextvars.ContextVar('quiz_debug_buffer', default=None)
+_configure_lock = threading.Lock()
+_dump_lock = threading.Lock()
+_dump_formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+class lazy_json:
+    """Defers ``json.dumps`` of a log argument until the record is formatted."""
+    __slots__ = ('value', 'indent')
+
+    def __init__(self, value, indent=2):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.value, indent=self.indent)
+
+
+class _StderrHandler(logging.StreamHandler):
+    """Writes to whatever ``sys.stderr`` is at emit time, so redirections
+    made after start-up (benchmarks, tests) are honoured."""
+
+    def __init__(self):
+        super().__init__(sys.stderr)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _RingBufferHandler(logging.Handler):
+    """Appends records to the current job's buffer, if there is one."""
+
+    def emit(self, record):
+        buffer = _buffer.get()
+        if buffer is not None:
+            buffer.append(record)
+
+
+def _env_level():
+    level = os.getenv('QUIZ_LOG_LEVEL', 'INFO').upper()
+    return level if isinstance(logging.getLevelName(level), int) else logging.INFO
+
+
+def apply_env_level():
+    """Re-read ``QUIZ_LOG_LEVEL``, e.g. after ``.env`` has been loaded."""
+    for handler in get_logger().handlers:
+        if isinstance(handler, _StderrHandler):
+            handler.setLevel(_env_level())
+
+
+def get_logger(name=None):
+    """The ``quiz`` logger (or a child of it), configured on first use."""
+    logger = logging.getLogger(LOGGER_NAME)
+    if not getattr(logger, '_quiz_configured', False):
+        with _configure_lock:
+            if not getattr(logger, '_quiz_configured', False):
+                stderr_handler = _StderrHandler()
+                stderr_handler.setLevel(_env_level())
+                stderr_handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(stderr_handler)
+                logger.addHandler(_RingBufferHandler(logging.DEBUG))
+                logger.setLevel(logging.DEBUG)
+                logger.propagate = False
+                logger._quiz_configured = True
+    return logger.getChild(name) if name else logger
+
+
+@contextmanager
+def capture(capacity=None):
+    """Keep the debug records logged inside the ``with`` block (on this
+    thread and in contexts copied from it) in a fresh ring buffer."""
+    if capacity is None:
+        capacity = env_int('QUIZ_LOG_BUFFER', DEFAULT_BUFFER_SIZE)
+    buffer = collections.deque(maxlen=max(1, capacity))
+    token = _buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer.reset(token)
+
+
+def dump(buffer, reason):
+    """Write a captured buffer to stderr, oldest record first."""
+    if not buffer:
+        return
+    lines = [f"🪵 Debug log of failed job ({reason}), last {len(buffer)} events:"]
+    for record in buffer:
+        try:
+            lines.append(_dump_formatter.format(record))
+        except Exception as e:
+            lines.append(f"<unformattable record {record.msg!r}: {e}>")
+    with _dump_lock:
+        sys.stderr.write("\n".join(lines) + "\n")
+        sys.stderr.flush()
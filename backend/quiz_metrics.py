@@ -0,0 +1,245 @@
+"""Per-job timing spans and counters for quiz generation.
+
+Set ``QUIZ_METRICS=true`` to turn them on. Each job then gets a
+``JobMetrics`` that records how long every stage took (input cleanup, the
+API round trip, JSON parsing, sanitization, the fallback, ...) and counts
+events such as fallback use, dropped questions by reason and salvaged
+JSON. When the job ends, one JSON record is appended to ``QUIZ_METRICS_PATH``
+(stderr when unset) and folded into a process-wide registry that can be
+rendered in the Prometheus text format.
+
+The current job is held in a context variable, so ``span`` and ``incr`` can
+be called from anywhere without threading a metrics object through. With
+metrics off, or outside a job, both return immediately.
+"""
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage duration histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current = contextvars.ContextVar('quiz_job_metrics', default=None)
+
+
+def metrics_enabled():
+    return os.getenv('QUIZ_METRICS', '').lower() in ('1', 'true', 'yes')
+
+
+class JobMetrics:
+    """Stage timings and counters of one job. Safe to update from several
+    threads (chunked generation runs sections in parallel)."""
+
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        # Set by the caller once the job's outcome is known
+        self.ok = False
+        self.questions = None
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                self.stages[stage] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self):
+        return {
+            "id": self.job_id,
+            "ok": self.ok,
+            "questions": self.questions,
+            "seconds": round(time.perf_counter() - self.started, 6),
+            "stages": {stage: {"calls": calls, "seconds": round(seconds, 6)}
+                       for stage, (calls, seconds) in self.stages.items()},
+            "counters": dict(self.counters),
+        }
+
+
+class _Span:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage):
+    """Context manager timing ``stage`` within the current job."""
+    metrics = _current.get()
+    if metrics is None:
+        return _NULL_SPAN
+    return _Span(metrics, stage)
+
+
+def timed(stage):
+    """Decorator form of ``span`` for a whole function."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def incr(name, amount=1):
+    """Add ``amount`` to the counter ``name`` of the current job."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.incr(name, amount)
+
+
+class MetricsRegistry:
+    """Process-wide totals across finished jobs, for Prometheus scraping."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.jobs = {"ok": 0, "error": 0}
+        self.counters = {}
+        # stage -> [bucket counts..., count, sum]
+        self.stages = {}
+
+    def observe(self, record):
+        with self._lock:
+            self.jobs["ok" if record["ok"] else "error"] += 1
+            for name, value in record["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            stages = dict(record["stages"])
+            stages["job"] = {"calls": 1, "seconds": record["seconds"]}
+            for stage, entry in stages.items():
+                histogram = self.stages.get(stage)
+                if histogram is None:
+                    histogram = self.stages[stage] = [0] * (len(BUCKETS) + 2)
+                # A stage entered several times in one job is observed once,
+                # with its total time for that job
+                seconds = entry["seconds"]
+                for i, bound in enumerate(BUCKETS):
+                    if seconds <= bound:
+                        histogram[i] += 1
+                histogram[-2] += 1
+                histogram[-1] += seconds
+
+    def render_prometheus(self):
+        with self._lock:
+            lines = [
+                "# HELP quiz_jobs_total Quiz generation jobs by outcome.",
+                "# TYPE quiz_jobs_total counter",
+            ]
+            for outcome, value in sorted(self.jobs.items()):
+                lines.append(f'quiz_jobs_total{{outcome="{outcome}"}} {value}')
+            lines += [
+                "# HELP quiz_events_total Generation events (fallback use, dropped questions, JSON salvage).",
+                "# TYPE quiz_events_total counter",
+            ]
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'quiz_events_total{{event="{name}"}} {value}')
+            lines += [
+                "# HELP quiz_stage_seconds Time spent per job in each generation stage.",
+                "# TYPE quiz_stage_seconds histogram",
+            ]
+            for stage, histogram in sorted(self.stages.items()):
+                for bound, count in zip(BUCKETS, histogram):
+                    lines.append(f'quiz_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'quiz_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram[-2]}')
+                lines.append(f'quiz_stage_seconds_count{{stage="{stage}"}} {histogram[-2]}')
+                lines.append(f'quiz_stage_seconds_sum{{stage="{stage}"}} {histogram[-1]:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+_sink_lock = threading.Lock()
+
+
+def emit_record(record):
+    line = json.dumps(record) + "\n"
+    path = os.getenv('QUIZ_METRICS_PATH')
+    with _sink_lock:
+        if path:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        else:
+            sys.stderr.write(line)
+            sys.stderr.flush()
+
+
+@contextmanager
+def track_job(job_id=None):
+    """Collect metrics for the job running inside the ``with`` block.
+
+    Yields the job's ``JobMetrics`` (None when metrics are off); the caller
+    sets its ``ok`` and ``questions`` once the outcome is known. The record
+    is emitted and added to ``registry`` when the block exits.
+    """
+    if not metrics_enabled():
+        yield None
+        return
+    metrics = JobMetrics(job_id)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        record = metrics.record()
+        registry.observe(record)
+        emit_record(record)
+
+
+def serve_prometheus(port, host='127.0.0.1'):
+    """Expose ``registry`` at ``/metrics`` on a background HTTP server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
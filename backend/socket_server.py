@@ -0,0 +1,33 @@
+"""NDJSON services on a local Unix socket.
+
+The quiz worker and the code grader both read newline-delimited JSON on
+stdin and write replies to stdout; ``serve_unix_socket`` serves the same
+stream function on a socket instead, one thread per connection.
+"""
+import io
+import os
+import socketserver
+
+import quiz_logging
+
+log = quiz_logging.get_logger('socket')
+
+
+def serve_unix_socket(path, serve, name):
+    """Serve ``serve(reader, writer)`` on the Unix socket ``path`` until
+    interrupted; ``name`` is what the log says is listening."""
+
+    class StreamHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            reader = io.TextIOWrapper(self.rfile, encoding='utf-8')
+            writer = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+            serve(reader, writer)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    with socketserver.ThreadingUnixStreamServer(path, StreamHandler) as server:
+        log.info("🔌 %s listening on %s", name, path)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
@@ -284,7 +284,8 @@ router.post('/generate', authMiddleware, teacherMiddleware, upload.single('file'
 
         console.log(`✅ Using Python executable: ${selected.cmd} ${selected.args.join(' ')}`);
 
-        const pythonProcess = spawn(selected.cmd, [...selected.args, 'quiz_generator.py'], {
+        // -m loads quiz_generator from its cached bytecode; a script path is recompiled on every run
+        const pythonProcess = spawn(selected.cmd, [...selected.args, '-m', 'quiz_generator'], {
             cwd: require('path').resolve(__dirname, '..', '..')
         });
         let generatedQuiz = '';
@@ -379,6 +380,22 @@ router.post('/generate', authMiddleware, teacherMiddleware, upload.single('file'
     }
 });
 
+// pdf-parse's default page renderer, plus a form feed at the end of the page
+const renderPdfPage = async (pageData) => {
+    const textContent = await pageData.getTextContent({ normalizeWhitespace: false, disableCombineTextItems: false });
+    let lastY;
+    let text = '';
+    for (const item of textContent.items) {
+        if (lastY === item.transform[5] || !lastY) {
+            text += item.str;
+        } else {
+            text += '\n' + item.str;
+        }
+        lastY = item.transform[5];
+    }
+    return text + '\f';
+};
+
 const extractTextFromPdf = async (pdfPath) => {
     try {
         const dataBuffer = fs.readFileSync(pdfPath);
@@ -389,8 +406,9 @@ const extractTextFromPdf = async (pdfPath) => {
             return dataBuffer.toString('utf8');
         }
         
-        // Otherwise, treat as PDF
-        const data = await pdfParse(dataBuffer);
+        // Otherwise, treat as PDF; pages end in a form feed so the
+        // normalizer can tell page breaks from paragraph breaks
+        const data = await pdfParse(dataBuffer, { pagerender: renderPdfPage });
         return data.text;
     } catch (error) {
         console.error('📄 PDF extraction error:', error);
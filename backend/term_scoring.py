@@ -0,0 +1,157 @@
+"""BM25 scoring over a document's sentences for the fallback generator.
+
+The fallback quiz treats every sentence as a tiny document. One regex pass
+over the text builds a sparse sentence-by-term matrix, stored column-wise
+as posting lists (term -> [(sentence, tf), ...]). From it we get:
+
+- ``rank_terms``: which candidate terms are worth a question. Terms that
+  recur but are not everywhere score highest.
+- ``rank_similar``: sentences lexically close to a given sentence, scored
+  with that sentence as a BM25 query. These make plausible distractors.
+
+Only the postings of the query's own terms are touched, so both lookups
+stay proportional to the matching entries rather than the document size.
+Stop words are left out of the matrix entirely.
+"""
+import heapq
+import math
+import re
+from collections import defaultdict
+from itertools import groupby
+
+TOKEN_RE = re.compile(r"[a-z][a-z0-9]+")
+# Tokens plus the NUL used to separate sentences in the joined text
+TOKEN_OR_BREAK_RE = re.compile(r"[a-z][a-z0-9]+|\0")
+
+STOP_WORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have he her his how if in into
+is it its may might more most must no not of on one or our shall she should so some such than that the
+their them then there these they this those through to under up very was we were what when where which
+while who why will with would you your also each other about over after again further only just here
+""".split())
+
+
+class _Postings(dict):
+    """term -> [(sentence, tf), ...], collapsed from raw occurrences on demand."""
+
+    def __init__(self, occurrences):
+        super().__init__()
+        self._occurrences = occurrences
+
+    def __missing__(self, token):
+        ids = self._occurrences.get(token)
+        if ids is None:
+            raise KeyError(token)
+        entries = [(i, sum(1 for _ in group)) for i, group in groupby(ids)]
+        self[token] = entries
+        return entries
+
+    def __contains__(self, token):
+        return token in self._occurrences
+
+    def get(self, token, default=None):
+        return self[token] if token in self._occurrences else default
+
+
+class SentenceTermMatrix:
+    """Sparse sentence-by-term matrix with BM25 weighting."""
+
+    def __init__(self, sentences, k1=1.2, b=0.75):
+        self.sentences = sentences
+        self.k1 = k1
+        self.b = b
+        # Tokenize every sentence with a single findall over the joined text;
+        # each occurrence appends its sentence id, so ids repeat tf times and
+        # are collapsed into (sentence, tf) pairs when a term is first used.
+        occurrences = defaultdict(list)
+        lengths = []
+        sentence = 0
+        length = 0
+        for token in TOKEN_OR_BREAK_RE.findall("\0".join(sentences).lower()):
+            if token == "\0":
+                lengths.append(length)
+                sentence += 1
+                length = 0
+                continue
+            length += 1
+            if token not in STOP_WORDS:
+                occurrences[token].append(sentence)
+        lengths.append(length)
+        self.postings = _Postings(occurrences)
+        self.count = len(sentences)
+        avg_length = (sum(lengths) / self.count) if self.count else 0.0
+        # BM25 length normalization k1 * (1 - b + b * len / avg), per sentence
+        self._norms = [k1 * (1 - b + b * (length / avg_length if avg_length else 1)) for length in lengths]
+        self._idf = {}
+
+    def idf(self, token):
+        value = self._idf.get(token)
+        if value is None:
+            df = len(self.postings.get(token, ()))
+            value = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            self._idf[token] = value
+        return value
+
+    def _tf_weight(self, tf, sentence):
+        return tf * (self.k1 + 1) / (tf + self._norms[sentence])
+
+    def term_postings(self, term):
+        """Postings ``{sentence: tf}`` for a (possibly multi-word) term.
+
+        A multi-word term is approximated by the sentences containing all
+        of its words, with the smallest word frequency as its tf.
+        """
+        words = TOKEN_RE.findall(term.lower())
+        if not words:
+            return {}
+        result = dict(self.postings.get(words[0], ()))
+        for word in words[1:]:
+            other = dict(self.postings.get(word, ()))
+            result = {i: min(tf, other[i]) for i, tf in result.items() if i in other}
+            if not result:
+                break
+        return result
+
+    def term_score(self, term):
+        """Corpus-level salience: idf times the log of the summed BM25 tf
+        weights, so a term cannot win on raw frequency alone."""
+        postings = self.term_postings(term)
+        if not postings:
+            return 0.0
+        df = len(postings)
+        idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+        return idf * math.log1p(sum(self._tf_weight(tf, i) for i, tf in postings.items()))
+
+    def rank_terms(self, candidates, limit=15):
+        """``[(term, score), ...]`` for the best candidates, highest first."""
+        scored = [(term, self.term_score(term)) for term in candidates]
+        scored = [item for item in scored if item[1] > 0]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def rank_similar(self, sentence_index, exclude=(), limit=50, max_df_ratio=0.5, budget=5000):
+        """Indices of up to ``limit`` sentences sharing vocabulary with
+        ``sentence_index``, best BM25 match first.
+
+        ``exclude`` holds sentence indices to leave out. Query terms are
+        applied rarest first, since they carry the most signal. Terms found
+        in more than ``max_df_ratio`` of all sentences are skipped, and
+        scoring stops once ``budget`` posting entries have been visited.
+        """
+        query = {token for token in TOKEN_RE.findall(self.sentences[sentence_index].lower())
+                 if token in self.postings}
+        max_df = max(1, int(self.count * max_df_ratio))
+        k1_plus_1 = self.k1 + 1
+        norms = self._norms
+        scores = {}
+        visited = 0
+        for token in sorted(query, key=lambda t: len(self.postings[t])):
+            postings = self.postings[token]
+            if len(postings) > max_df or visited >= budget:
+                break
+            visited += len(postings)
+            idf = self.idf(token)
+            for i, tf in postings:
+                scores[i] = scores.get(i, 0.0) + idf * tf * k1_plus_1 / (tf + norms[i])
+        scores.pop(sentence_index, None)
+        return heapq.nsmallest(limit, (i for i in scores if i not in exclude), key=lambda i: (-scores[i], i))
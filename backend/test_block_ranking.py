@@ -0,0 +1,33 @@
+"""Blocks are only cut or dropped when the budget is short.
+
+Run with ``python -m pytest test_block_ranking.py``.
+"""
+from block_ranking import select_ranked
+
+PARAGRAPHS = [
+    "Photosynthesis is the process by which green plants convert light energy into chemical energy. "
+    "Chlorophyll in the chloroplasts absorbs red and blue light. Oxygen is released as a byproduct. "
+    "The light reactions take place in the thylakoid membranes.",
+    "Cellular respiration is defined as the breakdown of glucose to release energy. Glycolysis "
+    "happens in the cytoplasm and yields pyruvate. The citric acid cycle runs in the mitochondria. "
+    "Most ATP comes from oxidative phosphorylation.",
+]
+
+
+def test_blocks_that_fit_are_kept_whole():
+    budget = sum(len(p) for p in PARAGRAPHS)
+    assert select_ranked(PARAGRAPHS, budget, max_blocks=10) == PARAGRAPHS
+
+
+def test_short_budget_cuts_the_longest_blocks_to_leading_sentences():
+    budget = sum(len(p) for p in PARAGRAPHS) * 2 // 3
+    selected = select_ranked(PARAGRAPHS, budget, max_blocks=10)
+    assert sum(map(len, selected)) <= budget
+    assert len(selected) == 2
+    for block, paragraph in zip(selected, PARAGRAPHS):
+        assert paragraph.startswith(block)
+
+
+def test_max_blocks_drops_blocks_without_cutting_them():
+    selected = select_ranked(PARAGRAPHS, 10000, max_blocks=1)
+    assert len(selected) == 1 and selected[0] in PARAGRAPHS
@@ -0,0 +1,45 @@
+"""Grading when the jail itself fails.
+
+Run with ``python -m pytest test_code_grader.py``; uses a stand-in sandbox,
+so it runs anywhere.
+"""
+import contextlib
+
+from code_grader import Grader
+from code_sandbox import OK, UNAVAILABLE, Program, RunResult
+
+
+class FlakySandbox:
+    """Runs every program as ``print('hi')``; the first ``failures`` runs
+    fail as if the launcher had died."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.runs = 0
+
+    @contextlib.contextmanager
+    def compile(self, language, source):
+        yield Program(language, None, RunResult(OK))
+
+    def run(self, program, stdin):
+        self.runs += 1
+        if self.runs <= self.failures:
+            return RunResult(UNAVAILABLE, stderr='launcher died')
+        return RunResult(OK, stdout='hi\n')
+
+
+def grade(sandbox):
+    submission = {"id": 1, "language": "python", "code": "print('hi')",
+                  "testCases": [{"stdin": "", "stdout": "hi"}, {"stdin": "", "stdout": "hi"}]}
+    return Grader(sandbox, workers=1).grade(submission)
+
+
+def test_unavailable_run_is_retried():
+    result = grade(FlakySandbox(failures=1))
+    assert result["ok"] and result["verdicts"] == ["pass", "pass"]
+
+
+def test_unavailable_run_fails_the_grading_not_the_submission():
+    result = grade(FlakySandbox(failures=2))
+    assert not result["ok"]
+    assert "verdicts" not in result and "launcher died" in result["error"]
@@ -0,0 +1,119 @@
+"""Escape attempts a submitted program must not get away with.
+
+Run with ``python -m pytest test_code_sandbox.py``; skipped when the host
+cannot set up the jail (no root and no unprivileged user namespaces).
+"""
+import os
+import time
+import uuid
+
+import pytest
+
+from code_sandbox import OK, Sandbox, SandboxLimits
+
+SECRET = 'sandbox-test-' + uuid.uuid4().hex
+
+
+@pytest.fixture(scope='module')
+def sandbox():
+    os.environ['SANDBOX_TEST_SECRET'] = SECRET
+    sandbox = Sandbox(SandboxLimits(wall_seconds=5.0, processes=8), workers=2)
+    if not sandbox.available('python'):
+        pytest.skip("programs cannot be jailed here")
+    yield sandbox
+    os.environ.pop('SANDBOX_TEST_SECRET', None)
+
+
+def run(sandbox, code, stdin=''):
+    with sandbox.compile('python', code) as program:
+        return sandbox.run(program, stdin)
+
+
+def test_service_environment_is_not_readable(sandbox):
+    result = run(sandbox, """
+import glob, os
+print(dict(os.environ))
+for path in glob.glob('/proc/*/environ') + ['/proc/%d/environ' % os.getppid()]:
+    try:
+        print(path, open(path, 'rb').read())
+    except OSError as e:
+        print(path, e, flush=True)
+""")
+    assert result.status == OK
+    assert SECRET not in result.stdout + result.stderr
+
+
+def test_service_processes_are_not_visible(sandbox):
+    result = run(sandbox, "import os\nprint(sorted(int(p) for p in os.listdir('/proc') if p.isdigit()))\n")
+    assert result.status == OK
+    assert str(os.getpid()) not in result.stdout.strip('[]\n').split(', ')
+
+
+def host_processes_named(name):
+    found = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/comm') as f:
+                if f.read().strip() == name:
+                    found.append(pid)
+        except OSError:
+            pass
+    return found
+
+
+def test_detached_child_is_killed(sandbox):
+    name = 'esc' + uuid.uuid4().hex[:8]
+    result = run(sandbox, f"""
+import ctypes, os, time
+if os.fork() == 0:
+    os.setsid()
+    if os.fork() == 0:
+        ctypes.CDLL(None).prctl(15, {name.encode()!r}, 0, 0, 0)
+        time.sleep(30)
+        os._exit(0)
+    os._exit(0)
+time.sleep(0.2)
+print('parent done')
+""")
+    assert result.status == OK
+    time.sleep(0.5)
+    assert host_processes_named(name) == []
+
+
+def test_fork_count_is_capped(sandbox):
+    result = run(sandbox, """
+import os, time
+forks = 0
+try:
+    for _ in range(200):
+        if os.fork() == 0:
+            time.sleep(10)
+            os._exit(0)
+        forks += 1
+except OSError as e:
+    print(forks, e.errno)
+""")
+    assert result.status == OK
+    forks, errno = result.stdout.split()
+    assert int(forks) < sandbox.limits.processes
+    assert errno == '11'
+
+
+def test_no_network(sandbox):
+    result = run(sandbox, """
+import socket
+try:
+    socket.create_connection(('1.1.1.1', 53), timeout=1)
+    print('connected')
+except OSError as e:
+    print('blocked', e.errno)
+""")
+    assert result.status == OK
+    assert result.stdout.startswith('blocked')
+
+
+def test_runs_as_unprivileged_uid(sandbox):
+    result = run(sandbox, "import os\nprint(os.getuid(), os.getgroups())\n")
+    assert result.status == OK
+    uid = int(result.stdout.split()[0])
+    assert uid != 0 and uid >= sandbox.uid
@@ -0,0 +1,63 @@
+"""Near-duplicate filtering keeps distinct questions and stays fast.
+
+Run with ``python -m pytest test_question_dedup.py``.
+"""
+import random
+
+import question_dedup
+from question_dedup import NearDuplicateIndex, dedup_questions
+
+OPTIONS = ["O(n)", "O(n log n)", "O(1)", "O(n^2)"]
+
+
+def question(stem, answer="B", options=OPTIONS):
+    return {"question": stem, "options": list(options), "answer": answer}
+
+
+def test_same_answer_different_subject_is_kept():
+    questions = [question("What is the time complexity of merge sort?"),
+                 question("What is the time complexity of heap sort?")]
+    assert dedup_questions(questions) == questions
+
+
+def test_rewording_is_dropped():
+    first = question("What is the time complexity of merge sort?")
+    questions = [first,
+                 question("What's the time complexity of Merge Sort?"),
+                 question("Which of the following is the time complexity of merge sort?")]
+    assert dedup_questions(questions) == [first]
+
+
+def test_similar_stem_with_different_answer_is_kept():
+    questions = [question("What is the time complexity of binary search?", "B"),
+                 question("What is the time complexity of binary search?", "A")]
+    assert dedup_questions(questions) == questions
+
+
+def test_previous_questions_are_excluded():
+    previous = [question("Which planet is third from the Sun?", "A", ["Earth", "Mars", "Venus", "Jupiter"])]
+    repeat = question("Which planet is the third from the sun?", "A", ["Earth", "Venus", "Mars", "Saturn"])
+    assert dedup_questions([repeat], previous=previous) == []
+
+
+def test_save_and_load(tmp_path):
+    index = NearDuplicateIndex()
+    assert index.add_question(question("What is the time complexity of merge sort?"))
+    path = tmp_path / "index.json"
+    index.save(path)
+    loaded = NearDuplicateIndex.load(path)
+    assert not loaded.add_question(question("What's the time complexity of merge sort?"))
+    assert loaded.add_question(question("What is the time complexity of heap sort?"))
+
+
+def test_templated_stems_are_not_compared_pairwise(monkeypatch):
+    calls = []
+    similarity = question_dedup.similarity
+    monkeypatch.setattr(question_dedup, "similarity", lambda a, b: calls.append(1) or similarity(a, b))
+    rng = random.Random(1)
+    words = [f"term{i}" for i in range(300)]
+    questions = [question("What is the time complexity of %s %s on %s records?" % tuple(rng.sample(words, 3)))
+                 for _ in range(2000)]
+    kept = dedup_questions(questions)
+    assert len(kept) >= 1990
+    assert len(calls) < 20 * len(questions)
@@ -0,0 +1,53 @@
+"""Page furniture is removed at page breaks and nowhere else.
+
+Run with ``python -m pytest test_text_normalizer.py``.
+"""
+from text_normalizer import normalize_text
+
+PARAGRAPHS = [
+    "Cells of the {topic} are the basic unit of its life.",
+    "Mitochondria in the {topic} convert nutrients into energy.",
+    "The membrane controls which molecules enter or leave the {topic}.",
+]
+TOPICS = ["heart", "liver", "lung", "kidney", "brain", "skin", "bone", "muscle", "blood", "stomach",
+          "pancreas", "spleen"]
+
+
+def paginated(pages, separator):
+    """Pages with a running header, three paragraphs and a page number."""
+    return separator.join(
+        "Introduction to Biology - Lecture 4\n\n"
+        + "\n\n".join(paragraph.format(topic=TOPICS[page]) for paragraph in PARAGRAPHS)
+        + f"\n\nPage {page + 1} of {pages}"
+        for page in range(pages))
+
+
+def test_headers_removed_with_several_paragraphs_per_page():
+    for separator in ("\n\x0c", "\n\n\n"):
+        text, normalizer = normalize_text(paginated(len(TOPICS), separator))
+        assert "Introduction to Biology" not in text
+        assert "Page " not in text
+        for page in range(len(TOPICS)):
+            assert PARAGRAPHS[0].format(topic=TOPICS[page]) in text
+        assert normalizer.stats["header_footer_lines"] == 12
+        assert normalizer.stats["page_numbers"] == 12
+
+
+def test_numbers_in_lists_are_kept():
+    text, normalizer = normalize_text("Trial\n1\n2\n3\nScore\n4\n5\n6")
+    assert text.split("\n") == ["Trial", "1", "2", "3", "Score", "4", "5", "6"]
+    assert normalizer.stats["page_numbers"] == 0
+
+
+def test_numbers_in_lists_are_kept_on_paginated_documents():
+    page = "Results of the experiment\n\nTrial\n1\n2\n3\nScore\n4\n5\n6\n\n{n}"
+    text, normalizer = normalize_text("\x0c".join(page.format(n=n) for n in range(1, 5)))
+    assert text.count("Score\n4\n5\n6") == 4
+    assert normalizer.stats["page_numbers"] == 4
+
+
+def test_paragraph_breaks_are_not_pages():
+    repeated = "\n\n".join(["Key idea", "Some explanation of the key idea follows here."] * 6)
+    text, normalizer = normalize_text(repeated)
+    assert text.count("Key idea") == 6
+    assert normalizer.stats["header_footer_lines"] == 0
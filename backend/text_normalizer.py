@@ -0,0 +1,267 @@
+"""Streaming cleanup of extracted document text before it goes into a prompt.
+
+PDF extraction leaves typographic punctuation, odd whitespace, ligatures,
+words hyphenated across line breaks and the page furniture of every page
+(running headers and footers, page numbers). All of it costs prompt tokens
+and none of it helps the model. ``TextNormalizer`` cleans text fed to it
+in chunks:
+
+- one ``str.translate`` pass with a table built at import folds Unicode
+  quotes, dashes, spaces and ligatures to plain equivalents and drops
+  control, zero-width and private-use characters; every other character
+  (accents, math symbols, non-Latin scripts) is kept
+- page breaks are form feeds or runs of ``PAGE_BREAK_BLANKS`` blank
+  lines; a single blank line is only a paragraph break
+- lines at page edges (the first and last ``EDGE_LINES`` lines of a page,
+  and the start and end of the document once it has a page break) that
+  look like page numbers ("12", "- 12 -", "Page 3 of 10") are dropped;
+  numbers anywhere else, in tables or lists, are kept
+- short lines that keep recurring at page edges are treated as running
+  headers or footers and dropped; digits are ignored when comparing, so
+  "Lecture 4 - page 12" matches "... page 13"
+- a word hyphenated at the end of a line is joined with its continuation
+
+Page furniture detection needs to see a page break, and a line recur,
+before it can drop anything, so output lags input by ``window`` lines. ``stats`` reports what was
+removed and the characters and estimated tokens saved.
+"""
+import collections
+import re
+
+from token_budget import estimate_tokens
+
+# Unicode punctuation and whitespace folded to ASCII equivalents
+_FOLD = {
+    '\u2018': "'", '\u2019': "'", '\u201a': "'", '\u201b': "'", '\u2032': "'",
+    '\u201c': '"', '\u201d': '"', '\u201e': '"', '\u201f': '"', '\u2033': '"', '\u00ab': '"', '\u00bb': '"',
+    '\u2010': '-', '\u2011': '-', '\u2012': '-', '\u2013': '-', '\u2014': '-', '\u2015': '-', '\u2212': '-',
+    '\u2026': '...', '\u2022': '-', '\u25aa': '-', '\u25cf': '-', '\u2023': '-', '\u2043': '-',
+    '\ufb00': 'ff', '\ufb01': 'fi', '\ufb02': 'fl', '\ufb03': 'ffi', '\ufb04': 'ffl', '\ufb05': 'st', '\ufb06': 'st',
+    '\t': ' ', '\x0b': '\n', '\x0c': '\n\x0c\n', '\u2028': '\n', '\u2029': '\n\n',
+    '\u00a0': ' ', '\u202f': ' ', '\u205f': ' ', '\u3000': ' ',
+}
+_FOLD.update({chr(c): ' ' for c in range(0x2000, 0x200b)})
+_DROP = ([c for c in range(0x20) if c not in (0x09, 0x0a, 0x0b, 0x0c)]
+         + list(range(0x7f, 0xa0)) + [0xad, 0x200b, 0x200c, 0x200d, 0x2060, 0xfeff])
+TRANSLATION = str.maketrans({**_FOLD, **{chr(c): None for c in _DROP}})
+# Private-use glyphs from embedded PDF fonts; a range too large for the table
+PRIVATE_USE_RE = re.compile('[\ue000-\uf8ff]')
+
+SPACES_RE = re.compile(r' {2,}')
+DIGITS_RE = re.compile(r'\d+')
+LETTER_RE = re.compile(r'[^\W\d_]')
+PAGE_NUMBER_RE = re.compile(r'(?:page|p\.|seite|página|pagina)?\s*-?\s*\d{1,4}\s*-?(?:\s*(?:/|of|de|von)\s*\d{1,4})?',
+                            re.IGNORECASE)
+# A word broken across lines: a letter, then the hyphen at the line end
+HYPHEN_END_RE = re.compile(r'[^\W\d_]-$')
+
+# Blank lines in a row that break a page, as a form feed does
+PAGE_BREAK_BLANKS = 2
+# Header/footer candidates: short lines within this many lines of a page edge
+MAX_BOILERPLATE_CHARS = 80
+EDGE_LINES = 2
+# ... that recur at least this often, and at a share of the page edges seen
+MIN_REPEATS = 3
+MIN_EDGE_SHARE = 0.5
+
+
+class _Line:
+    __slots__ = ('text', 'shape', 'edge')
+
+    def __init__(self, text, shape):
+        self.text = text
+        self.shape = shape
+        self.edge = False
+
+
+class TextNormalizer:
+    """Incremental normalizer: ``feed`` chunks, then ``finish``; each call
+    returns the normalized text that is final so far."""
+
+    def __init__(self, window=256):
+        self.window = window
+        self.stats = {"chars_in": 0, "chars_out": 0, "tokens_in": 0, "tokens_out": 0,
+                      "header_footer_lines": 0, "page_numbers": 0, "hyphenations": 0}
+        self._partial = ''
+        self._pending = collections.deque()
+        self._edge_counts = collections.Counter()
+        self._pages = 1
+        # Lines of the current page so far, blank lines in a row, and
+        # whether a break has ended the page without a line since
+        self._since_break = 0
+        self._blank_run = 0
+        self._at_break = False
+        self._first_lines = []
+        self._last_page_number = None
+        # Output assembly: the last kept line (held back in case it ends in a
+        # hyphen) and whether a blank line is owed before the next one
+        self._held = None
+        self._blank_owed = False
+
+    def feed(self, chunk):
+        self.stats["chars_in"] += len(chunk)
+        self.stats["tokens_in"] += estimate_tokens(chunk)
+        chunk = PRIVATE_USE_RE.sub('', chunk.translate(TRANSLATION))
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        out = []
+        for line in lines:
+            self._push(line, out)
+        return self._emit(out)
+
+    def finish(self):
+        out = []
+        if self._partial:
+            self._push(self._partial, out)
+            self._partial = ''
+        if self._pages > 1:
+            self._mark_edges()
+        while self._pending:
+            self._release(self._pending.popleft(), out)
+        if self._held is not None:
+            out.append(self._held)
+            self._held = None
+        return self._emit(out)
+
+    def normalize(self, text, max_length=None, chunk_size=1 << 14):
+        """Normalize ``text`` in chunks, stopping early once ``max_length``
+        characters of output exist."""
+        parts = []
+        produced = 0
+        for start in range(0, len(text), chunk_size):
+            part = self.feed(text[start:start + chunk_size])
+            parts.append(part)
+            produced += len(part)
+            if max_length is not None and produced >= max_length:
+                break
+        parts.append(self.finish())
+        return "".join(parts)
+
+    @property
+    def chars_saved(self):
+        return self.stats["chars_in"] - self.stats["chars_out"]
+
+    @property
+    def tokens_saved(self):
+        return self.stats["tokens_in"] - self.stats["tokens_out"]
+
+    def _emit(self, out):
+        text = "".join(out)
+        self.stats["chars_out"] += len(text)
+        self.stats["tokens_out"] += estimate_tokens(text) if text else 0
+        return text
+
+    def _push(self, raw, out):
+        if '\x0c' in raw:
+            self._page_break()
+            self._pending.append(_Line('', None))
+        else:
+            text = SPACES_RE.sub(' ', raw).strip()
+            if not text:
+                self._blank_run += 1
+                self._pending.append(_Line('', None))
+            else:
+                if self._blank_run >= PAGE_BREAK_BLANKS:
+                    self._page_break()
+                self._blank_run = 0
+                self._at_break = False
+                shape = None
+                if len(text) <= MAX_BOILERPLATE_CHARS and LETTER_RE.search(text):
+                    shape = DIGITS_RE.sub('#', text.lower())
+                line = _Line(text, shape)
+                self._pending.append(line)
+                if self._since_break < EDGE_LINES:
+                    if self._pages > 1:
+                        self._mark_edge(line)
+                    else:
+                        self._first_lines.append(line)
+                self._since_break += 1
+        while len(self._pending) > self.window:
+            self._release(self._pending.popleft(), out)
+
+    def _page_break(self):
+        if self._at_break or not self._since_break:
+            return
+        if self._pages == 1:
+            # The document has pages after all: its first lines topped one
+            for line in self._first_lines:
+                self._mark_edge(line)
+            self._first_lines = []
+        self._pages += 1
+        self._mark_edges()
+        self._since_break = 0
+        self._blank_run = 0
+        self._at_break = True
+
+    def _mark_edge(self, line):
+        if not line.edge:
+            line.edge = True
+            if line.shape is not None:
+                self._edge_counts[line.shape] += 1
+
+    def _mark_edges(self):
+        """Mark the last lines before a page break (or the end) as edge lines."""
+        marked = 0
+        for line in reversed(self._pending):
+            if not line.text:
+                if marked:
+                    break
+                continue
+            self._mark_edge(line)
+            marked += 1
+            if marked >= EDGE_LINES:
+                break
+
+    def _is_boilerplate(self, line):
+        if line.shape is None or not line.edge:
+            return False
+        repeats = self._edge_counts[line.shape]
+        return repeats >= MIN_REPEATS and repeats >= MIN_EDGE_SHARE * self._pages
+
+    def _is_page_number(self, line):
+        text = line.text
+        if not line.edge or not PAGE_NUMBER_RE.fullmatch(text):
+            return False
+        number = int(DIGITS_RE.search(text).group())
+        if LETTER_RE.search(text) or '-' in text or '/' in text:
+            # Spelled out ("Page 3", "- 3 -", "3 / 10"): always page furniture
+            self._last_page_number = number
+            return True
+        # A bare number only when it continues the page sequence, so numbers
+        # in tables and lists are kept
+        last = self._last_page_number
+        if (last is None and number < 1000) or (last is not None and last < number <= last + 2):
+            self._last_page_number = number
+            return True
+        return False
+
+    def _release(self, line, out):
+        text = line.text
+        if not text:
+            self._blank_owed = self._held is not None
+            return
+        if self._is_page_number(line):
+            self.stats["page_numbers"] += 1
+            return
+        if self._is_boilerplate(line):
+            self.stats["header_footer_lines"] += 1
+            return
+        held = self._held
+        if held is not None and HYPHEN_END_RE.search(held) and text[0].islower():
+            # Blank lines between the halves were a page break; drop them
+            self._held = held[:-1] + text
+            self.stats["hyphenations"] += 1
+            self._blank_owed = False
+            return
+        if held is not None:
+            out.append(held + ("\n\n" if self._blank_owed else "\n"))
+        self._held = text
+        self._blank_owed = False
+
+
+def normalize_text(text, max_length=None):
+    """``(normalized_text, normalizer)`` for a whole string; the normalizer
+    carries the ``stats`` of the run."""
+    normalizer = TextNormalizer()
+    return normalizer.normalize(text, max_length), normalizer
+
@@ -0,0 +1,145 @@
+"""Token estimates and budgets for generation requests.
+
+A fixed ``max_tokens`` of 3000 lets every reply run long, and long
+completions are where generation spends its time and money. This module
+sizes each request instead:
+
+- ``completion_budget``: ``max_tokens`` for a number of questions, with
+  room for code questions when the content looks like programming tasks.
+- ``select_blocks``: the content blocks that fit a prompt token budget,
+  trimming the last one at a sentence boundary.
+- ``record_usage``: compares the estimate with the ``usage`` the API
+  reports, feeds the ratio back into the estimator and counts both in the
+  job metrics, so the estimates stay calibrated.
+
+The estimator needs no tokenizer: words and punctuation marks are counted
+(long words as several tokens) and scaled by a ratio learned from usage.
+"""
+import math
+import re
+import threading
+
+import quiz_logging
+import quiz_metrics
+from quiz_env import env_float, env_int
+
+log = quiz_logging.get_logger('tokens')
+
+PIECE_RE = re.compile(r"\w+|[^\w\s]")
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Completion tokens one question takes in a reply, measured on typical replies
+MCQ_TOKENS = 110
+# Code questions carry a reference solution (about 150 tokens) for checking
+CODE_TOKENS = 530
+# The array brackets and whitespace around the questions
+REPLY_OVERHEAD_TOKENS = 60
+# Headroom over the expected reply, so a slightly long answer is not cut off
+COMPLETION_HEADROOM = 1.25
+MIN_COMPLETION_TOKENS = 256
+MAX_COMPLETION_TOKENS = 3000
+# Per-message framing the chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenEstimator:
+    """Tokenizer-free token counts, calibrated against reported usage."""
+
+    def __init__(self, ratio=1.0, smoothing=0.2):
+        self.ratio = ratio
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def raw_count(text):
+        """Uncalibrated count: one token per punctuation mark or short word,
+        plus one per further 7 characters of a long word."""
+        return sum(1 + len(piece) // 7 for piece in PIECE_RE.findall(text or ''))
+
+    def estimate(self, text):
+        return math.ceil(self.raw_count(text) * self.ratio)
+
+    def observe(self, raw, actual):
+        """Move the ratio towards ``actual / raw`` for one observed request."""
+        if raw <= 0 or actual <= 0:
+            return
+        with self._lock:
+            self.ratio += self.smoothing * (actual / raw - self.ratio)
+
+    @classmethod
+    def from_env(cls):
+        return cls(ratio=env_float('QUIZ_TOKEN_RATIO', 1.0))
+
+
+estimator = TokenEstimator.from_env()
+
+
+def estimate_tokens(text):
+    return estimator.estimate(text)
+
+
+def content_token_budget():
+    """Prompt tokens allowed for the document content (``QUIZ_CONTENT_TOKENS``)."""
+    return env_int('QUIZ_CONTENT_TOKENS', 1200)
+
+
+def completion_budget(question_count, code_questions=0):
+    """``max_tokens`` for a reply of ``question_count`` questions, of which
+    ``code_questions`` are expected to be code questions."""
+    code_questions = min(code_questions, question_count)
+    expected = ((question_count - code_questions) * MCQ_TOKENS + code_questions * CODE_TOKENS
+                + REPLY_OVERHEAD_TOKENS)
+    return max(MIN_COMPLETION_TOKENS, min(MAX_COMPLETION_TOKENS, math.ceil(expected * COMPLETION_HEADROOM)))
+
+
+def select_blocks(blocks, budget):
+    """The leading ``blocks`` that fit in ``budget`` tokens.
+
+    The first block that does not fit is cut at the last sentence boundary
+    that fits, as long as at least one sentence does.
+    """
+    selected = []
+    remaining = budget
+    for block in blocks:
+        cost = estimate_tokens(block)
+        if cost <= remaining:
+            selected.append(block)
+            remaining -= cost
+            continue
+        kept = []
+        for sentence in SENTENCE_END_RE.split(block):
+            cost = estimate_tokens(sentence)
+            if cost > remaining:
+                break
+            kept.append(sentence)
+            remaining -= cost
+        if kept:
+            selected.append(" ".join(kept))
+        break
+    return selected
+
+
+def prompt_tokens(payload):
+    """Raw (uncalibrated) token count of a payload's messages."""
+    return sum(TokenEstimator.raw_count(message.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+               for message in payload.get('messages', []))
+
+
+def record_usage(payload, usage, finish_reason=None):
+    """Compare a request's estimates with the ``usage`` the API reported."""
+    if finish_reason == 'length':
+        quiz_metrics.incr("completion_truncated")
+    if not isinstance(usage, dict):
+        return
+    raw = prompt_tokens(payload)
+    estimated = math.ceil(raw * estimator.ratio)
+    actual_prompt = usage.get('prompt_tokens') or 0
+    actual_completion = usage.get('completion_tokens') or 0
+    budget = payload.get('max_tokens') or 0
+    quiz_metrics.incr("tokens_prompt_estimated", estimated)
+    quiz_metrics.incr("tokens_prompt", actual_prompt)
+    quiz_metrics.incr("tokens_completion_budget", budget)
+    quiz_metrics.incr("tokens_completion", actual_completion)
+    estimator.observe(raw, actual_prompt)
+    log.debug("🧮 Tokens: prompt %d (estimated %d), completion %d of max_tokens %d, ratio now %.3f",
+              actual_prompt, estimated, actual_completion, budget, estimator.ratio)